@@ -1,11 +1,16 @@
 import streamlit as st
 from PIL import Image
 
+from lastmile import warmup
+from lastmile.widgets import warmup_status
+
 st.set_page_config(
     page_title="Last Mile - Renner",
     page_icon="chart_with_upwards_trend",
     layout="wide",
 )
+# Carrega a base e monta as visões padrão em segundo plano
+warmup_status(warmup.start())
 
 st.markdown(
     """# Operação Last-Mile - **:red[Renner SA]**
@@ -0,0 +1,29 @@
+"""Camada de dados da operação last-mile usada pelas páginas do app."""
+
+import pandas as pd
+
+# Projeções e drop() viram visões da base em vez de cópias; dados só são
+# copiados quando alguém escreve neles
+pd.options.mode.copy_on_write = True
+
+from lastmile.loader import (
+    COLUMNS,
+    DATA_PATH,
+    dataset_version,
+    load_deliveries,
+    parse_deliveries,
+    read_csv,
+)
+from lastmile.store import STORE_PATH, load_partitions, write_partitions
+
+__all__ = [
+    "COLUMNS",
+    "DATA_PATH",
+    "STORE_PATH",
+    "dataset_version",
+    "load_deliveries",
+    "load_partitions",
+    "parse_deliveries",
+    "read_csv",
+    "write_partitions",
+]
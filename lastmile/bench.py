@@ -0,0 +1,407 @@
+"""Benchmarks das etapas das páginas sobre bases sintéticas.
+
+Cada caso mede uma etapa que as páginas executam sem cache: leitura e
+tipagem do CSV (``get_data``), cada tipo de filtro de ``filter_dataframe``,
+as tabelas Top-N de ``1_Sobre_os_dados.py``, as perguntas 1 a 4 de
+``3_Propostas.py`` e a montagem e a serialização em JSON das figuras Plotly
+de ``2_Gráficos.py`` e ``3_Propostas.py`` (as de ``lastmile.figures`` pelo
+caminho da página, com os caches de ``lastmile.widgets`` já aquecidos). Os casos rodam em bases
+sintéticas de vários tamanhos (``lastmile.synthetic``, geradas uma vez em
+``data/sintetico/bench-<linhas>/``); de cada um saem o menor tempo entre as
+repetições e o pico de memória alocada (``tracemalloc``, em uma execução à
+parte).
+
+Os resultados são comparados com ``benchmarks/baseline.json``: tempos ou
+picos acima da tolerância são marcados como regressão e o comando sai com
+código 1. ``--salvar`` grava a execução atual como nova referência. Uso::
+
+    python -m lastmile.bench [--linhas 10000 100000 1000000] [--casos filtro] [--salvar]
+"""
+
+import argparse
+import datetime as dt
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+from lastmile import figures, synthetic
+from lastmile.bitmap import build_bitmap_index
+from lastmile.charts import box_figure, heatmap_cells, heatmap_figure
+from lastmile.cube import build_cube, rollup
+from lastmile.filters import apply_filters, column_stats
+from lastmile.loader import read_csv, write_atomic
+from lastmile.quantiles import build_sketches, sketch_box_stats
+from lastmile.routes import route_quality, routes_of, split_routes, top_n
+
+BASELINE_PATH = Path("benchmarks/baseline.json")
+SIZES = [10_000, 100_000, 1_000_000]
+# Tempo mínimo gasto em repetições de cada caso, e máximo de repetições
+MIN_SECONDS = 1.0
+MAX_REPEATS = 20
+# Folgas sobre a referência antes de marcar regressão; diferenças abaixo dos
+# pisos são ruído de medição
+TIME_TOLERANCE = 0.5
+MEMORY_TOLERANCE = 0.10
+TIME_FLOOR = 0.005
+MEMORY_FLOOR = 2**20
+
+CASES = {}
+
+
+def case(name: str):
+    """
+    Registers a benchmark case
+
+    The decorated function receives the dataset context (``_context``) and
+    does its setup, which is not measured, then returns the function whose
+    call is measured.
+    """
+
+    def register(setup):
+        CASES[name] = setup
+        return setup
+
+    return register
+
+
+def dataset(rows: int, seed: int = 0) -> Path:
+    """Synthetic CSV with ``rows`` deliveries, generated on first use"""
+    path = synthetic.SYNTHETIC_PATH / f"bench-{rows}" / synthetic.CSV_NAME
+    if not path.exists():
+        days = max(rows // 10_000, 30)
+        synthetic.generate(rows, path.parent, days, formats=("csv",), seed=seed)
+    return path
+
+
+def _context(path: Path) -> dict:
+    df = read_csv(path)
+    cep = tuple(df["cep"].cat.categories[:3])
+    day = df["data_entrega"].min().date()
+    # Mesmas linhas com versão, como saem de ``get_data``: as figuras das
+    # páginas passam pelos caches de ``lastmile.widgets``
+    page = df.copy(deep=False)
+    page.attrs["version"] = f"bench:{path}"
+    return {
+        "path": path,
+        "df": df,
+        "pagina": page,
+        "index": build_bitmap_index(df),
+        "filtros": {
+            "cep": (("cep", "isin", cep),),
+            "transportadora": (("transportadora", "isin", ("Transportadora A",)),),
+            "distância": (("distancia", "between", (0.5, 12.0)),),
+            "período": (
+                ("data_entrega", "between", (day, day + dt.timedelta(days=6))),
+            ),
+            "remessa": (("remessa", "contains", "11"),),
+        },
+    }
+
+
+@case("carga: leitura e tipagem do csv")
+def _load(ctx):
+    return lambda: read_csv(ctx["path"])
+
+
+@case("filtro: estatísticas das colunas")
+def _column_stats(ctx):
+    df = ctx["df"].drop(columns="sq_plan")
+    return lambda: column_stats(df)
+
+
+def _filter_case(label):
+    @case(f"filtro: {label}")
+    def run(ctx):
+        spec = ctx["filtros"][label]
+        return lambda: apply_filters(ctx["df"], spec, ctx["index"])
+
+
+for _label in ("cep", "transportadora", "distância", "período", "remessa"):
+    _filter_case(_label)
+
+
+@case("top-n: tabela de rotas")
+def _routes(ctx):
+    df = ctx["df"]
+    return lambda: routes_of(split_routes(df)[0], df["codigo_rota"])
+
+
+@case("top-n: rotas mais longas")
+def _top_routes(ctx):
+    rotas = split_routes(ctx["df"])[0]
+    return lambda: rotas.nlargest(10, "distancia_rota")[
+        ["codigo_rota", "distancia_rota"]
+    ]
+
+
+@case("top-n: entregas")
+def _top_deliveries(ctx):
+    df = ctx["df"]
+    columns = ["codigo_rota", "cep", "remessa", "horas_entrega"]
+    return lambda: (
+        top_n(df, "distancia", 10, ["codigo_rota", "cep", "distancia"]),
+        top_n(df, "horas_entrega", 10, columns),
+    )
+
+
+@case("q1: qualidade das rotas")
+def _q1(ctx):
+    return lambda: route_quality(ctx["df"])
+
+
+@case("q2: entregas por cep e dia")
+def _q2(ctx):
+    return lambda: rollup(build_cube(ctx["df"]), ["dia", "cep"])
+
+
+@case("q3: sketches de quantis")
+def _q3_sketches(ctx):
+    return lambda: build_sketches(ctx["df"])
+
+
+@case("q3: caixas por dia")
+def _q3_box(ctx):
+    sketches = build_sketches(ctx["df"])
+    return lambda: sketch_box_stats(sketches, "dia", "horas_entrega")
+
+
+@case("q4: células do heatmap")
+def _q4(ctx):
+    return lambda: heatmap_cells(ctx["df"], "cep", "distancia_rota", "horas_entrega")
+
+
+def _fig_entregas_cep(ctx):
+    dfg = rollup(build_cube(ctx["df"]), "cep")[["delivered"]]
+    return lambda: px.bar(dfg, x=dfg.index, y="delivered", barmode="group")
+
+
+def _page_figure(build, *args):
+    # Caminho da página com os caches já aquecidos, como em um rerun
+    def setup(ctx):
+        build(ctx["pagina"], (), *args)
+        return lambda: build(ctx["pagina"], (), *args)
+
+    return setup
+
+
+def _fig_entregas_dia(ctx):
+    dfdia = rollup(build_cube(ctx["df"]), "dia")[["delivered"]].reset_index()
+    return lambda: px.bar(dfdia, x="dia", y="delivered")
+
+
+def _fig_q1(ctx):
+    dfq1 = route_quality(ctx["df"])
+    planejadas = int(dfq1["sequencia_planejada"].sum())
+    values = [planejadas, len(dfq1) - planejadas]
+    return lambda: px.pie(values=values, names=["planejada", "com variação"])
+
+
+def _fig_q2(ctx):
+    dfq2 = rollup(build_cube(ctx["df"]), ["dia", "cep"])[["delivered"]].reset_index()
+    dfq2["cep"] = dfq2["cep"].astype(str)
+    return lambda: px.bar(dfq2, x="dia", y="delivered", color="cep", barmode="group")
+
+
+def _fig_q3(ctx):
+    stats = sketch_box_stats(build_sketches(ctx["df"]), "dia", "horas_entrega")
+    return lambda: box_figure(stats, pd.DataFrame(), "dia", "horas_entrega")
+
+
+def _fig_q4(ctx):
+    cells = heatmap_cells(ctx["df"], "cep", "distancia_rota", "horas_entrega")
+    return lambda: heatmap_figure(cells)
+
+
+FIGURES = {
+    "entregas por cep": _fig_entregas_cep,
+    "média de horas por cep": _page_figure(figures.media_horas_cep),
+    "correlação": _page_figure(figures.correlacao, "pearson"),
+    "entregas por dia": _fig_entregas_dia,
+    "q1": _fig_q1,
+    "q2": _fig_q2,
+    "q3": _fig_q3,
+    "q4": _fig_q4,
+}
+
+
+def _figure_cases(label, build):
+    @case(f"figura {label}: montagem")
+    def assemble(ctx):
+        return build(ctx)
+
+    @case(f"figura {label}: json")
+    def serialize(ctx):
+        fig = build(ctx)()
+        return fig.to_json
+
+
+for _label, _build in FIGURES.items():
+    _figure_cases(_label, _build)
+
+
+def measure(run) -> dict:
+    """
+    Times ``run`` and measures its peak allocation
+
+    ``run`` is repeated until ``MIN_SECONDS`` (at most ``MAX_REPEATS``
+    times); the peak comes from one more call traced by ``tracemalloc``.
+
+    Returns:
+        dict: ``segundos`` (fastest call), ``mediana``, ``repeticoes`` and
+        ``pico_mb``
+    """
+    times = []
+    while not times or (sum(times) < MIN_SECONDS and len(times) < MAX_REPEATS):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        "segundos": min(times),
+        "mediana": statistics.median(times),
+        "repeticoes": len(times),
+        "pico_mb": peak / 2**20,
+    }
+
+
+def run_benchmarks(sizes=SIZES, selected=None) -> dict:
+    """
+    Runs the registered cases (names containing any of ``selected``) on a
+    synthetic dataset of each size
+
+    Returns:
+        dict: Measurements keyed by ``"<case> @ <rows>"``
+    """
+    results = {}
+    for rows in sizes:
+        ctx = _context(dataset(rows))
+        for name, setup in CASES.items():
+            if selected and not any(s in name for s in selected):
+                continue
+            results[f"{name} @ {rows}"] = measure(setup(ctx))
+        del ctx
+    return results
+
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "processador": platform.processor() or platform.machine(),
+    }
+
+
+def compare(
+    results: dict,
+    baseline: dict,
+    time_tolerance: float = TIME_TOLERANCE,
+    memory_tolerance: float = MEMORY_TOLERANCE,
+) -> list:
+    """
+    Marks measurements above the baseline by more than the tolerances
+    (fractions of the reference value)
+
+    Returns:
+        list: ``(key, result, reference, flags)`` for every key in
+        ``results``; ``reference`` is ``None`` for new cases and ``flags``
+        lists ``"tempo"`` and/or ``"memória"`` regressions
+    """
+    rows = []
+    for key, result in results.items():
+        ref = baseline.get(key)
+        flags = []
+        if ref is not None:
+            slower = result["segundos"] - ref["segundos"]
+            if slower > max(ref["segundos"] * time_tolerance, TIME_FLOOR):
+                flags.append("tempo")
+            grown = (result["pico_mb"] - ref["pico_mb"]) * 2**20
+            if grown > max(ref["pico_mb"] * 2**20 * memory_tolerance, MEMORY_FLOOR):
+                flags.append("memória")
+        rows.append((key, result, ref, flags))
+    return rows
+
+
+def read_baseline(path=BASELINE_PATH) -> dict:
+    path = Path(path)
+    if not path.exists():
+        return {"maquina": None, "casos": {}}
+    return json.loads(path.read_text())
+
+
+def write_baseline(results: dict, path=BASELINE_PATH) -> None:
+    """Merges ``results`` into the baseline file (other cases are kept)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    baseline = read_baseline(path)
+    cases = {**baseline["casos"], **results}
+    payload = {"maquina": machine(), "casos": dict(sorted(cases.items()))}
+    write_atomic(
+        path,
+        lambda tmp: tmp.write_text(json.dumps(payload, indent=2, ensure_ascii=False)),
+    )
+
+
+def _ratio(value: float, ref) -> str:
+    return f"{value / ref:6.2f}x" if ref else "   nova"
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Mede tempo e memória das etapas das páginas"
+    )
+    parser.add_argument("--linhas", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--casos", nargs="+", default=None)
+    parser.add_argument("--referencia", default=str(BASELINE_PATH))
+    parser.add_argument("--tolerancia-tempo", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--tolerancia-memoria", type=float, default=MEMORY_TOLERANCE)
+    parser.add_argument("--salvar", action="store_true")
+    parser.add_argument("--saida", default=None)
+    args = parser.parse_args(argv)
+
+    baseline = read_baseline(args.referencia)
+    if baseline["maquina"] not in (None, machine()):
+        print("aviso: referência gravada em outro ambiente:", baseline["maquina"])
+    results = run_benchmarks(args.linhas, args.casos)
+
+    width = max(map(len, results))
+    print(f"{'caso':>{width}}  {'tempo':>9} {'vs ref':>7}  {'pico':>9} {'vs ref':>7}")
+    regressions = 0
+    for key, result, ref, flags in compare(
+        results, baseline["casos"], args.tolerancia_tempo, args.tolerancia_memoria
+    ):
+        regressions += bool(flags)
+        print(
+            f"{key:>{width}}  {result['segundos']:8.4f}s "
+            f"{_ratio(result['segundos'], ref and ref['segundos'])}  "
+            f"{result['pico_mb']:7.1f}MB "
+            f"{_ratio(result['pico_mb'], ref and ref['pico_mb'])}"
+            + (f"  REGRESSÃO ({', '.join(flags)})" if flags else "")
+        )
+
+    if args.saida:
+        Path(args.saida).write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    if args.salvar:
+        write_baseline(results, args.referencia)
+        print(f"referência gravada em {args.referencia}")
+    elif regressions:
+        print(f"{regressions} regressões em relação a {args.referencia}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Índices bitmap para as colunas categóricas de baixa cardinalidade.
+
+Para cada valor de ``cep``, ``transportadora``, ``veiculo``, ``codigo_rota`` e
+``sq_plan`` o índice guarda o conjunto de linhas em que ele ocorre, no estilo
+dos containers do Roaring Bitmap: valores densos viram um bitset empacotado
+(``np.packbits``, 1 bit por linha) e valores esparsos viram um array ordenado
+de posições (``uint32``), o que for menor.
+
+Um filtro ``isin`` vira o OR dos conjuntos dos valores selecionados e vários
+filtros categóricos viram o AND dos bitsets resultantes. O custo depende da
+quantidade de valores selecionados, não da quantidade de linhas.
+"""
+
+import numpy as np
+import pandas as pd
+
+INDEXED_COLUMNS = ["cep", "transportadora", "veiculo", "codigo_rota", "sq_plan"]
+
+# Abaixo de 1 linha a cada 32 um array de posições ocupa menos que o bitset
+SPARSE_RATIO = 32
+
+
+def _nbytes(n_rows: int) -> int:
+    return (n_rows + 7) // 8
+
+
+def _codes(series: pd.Series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes, pd.Index(uniques)
+
+
+def _set_bits(bits: np.ndarray, rows: np.ndarray) -> None:
+    # Mesma ordem de bits de np.packbits (big-endian dentro do byte)
+    np.bitwise_or.at(bits, rows >> 3, (128 >> (rows & 7)).astype(np.uint8))
+
+
+def build_column_index(series: pd.Series) -> dict:
+    """
+    Builds the bitmap index of one column
+
+    Args:
+        series (pd.Series): Categorical or low-cardinality column
+
+    Returns:
+        dict: ``{"n_rows", "values", "containers", "missing"}``, where
+        ``containers[i]`` is either a packed ``uint8`` bitset or a sorted
+        ``uint32`` row array for ``values[i]`` and ``missing`` holds the rows
+        without a value
+    """
+    n_rows = len(series)
+    codes, values = _codes(series)
+
+    # Linhas agrupadas por código em uma única ordenação estável
+    order = np.argsort(codes, kind="stable").astype(np.uint32)
+    counts = np.bincount(codes[codes >= 0], minlength=len(values))
+    starts = np.searchsorted(codes[order], np.arange(len(values)))
+
+    containers = []
+    for code, count in enumerate(counts):
+        rows = order[starts[code] : starts[code] + count]
+        if count * SPARSE_RATIO < n_rows:
+            containers.append(rows)
+        else:
+            bits = np.zeros(_nbytes(n_rows), dtype=np.uint8)
+            _set_bits(bits, rows.astype(np.int64))
+            containers.append(bits)
+
+    return {
+        "n_rows": n_rows,
+        "values": values,
+        "containers": containers,
+        "missing": order[: n_rows - counts.sum()],
+    }
+
+
+def build_bitmap_index(df: pd.DataFrame, columns=INDEXED_COLUMNS) -> dict:
+    """
+    Builds bitmap indexes for the given columns of ``df``
+
+    Returns:
+        dict: ``{column: column_index}`` for the columns present in ``df``
+    """
+    return {col: build_column_index(df[col]) for col in columns if col in df}
+
+
+def index_nbytes(index: dict) -> int:
+    """Memory used by the containers of a bitmap index"""
+    return sum(
+        c.nbytes
+        for entry in index.values()
+        for c in [*entry["containers"], entry["missing"]]
+    )
+
+
+def _positions(values: pd.Index, selected) -> np.ndarray:
+    positions = values.get_indexer(pd.Index(list(selected), dtype=values.dtype))
+    return positions[positions >= 0]
+
+
+def _union(entry: dict, positions) -> np.ndarray:
+    bits = np.zeros(_nbytes(entry["n_rows"]), dtype=np.uint8)
+    for pos in positions:
+        container = entry["containers"][pos]
+        if container.dtype == np.uint8:
+            bits |= container
+        else:
+            _set_bits(bits, container.astype(np.int64))
+    return bits
+
+
+def select_bits(entry: dict, selected) -> np.ndarray:
+    """
+    Returns the packed bitset of the rows whose value is in ``selected``
+
+    When more than half of the values are selected the complement is cheaper,
+    so the unselected values are combined and the result inverted.
+    """
+    positions = _positions(entry["values"], selected)
+    n_values = len(entry["values"])
+    if len(positions) * 2 <= n_values:
+        return _union(entry, positions)
+
+    others = np.setdiff1d(np.arange(n_values), positions)
+    bits = ~_union(entry, others)
+    # Linhas sem valor (NaN) não pertencem a nenhuma categoria
+    if len(entry["missing"]):
+        missing = np.zeros_like(bits)
+        _set_bits(missing, entry["missing"].astype(np.int64))
+        bits &= ~missing
+    return bits
+
+
+def isin_bits(index: dict, conditions) -> np.ndarray:
+    """
+    ANDs the bitsets of several ``(column, values)`` selections
+
+    Args:
+        index (dict): Output of ``build_bitmap_index``
+        conditions: Iterable of ``(column, selected_values)``
+
+    Returns:
+        np.ndarray: Packed bitset of the matching rows
+    """
+    bits = None
+    for column, selected in conditions:
+        column_bits = select_bits(index[column], selected)
+        bits = column_bits if bits is None else bits & column_bits
+    return bits
+
+
+def bits_to_mask(bits: np.ndarray, n_rows: int) -> np.ndarray:
+    """Unpacks a bitset into a boolean mask of ``n_rows`` entries"""
+    return np.unpackbits(bits, count=n_rows).astype(bool)
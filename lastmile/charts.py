@@ -0,0 +1,253 @@
+"""Gráficos montados a partir de agregados calculados no servidor.
+
+Em vez de entregar as linhas ao Plotly (que serializa tudo para o navegador e
+faz o binning no cliente), as funções deste módulo calculam no servidor os
+bins, as estatísticas de box plot e as células de heatmap. O tamanho do
+gráfico depende da quantidade de grupos/bins, não da quantidade de linhas.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+# Outliers desenhados por caixa; acima disso ficam os mais extremos
+MAX_OUTLIERS = 100
+HEATMAP_BINS = 20
+
+
+def box_stats(df: pd.DataFrame, by: str, value: str) -> tuple:
+    """
+    Computes box plot statistics of ``value`` for each group of ``by``
+
+    Follows Plotly's defaults: linear quartiles and whiskers at the most
+    extreme values within 1.5 IQR of the box.
+
+    Returns:
+        tuple: Statistics (``q1``, ``median``, ``q3``, ``lowerfence``,
+        ``upperfence``, ``mean`` and ``n`` indexed by ``by``) and the outlier
+        rows, at most ``MAX_OUTLIERS`` per group
+    """
+    data = df[[by, value]].dropna()
+    grouped = data.groupby(by, observed=True, sort=True)[value]
+    stats = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    stats.columns = ["q1", "median", "q3"]
+    stats["mean"] = grouped.mean()
+    stats["n"] = grouped.size()
+
+    iqr = stats["q3"] - stats["q1"]
+    low = data[by].map(stats["q1"] - 1.5 * iqr).to_numpy(dtype=float)
+    high = data[by].map(stats["q3"] + 1.5 * iqr).to_numpy(dtype=float)
+    values = data[value].to_numpy(dtype=float)
+    inside = (values >= low) & (values <= high)
+    within = data[inside].groupby(by, observed=True)[value]
+    stats["lowerfence"] = within.min()
+    stats["upperfence"] = within.max()
+    return stats, _outliers(data[~inside], by, value, stats["median"])
+
+
+def _outliers(data: pd.DataFrame, by: str, value: str, median: pd.Series):
+    # Mantém os pontos mais distantes da mediana de cada grupo
+    distance = (data[value] - data[by].map(median).astype(float)).abs()
+    ranked = distance.groupby(data[by], observed=True).rank(
+        method="first", ascending=False
+    )
+    return data[ranked.to_numpy() <= MAX_OUTLIERS]
+
+
+def box_figure(stats: pd.DataFrame, outliers: pd.DataFrame, by, value, labels=None):
+    """
+    Builds a box plot from ``box_stats`` output
+
+    Args:
+        stats (pd.DataFrame): Statistics returned by ``box_stats``
+        outliers (pd.DataFrame): Outlier rows returned by ``box_stats``
+        by (str): Group column (x axis)
+        value (str): Value column (y axis)
+        labels (dict): Axis titles, as in ``plotly.express``
+
+    Returns:
+        go.Figure: One precomputed box trace plus the outlier markers
+    """
+    labels = labels or {}
+    x = [str(v) for v in stats.index]
+    fig = go.Figure(
+        go.Box(
+            x=x,
+            q1=stats["q1"],
+            median=stats["median"],
+            q3=stats["q3"],
+            lowerfence=stats["lowerfence"],
+            upperfence=stats["upperfence"],
+            mean=stats["mean"],
+            name=labels.get(value, value),
+            marker_color=px.colors.qualitative.Plotly[0],
+            boxpoints=False,
+        )
+    )
+    if len(outliers):
+        fig.add_trace(
+            go.Scatter(
+                x=outliers[by].astype(str),
+                y=outliers[value],
+                mode="markers",
+                marker=dict(color=px.colors.qualitative.Plotly[0], size=4),
+                name="outliers",
+            )
+        )
+    fig.update_layout(
+        showlegend=False,
+        xaxis_title=labels.get(by, by),
+        yaxis_title=labels.get(value, value),
+    )
+    return fig
+
+
+def add_quantile_lines(fig, stats: pd.DataFrame, columns=("p90", "p99")):
+    """
+    Draws quantile columns of ``stats`` (e.g. SLA percentiles) over a box plot
+
+    Args:
+        fig (go.Figure): Output of ``box_figure`` built from the same ``stats``
+        stats (pd.DataFrame): Statistics indexed by the box groups
+        columns (tuple): Columns of ``stats`` drawn as one line each
+
+    Returns:
+        go.Figure: ``fig``, with the legend shown for the new lines
+    """
+    x = [str(v) for v in stats.index]
+    colors = px.colors.qualitative.Plotly[1:]
+    for column, color in zip(columns, colors):
+        fig.add_trace(
+            go.Scatter(
+                x=x,
+                y=stats[column],
+                mode="lines+markers",
+                line=dict(color=color, dash="dash", width=1),
+                marker=dict(color=color, size=5),
+                name=column,
+            )
+        )
+    fig.update_layout(showlegend=True)
+    return fig
+
+
+def nice_edges(lo: float, hi: float, nbins: int) -> np.ndarray:
+    """About ``nbins`` bin edges over ``[lo, hi]`` on a round step (1, 2, 2.5, 5)"""
+    if not np.isfinite(lo) or not np.isfinite(hi):
+        return np.array([0.0, 1.0])
+    if hi <= lo:
+        return np.array([lo - 0.5, lo + 0.5])
+    raw = (hi - lo) / nbins
+    magnitude = 10 ** np.floor(np.log10(raw))
+    step = min(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw)
+    start = np.floor(lo / step) * step
+    stop = np.floor(hi / step) * step + step
+    return np.arange(start, stop + step / 2, step)
+
+
+def heatmap_cells(
+    df: pd.DataFrame, x: str, y: str, z: str, nbins: int = HEATMAP_BINS
+) -> pd.DataFrame:
+    """
+    Averages ``z`` over categorical ``x`` and ``nbins`` equal-width bins of ``y``
+
+    Returns:
+        pd.DataFrame: Matrix of averages (rows: ``y`` bin centers, columns:
+        ``x`` values); empty cells are NaN
+    """
+    xcodes, xvalues = pd.factorize(df[x], sort=True)
+    yvalues = df[y].to_numpy(dtype=float)
+    zvalues = df[z].to_numpy(dtype=float)
+    valid = (xcodes >= 0) & ~np.isnan(yvalues) & ~np.isnan(zvalues)
+    if not valid.any():
+        return pd.DataFrame()
+    return _binned_average(
+        xcodes[valid],
+        xvalues,
+        yvalues[valid],
+        zvalues[valid],
+        np.ones(int(valid.sum())),
+        x,
+        y,
+        nbins,
+    )
+
+
+def heatmap_sums(df: pd.DataFrame, x: str, y: str, z: str) -> pd.DataFrame:
+    """
+    Sum and count of ``z`` for each distinct (``x``, ``y``) pair
+
+    Sums of disjoint sets of rows add up, so the heatmap of the whole data can
+    be built from the sums of its parts with ``heatmap_from_sums``.
+
+    Returns:
+        pd.DataFrame: ``x`` (as text), ``y``, ``soma`` and ``n``
+    """
+    data = df[[x, y, z]].dropna()
+    sums = data.groupby([data[x].astype(str), y], sort=True)[z].agg(["sum", "count"])
+    return sums.set_axis(["soma", "n"], axis=1).reset_index()
+
+
+def heatmap_from_sums(
+    sums: pd.DataFrame, x: str, y: str, nbins: int = HEATMAP_BINS
+) -> pd.DataFrame:
+    """Same output as ``heatmap_cells`` from (merged) ``heatmap_sums`` output"""
+    if sums.empty:
+        return pd.DataFrame()
+    xcodes, xvalues = pd.factorize(sums[x], sort=True)
+    return _binned_average(
+        xcodes,
+        xvalues,
+        sums[y].to_numpy(dtype=float),
+        sums["soma"].to_numpy(dtype=float),
+        sums["n"].to_numpy(dtype=float),
+        x,
+        y,
+        nbins,
+    )
+
+
+def _binned_average(xcodes, xvalues, yvalues, zsum, count, x, y, nbins):
+    edges = nice_edges(yvalues.min(), yvalues.max(), nbins)
+    ybins = np.searchsorted(edges, yvalues, side="right") - 1
+    ybins = np.clip(ybins, 0, len(edges) - 2)
+    ny = len(edges) - 1
+    cell = ybins * len(xvalues) + xcodes
+    total = np.bincount(cell, weights=zsum, minlength=ny * len(xvalues))
+    count = np.bincount(cell, weights=count, minlength=ny * len(xvalues))
+    with np.errstate(invalid="ignore"):
+        avg = (total / count).reshape(ny, len(xvalues))
+
+    centers = (edges[:-1] + edges[1:]) / 2
+    cells = pd.DataFrame(avg, index=centers, columns=[str(v) for v in xvalues])
+    cells.index.name = y
+    cells.columns.name = x
+    return cells
+
+
+def heatmap_figure(
+    cells: pd.DataFrame, labels=None, color_scale="Electric", z_title=None
+):
+    """Builds a heatmap from ``heatmap_cells`` output"""
+    labels = labels or {}
+    fig = go.Figure(
+        go.Heatmap(
+            x=list(cells.columns),
+            y=cells.index,
+            z=cells.to_numpy(),
+            colorscale=color_scale,
+            hoverongaps=False,
+            colorbar=dict(title=z_title),
+        )
+    )
+    fig.update_layout(
+        xaxis_title=labels.get(cells.columns.name, cells.columns.name),
+        yaxis_title=labels.get(cells.index.name, cells.index.name),
+    )
+    return fig
+
+
+def figure_nbytes(fig) -> int:
+    """Size of the JSON sent to the browser for ``fig``"""
+    return len(fig.to_json())
@@ -0,0 +1,198 @@
+"""Representação compacta da base de entregas para os caches do servidor.
+
+No modo compacto cada coluna usa o menor tipo que a representa:
+
+- ``cep`` e ``codigo_rota`` como inteiros (``uint16``), ``sq_plan`` e
+  ``delivered`` como inteiros pequenos;
+- ``remessa`` (``NNNNN-NNNNN``) empacotada em um ``uint64`` (parte antes do
+  hífen nos 32 bits altos) e formatada de volta só quando necessário;
+- distâncias e horas em ``float32``;
+- datas em segundos desde a época (``int64``; ``NAT_SECONDS`` para vazias);
+- ``transportadora`` e ``veiculo`` como categorias.
+
+``expand_deliveries`` reconstrói o layout tipado de ``loader.COLUMNS`` que as
+páginas usam. Horas voltam exatas (o loader arredonda para 2 casas) e
+distâncias são arredondadas para ``DISTANCE_DECIMALS`` casas. Uso::
+
+    python -m lastmile.compact [dados.csv]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from lastmile.loader import COLUMNS, DATA_PATH, load_deliveries
+
+NAT_SECONDS = np.iinfo(np.int64).min
+TIMESTAMP_COLUMNS = ["rota_inicio", "rota_final", "data_entrega"]
+HOUR_COLUMNS = ["horas_rota", "horas_entrega"]
+DISTANCE_COLUMNS = ["distancia", "distancia_rota"]
+DISTANCE_DECIMALS = 3
+INTEGER_CODES = {"codigo_rota": np.uint16, "cep": np.uint16}
+REMESSA_PATTERN = r"(\d{1,9})-(\d{1,9})"
+
+
+def _smallest_int(values: np.ndarray):
+    if not len(values):
+        return np.int8
+    lo, hi = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return dtype
+    return np.int64
+
+
+def _is_small_number(values: pd.Series) -> bool:
+    # Só inteiros sem zeros à esquerda voltam iguais como texto
+    text = values.astype(str)
+    return bool(text.str.fullmatch(r"[1-9]\d{0,3}").all())
+
+
+def _pad_width(parts: pd.Series):
+    # Largura fixa (zeros à esquerda) ou sem zeros à esquerda; senão None
+    lengths = parts.str.len()
+    if lengths.nunique() == 1:
+        return int(lengths.iloc[0])
+    if not parts.str.startswith("0").any():
+        return 0
+    return None
+
+
+def pack_remessa(remessa: pd.Series):
+    """
+    Packs ``NNNNN-NNNNN`` codes into ``uint64``
+
+    Returns:
+        tuple: Packed values and the zero-padding widths of both parts, or
+        ``None`` when some code does not round-trip (other formats)
+    """
+    parts = remessa.astype(str).str.extract(f"^{REMESSA_PATTERN}$")
+    if parts.isna().any(axis=None):
+        return None
+    widths = (_pad_width(parts[0]), _pad_width(parts[1]))
+    if None in widths:
+        return None
+    high = parts[0].astype(np.uint64).to_numpy()
+    low = parts[1].astype(np.uint64).to_numpy()
+    return (high << np.uint64(32)) | low, widths
+
+
+def format_remessa(packed: np.ndarray, widths=(0, 0)) -> pd.Series:
+    """Formats packed ``remessa`` values back to ``NNNNN-NNNNN`` strings"""
+    packed = np.asarray(packed, dtype=np.uint64)
+    high = pd.Series(packed >> np.uint64(32)).astype(str).str.zfill(widths[0])
+    low = pd.Series(packed & np.uint64(0xFFFFFFFF)).astype(str).str.zfill(widths[1])
+    return high + "-" + low
+
+
+def _epoch_seconds(values: pd.Series) -> np.ndarray:
+    ns = values.to_numpy(dtype="datetime64[ns]").view("i8")
+    return np.where(values.isna().to_numpy(), NAT_SECONDS, ns // 10**9)
+
+
+def compact_deliveries(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts typed delivery rows to the compact representation
+
+    Columns that do not fit it (e.g. non-numeric ``cep``) are kept as they
+    are. The ``remessa`` padding widths go to ``attrs["remessa_widths"]``.
+
+    Args:
+        df (pd.DataFrame): Typed rows (``loader.COLUMNS`` layout)
+
+    Returns:
+        pd.DataFrame: Compact rows, with ``attrs["compact"] = True``
+    """
+    out = {}
+    attrs = dict(df.attrs, compact=True)
+    for col in df.columns:
+        values = df[col]
+        if col in INTEGER_CODES and _is_small_number(values):
+            out[col] = values.astype(str).astype(INTEGER_CODES[col]).to_numpy()
+        elif col in ("sq_plan", "delivered"):
+            out[col] = values.to_numpy().astype(_smallest_int(values.to_numpy()))
+        elif col in HOUR_COLUMNS + DISTANCE_COLUMNS:
+            out[col] = values.to_numpy(dtype=np.float32)
+        elif col in TIMESTAMP_COLUMNS:
+            out[col] = _epoch_seconds(values)
+        elif col == "remessa" and (packed := pack_remessa(values)) is not None:
+            out[col], attrs["remessa_widths"] = packed
+        elif col in ("transportadora", "veiculo"):
+            out[col] = values.astype("category")
+        else:
+            out[col] = values
+    compact = pd.DataFrame(out, index=pd.RangeIndex(len(df)))
+    compact.attrs = attrs
+    return compact
+
+
+def _from_epoch(seconds: np.ndarray) -> pd.Series:
+    values = pd.to_datetime(np.where(seconds == NAT_SECONDS, 0, seconds), unit="s")
+    return pd.Series(values).where(seconds != NAT_SECONDS)
+
+
+def expand_deliveries(compact: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rebuilds the typed layout used by the pages from compact rows
+
+    Frames not produced by ``compact_deliveries`` are returned unchanged.
+    """
+    if not compact.attrs.get("compact"):
+        return compact
+    out = {}
+    for col in compact.columns:
+        values = compact[col]
+        kind = values.dtype.kind
+        if col in INTEGER_CODES and kind == "u":
+            out[col] = values.astype(str).astype("category")
+        elif col in ("sq_plan", "delivered"):
+            out[col] = values.astype(np.int64)
+        elif col in HOUR_COLUMNS:
+            out[col] = np.round(values.astype(np.float64), 2)
+        elif col in DISTANCE_COLUMNS:
+            out[col] = np.round(values.astype(np.float64), DISTANCE_DECIMALS)
+        elif col in TIMESTAMP_COLUMNS and kind == "i":
+            out[col] = _from_epoch(values.to_numpy())
+        elif col == "remessa" and kind == "u":
+            widths = compact.attrs["remessa_widths"]
+            out[col] = format_remessa(values.to_numpy(), widths).astype("category")
+        elif col in ("transportadora", "veiculo"):
+            out[col] = values.astype(object)
+        else:
+            out[col] = values
+    df = pd.DataFrame(out, index=compact.index)
+    df.attrs = {
+        k: v for k, v in compact.attrs.items() if k not in ("compact", "remessa_widths")
+    }
+    return df
+
+
+def memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """Bytes per column (``memory_usage(deep=True)``) of two layouts"""
+    report = pd.DataFrame(
+        {
+            "antes": before.memory_usage(deep=True, index=False),
+            "depois": after.memory_usage(deep=True, index=False),
+        }
+    )
+    report.loc["total"] = report.sum()
+    report["razao"] = (report["antes"] / report["depois"]).round(1)
+    return report
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compara a memória da base tipada com a do modo compacto"
+    )
+    parser.add_argument("csv", nargs="?", default=str(DATA_PATH))
+    args = parser.parse_args(argv)
+
+    df = load_deliveries(args.csv)[COLUMNS]
+    compact = compact_deliveries(df)
+    print(memory_report(df, compact).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Correlação a partir de estatísticas suficientes por célula do cubo.
+
+Para cada par de colunas numéricas ``(a, b)`` e cada célula (dia × CEP ×
+transportadora × veículo, as dimensões filtráveis do cubo) são guardados ``n``, ``soma(a)``,
+``soma(a²)`` e ``soma(a·b)`` sobre as linhas em que ``a`` e ``b`` existem.
+Somar células dá a correlação de Pearson de qualquer filtro alinhado ao
+cubo, igual à de ``DataFrame.corr`` (observações completas por par).
+
+Para Spearman, cada par guarda um histograma conjunto dos buckets
+logarítmicos de ``a`` e ``b`` (os mesmos de ``quantiles``, mais grossos). Os
+postos saem das contagens marginais somadas, com empates dentro do bucket;
+o resultado é uma aproximação da correlação de postos.
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from lastmile.quantiles import bucket_of
+
+CORRELATION_COLUMNS = ["horas_rota", "horas_entrega", "distancia", "distancia_rota"]
+# Dimensões do cubo que os filtros alcançam (``cube.can_answer``); sem a hora
+DIMENSIONS = ["dia", "cep", "transportadora", "veiculo"]
+# Largura relativa dos buckets usados como postos aproximados
+RANK_ACCURACY = 0.02
+RANK_GAMMA = (1 + RANK_ACCURACY) / (1 - RANK_ACCURACY)
+
+
+def _dimensions(df: pd.DataFrame) -> dict:
+    return {
+        "dia": df["data_entrega"].dt.normalize(),
+        "cep": df["cep"],
+        "transportadora": df["transportadora"].astype("category"),
+        "veiculo": df["veiculo"].astype("category"),
+    }
+
+
+def build_moments(df: pd.DataFrame, columns=CORRELATION_COLUMNS) -> pd.DataFrame:
+    """
+    Sufficient statistics of every ordered pair of ``columns`` per cube cell
+
+    Returns:
+        pd.DataFrame: One row per observed combination of ``DIMENSIONS`` with
+        ``<a>|<b>_n``, ``<a>|<b>_sum``, ``<a>|<b>_sq`` and ``<a>|<b>_prod``
+        (sums of ``a``, ``a²`` and ``a·b`` over rows where both exist)
+    """
+    values = {col: df[col].to_numpy(dtype=float) for col in columns}
+    valid = {col: ~np.isnan(v) for col, v in values.items()}
+    data = _dimensions(df)
+    for a in columns:
+        for b in columns:
+            both = valid[a] & valid[b]
+            x = np.where(both, values[a], 0.0)
+            y = np.where(both, values[b], 0.0)
+            data[f"{a}|{b}_n"] = both.astype(np.int64)
+            data[f"{a}|{b}_sum"] = x
+            data[f"{a}|{b}_sq"] = x * x
+            data[f"{a}|{b}_prod"] = x * y
+    return (
+        pd.DataFrame(data)
+        .groupby(DIMENSIONS, observed=True, sort=True)
+        .sum()
+        .reset_index()
+    )
+
+
+def pearson(moments: pd.DataFrame, columns=CORRELATION_COLUMNS) -> pd.DataFrame:
+    """
+    Pearson correlation matrix from (filtered) ``build_moments`` cells
+
+    Returns:
+        pd.DataFrame: Same layout as ``DataFrame.corr()``
+    """
+    totals = moments.drop(columns=DIMENSIONS).sum()
+    out = pd.DataFrame(np.nan, index=columns, columns=columns)
+    for a in columns:
+        for b in columns:
+            n = totals[f"{a}|{b}_n"]
+            sa, sb = totals[f"{a}|{b}_sum"], totals[f"{b}|{a}_sum"]
+            qa, qb = totals[f"{a}|{b}_sq"], totals[f"{b}|{a}_sq"]
+            cov = n * totals[f"{a}|{b}_prod"] - sa * sb
+            var = (n * qa - sa * sa) * (n * qb - sb * sb)
+            if n > 1 and var > 0:
+                out.loc[a, b] = np.clip(cov / np.sqrt(var), -1.0, 1.0)
+    return out
+
+
+def build_rank_sketches(df: pd.DataFrame, columns=CORRELATION_COLUMNS) -> pd.DataFrame:
+    """
+    Joint bucket counts of every pair of ``columns`` per cube cell
+
+    Returns:
+        pd.DataFrame: Long table with ``DIMENSIONS``, ``x``, ``y`` (column
+        names), ``bx``, ``by`` (buckets) and ``n`` (count)
+    """
+    dims = pd.DataFrame(_dimensions(df))
+    buckets = {}
+    for col in columns:
+        values = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        b = np.zeros(len(df), dtype=np.int16)
+        b[valid] = bucket_of(values[valid], RANK_GAMMA)
+        buckets[col] = (b, valid)
+
+    parts = []
+    for a, b in combinations(columns, 2):
+        (ba, va), (bb, vb) = buckets[a], buckets[b]
+        both = va & vb
+        part = dims[both].assign(bx=ba[both], by=bb[both])
+        counts = part.groupby(DIMENSIONS + ["bx", "by"], observed=True).size()
+        counts = counts.rename("n").reset_index()
+        counts.insert(len(DIMENSIONS), "x", a)
+        counts.insert(len(DIMENSIONS) + 1, "y", b)
+        parts.append(counts)
+    sketches = pd.concat(parts, ignore_index=True)
+    for col in ["x", "y"]:
+        sketches[col] = sketches[col].astype("category")
+    return sketches
+
+
+def _midranks(counts: pd.Series) -> pd.Series:
+    # Posto médio de cada bucket (empates dentro do bucket)
+    counts = counts.sort_index()
+    before = counts.cumsum() - counts
+    return before + (counts + 1) / 2
+
+
+def spearman(sketches: pd.DataFrame, columns=CORRELATION_COLUMNS) -> pd.DataFrame:
+    """
+    Approximate Spearman correlation matrix from (filtered) rank sketches
+
+    Returns:
+        pd.DataFrame: Same layout as ``DataFrame.corr(method="spearman")``
+    """
+    out = pd.DataFrame(np.nan, index=columns, columns=columns)
+    for col in columns:
+        out.loc[col, col] = 1.0
+    joint = sketches.groupby(["x", "y", "bx", "by"], observed=True)["n"].sum()
+    for (a, b), cells in joint.groupby(level=["x", "y"], observed=True):
+        cells = cells.droplevel(["x", "y"])
+        n = cells.to_numpy(dtype=float)
+        ra = cells.index.get_level_values("bx").map(
+            _midranks(cells.groupby(level="bx").sum())
+        )
+        rb = cells.index.get_level_values("by").map(
+            _midranks(cells.groupby(level="by").sum())
+        )
+        ra, rb = np.asarray(ra, dtype=float), np.asarray(rb, dtype=float)
+        total = n.sum()
+        ma, mb = (n * ra).sum() / total, (n * rb).sum() / total
+        cov = (n * (ra - ma) * (rb - mb)).sum()
+        var = (n * (ra - ma) ** 2).sum() * (n * (rb - mb) ** 2).sum()
+        if total > 1 and var > 0:
+            out.loc[a, b] = out.loc[b, a] = cov / np.sqrt(var)
+    return out
@@ -0,0 +1,122 @@
+"""Cubo pré-agregado de entregas (dia × hora × CEP × transportadora × veículo).
+
+Todas as medidas são aditivas (contagens, somas e somas de quadrados), então
+qualquer agregação sobre um subconjunto das dimensões sai somando células do
+cubo, sem voltar às linhas brutas. Médias e variâncias são derivadas no final.
+"""
+
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ["dia", "hora", "cep", "transportadora", "veiculo"]
+MEASURE_COLUMNS = ["horas_entrega", "distancia"]
+# Colunas do filtro que o cubo consegue responder e as operações aceitas
+CUBE_FILTERS = {
+    "cep": ("isin",),
+    "transportadora": ("isin",),
+    "veiculo": ("isin",),
+    "data_entrega": ("between",),
+}
+
+
+def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates delivery rows into the cube
+
+    Args:
+        df (pd.DataFrame): Typed delivery rows
+
+    Returns:
+        pd.DataFrame: One row per observed combination of ``DIMENSIONS`` with
+        ``entregas`` (rows), ``delivered`` (sum) and, for each measure column,
+        ``<col>_n``, ``<col>_sum`` and ``<col>_sq``
+    """
+    data = {
+        "dia": df["data_entrega"].dt.normalize(),
+        "hora": df["data_entrega"].dt.hour.astype("int8"),
+        "cep": df["cep"],
+        "transportadora": df["transportadora"],
+        "veiculo": df["veiculo"],
+        "entregas": np.ones(len(df), dtype=np.int64),
+        "delivered": df["delivered"],
+    }
+    for col in MEASURE_COLUMNS:
+        values = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        data[f"{col}_n"] = valid.astype(np.int64)
+        data[f"{col}_sum"] = np.where(valid, values, 0.0)
+        data[f"{col}_sq"] = np.where(valid, values * values, 0.0)
+
+    cube = (
+        pd.DataFrame(data)
+        .groupby(DIMENSIONS, observed=True, sort=True)
+        .sum()
+        .reset_index()
+    )
+    return cube
+
+
+def measure_names() -> list:
+    names = ["entregas", "delivered"]
+    for col in MEASURE_COLUMNS:
+        names += [f"{col}_n", f"{col}_sum", f"{col}_sq"]
+    return names
+
+
+def can_answer(spec) -> bool:
+    """
+    Tells whether every condition of a filter spec maps to cube dimensions
+
+    Date ranges are accepted only with whole days (dates without time), the
+    finest granularity of ``dia``.
+    """
+    for column, op, value in spec:
+        if op not in CUBE_FILTERS.get(column, ()):
+            return False
+        if op == "between":
+            lo, hi = (pd.Timestamp(v) for v in value)
+            if lo != lo.normalize() or hi != hi.normalize():
+                return False
+    return True
+
+
+def filter_cube(cube: pd.DataFrame, spec) -> pd.DataFrame:
+    """Applies a filter spec accepted by ``can_answer`` to the cube cells"""
+    mask = np.ones(len(cube), dtype=bool)
+    for column, op, value in spec:
+        if column == "data_entrega":
+            lo, hi = (pd.Timestamp(v) for v in value)
+            mask &= cube["dia"].between(lo, hi).to_numpy()
+        else:
+            mask &= cube[column].isin(list(value)).to_numpy()
+    return cube[mask]
+
+
+def rollup(cube: pd.DataFrame, by) -> pd.DataFrame:
+    """
+    Sums the cube over every dimension not in ``by``
+
+    Adds ``<col>_mean`` and ``<col>_std`` (sample) for each measure column.
+
+    Args:
+        cube (pd.DataFrame): Output of ``build_cube`` (possibly filtered)
+        by (list): Dimensions to keep
+
+    Returns:
+        pd.DataFrame: Aggregated measures indexed by ``by``
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    out = cube.groupby(by, observed=True, sort=True)[measure_names()].sum()
+    return add_statistics(out)
+
+
+def add_statistics(out: pd.DataFrame) -> pd.DataFrame:
+    """Adds ``<col>_mean`` and ``<col>_std`` from summed ``measure_names``"""
+    for col in MEASURE_COLUMNS:
+        n = out[f"{col}_n"]
+        s = out[f"{col}_sum"]
+        sq = out[f"{col}_sq"]
+        out[f"{col}_mean"] = s / n.where(n > 0)
+        var = (sq - s * s / n.where(n > 0)) / (n - 1).where(n > 1)
+        out[f"{col}_std"] = np.sqrt(var.clip(lower=0))
+    return out
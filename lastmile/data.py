@@ -0,0 +1,307 @@
+"""Acesso à base de entregas a partir das páginas do Streamlit.
+
+Com ``LASTMILE_COMPACT=1`` os caches guardam a base no modo compacto
+(``lastmile.compact``); o layout tipado de sempre é montado uma vez por
+versão e compartilhado por todas as sessões do processo.
+
+Com ``LASTMILE_SHARED=1`` a base é publicada uma vez em um arquivo Arrow
+(``lastmile.shared``) e cada processo do servidor só mapeia esse arquivo:
+todas as sessões e réplicas leem as mesmas páginas, sem cópias.
+
+Com ``LASTMILE_BACKEND=duckdb`` a base fica em Parquet (``lastmile.duck``)
+e ``get_data`` devolve só o esquema; filtros e agregações de
+``lastmile.widgets`` rodam em SQL e só os resultados chegam ao processo.
+Com ``LASTMILE_BACKEND=polars`` o CSV é lido e as operações sobre as linhas
+de ``lastmile.widgets`` são executadas pelo Polars (``lastmile.polars_engine``).
+
+Resultados gravados por ``python -m lastmile.precompute`` para a versão em
+uso da base são lidos por ``get_precomputed`` em vez de recalculados.
+"""
+
+import os
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from lastmile.compact import compact_deliveries, expand_deliveries
+from lastmile.loader import (
+    CACHE_DIR_NAME,
+    DATA_PATH,
+    dataset_version,
+    load_deliveries,
+)
+from lastmile import duck, polars_engine, precompute, shared, store
+from lastmile.cube import filter_cube
+from lastmile.quantiles import build_sketches, load_sketches
+
+COMPACT = os.environ.get("LASTMILE_COMPACT", "") == "1"
+SHARED = os.environ.get("LASTMILE_SHARED", "") == "1"
+BACKEND = os.environ.get("LASTMILE_BACKEND", "pandas")
+# Artefatos pré-calculados com a dimensão ``dia``, cortados pelo período
+DAY_ARTIFACTS = ("cubo", "momentos", "postos")
+
+
+@st.cache_data(show_spinner="Carregando dados...")
+def _cached_deliveries(version: str, path: str, compact: bool) -> pd.DataFrame:
+    if BACKEND == "polars":
+        df = polars_engine.load_deliveries(path)
+    else:
+        df = load_deliveries(path)
+    df.attrs["version"] = version
+    return compact_deliveries(df) if compact else df
+
+
+@st.cache_data(show_spinner="Carregando partições...", max_entries=16)
+def _cached_partitions(
+    version: str, root: str, start, end, column: str, compact: bool
+) -> pd.DataFrame:
+    df = store.load_partitions(root, start, end, column)
+    df.attrs["version"] = f"{version}:{column}:{start}:{end}"
+    df.attrs["dataset_version"] = version
+    df.attrs["period"] = (column, start, end)
+    return compact_deliveries(df) if compact else df
+
+
+@st.cache_resource(show_spinner="Expandindo base compacta...", max_entries=2)
+def _expanded_deliveries(version: str, path: str) -> pd.DataFrame:
+    return expand_deliveries(_cached_deliveries(version, path, True))
+
+
+@st.cache_resource(show_spinner="Expandindo partições...", max_entries=4)
+def _expanded_partitions(version: str, root: str, start, end, column: str):
+    return expand_deliveries(
+        _cached_partitions(version, root, start, end, column, True)
+    )
+
+
+@st.cache_resource(show_spinner="Mapeando base compartilhada...", max_entries=2)
+def _shared_deliveries(version: str, source: str, from_store: bool) -> pd.DataFrame:
+    source = Path(source)
+    directory = source if from_store else source.parent / CACHE_DIR_NAME
+    target = shared.shared_path(directory, version)
+    if not target.exists():
+        df = store.load_partitions(source) if from_store else load_deliveries(source)
+        shared.publish(df, target)
+    df = shared.attach(target)
+    df.attrs["version"] = version
+    return df
+
+
+@st.cache_data(show_spinner="Lendo esquema da base...", max_entries=2)
+def _cached_lazy_frame(version: str, root: str) -> pd.DataFrame:
+    return duck.lazy_frame(root)
+
+
+@st.cache_data(show_spinner="Carregando quantis...", max_entries=4)
+def _cached_parquet_sketches(version: str, root: str) -> pd.DataFrame:
+    return duck.sketches(root)
+
+
+@st.cache_data(show_spinner="Carregando quantis...", max_entries=4)
+def _cached_csv_sketches(version: str, path: str) -> pd.DataFrame:
+    sketches = precompute.load_artifact("quantis", version)
+    if sketches is not None:
+        return sketches
+    return build_sketches(load_deliveries(path))
+
+
+@st.cache_data(show_spinner="Carregando quantis...", max_entries=4)
+def _cached_store_sketches(version: str, root: str) -> pd.DataFrame:
+    return load_sketches(root)
+
+
+def get_data(
+    path=DATA_PATH, period=None, column=store.PARTITION_COLUMN, root=store.STORE_PATH
+) -> pd.DataFrame:
+    """
+    Returns the typed delivery dataframe shared by all pages
+
+    When the day-partitioned store exists, only the partitions overlapping
+    ``period`` are read; otherwise the whole CSV at ``path`` is loaded. The
+    Streamlit cache is keyed by the dataset version, so new data invalidates
+    it without restarting the server. The version is also stored in
+    ``df.attrs["version"]`` for caches derived from the dataframe. In compact
+    mode the cache holds the compact rows and the typed frame is expanded once
+    per version, the same read-only object for every session. In shared
+    mode the dataframe is a read-only view over the shared file, the same
+    object for every session. With the duckdb backend it has no rows: it
+    carries the schema and the selected period for ``lastmile.widgets``.
+
+    Args:
+        path: Source CSV file, used when there is no partitioned store
+        period (tuple): ``(start, end)`` dates; ``None`` loads everything
+        column (str): Date column the period applies to
+        root: Partitioned store directory
+
+    Returns:
+        pd.DataFrame: Typed dataframe
+    """
+    if BACKEND == "duckdb":
+        return _get_lazy(path, period, column)
+    if SHARED:
+        return _get_shared(path, period, column, root)
+    if store.store_exists(root):
+        start, end = period if period is not None else (None, None)
+        args = (store.store_version(root), str(root), start, end, column)
+        if COMPACT:
+            return _expanded_partitions(*args)
+        return _cached_partitions(*args, False)
+    version = dataset_version(path)
+    if COMPACT:
+        return _expanded_deliveries(version, str(path))
+    return _cached_deliveries(version, str(path), False)
+
+
+def _get_shared(path, period, column, root) -> pd.DataFrame:
+    if not store.store_exists(root):
+        return _shared_deliveries(dataset_version(path), str(path), False)
+    version = store.store_version(root)
+    df = _shared_deliveries(version, str(root), True)
+    if period is None:
+        return df
+    # Partições ficam em ordem de dia: o período é uma fatia, sem cópia
+    start, end = period
+    window = shared.day_slice(df, column, start, end)
+    window.attrs["version"] = f"{version}:{column}:{start}:{end}"
+    window.attrs["dataset_version"] = version
+    window.attrs["period"] = (column, start, end)
+    return window
+
+
+def _parquet_root(path=DATA_PATH, root=duck.PARQUET_PATH):
+    if not duck.parquet_exists(root):
+        with st.spinner("Convertendo a base para Parquet..."):
+            duck.export_parquet(path, root)
+    return root
+
+
+def _get_lazy(path, period, column) -> pd.DataFrame:
+    root = _parquet_root(path)
+    version = duck.parquet_version(root)
+    df = _cached_lazy_frame(version, str(root))
+    if period is not None:
+        start, end = period
+        df.attrs["duckdb_spec"] = ((column, "between", (start, end)),)
+        df.attrs["version"] = f"{version}:{column}:{start}:{end}"
+    else:
+        df.attrs["version"] = version
+    return df
+
+
+def get_sketches(path=DATA_PATH, root=store.STORE_PATH) -> pd.DataFrame:
+    """
+    Returns the quantile sketches of the whole delivery history
+
+    With the partitioned store they are read from the summary kept up to date
+    by ``lastmile.ingest``; otherwise they are built once from the CSV.
+
+    Returns:
+        pd.DataFrame: Output of ``quantiles.build_sketches``
+    """
+    if BACKEND == "duckdb":
+        parquet = _parquet_root(path)
+        return _cached_parquet_sketches(duck.parquet_version(parquet), str(parquet))
+    if store.store_exists(root):
+        return _cached_store_sketches(store.store_version(root), str(root))
+    return _cached_csv_sketches(dataset_version(path), str(path))
+
+
+# Lido também das threads que montam as figuras, onde o spinner não cabe
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_artifact(version: str, name: str, stamp: str) -> pd.DataFrame:
+    return precompute.load_artifact(name, version)
+
+
+def get_precomputed(df: pd.DataFrame, name: str):
+    """
+    Artifact ``name`` of ``lastmile.precompute`` for the rows of ``df``
+
+    Artifacts cover the whole history, so they are only returned for
+    dataframes holding all of it; the ones with a ``dia`` dimension (cube and
+    correlation summaries) are the exception, cut to the days of the period
+    selected in ``get_data``.
+
+    Args:
+        df (pd.DataFrame): Dataframe returned by ``get_data``
+        name (str): Artifact name
+
+    Returns:
+        pd.DataFrame: The artifact, or ``None`` when it was not precomputed
+        for this dataset version or does not apply to ``df``
+    """
+    if BACKEND == "duckdb":
+        return None
+    version = df.attrs.get("dataset_version", df.attrs.get("version"))
+    manifest = precompute.read_manifest(version) if version else None
+    if manifest is None or name not in manifest["artefatos"]:
+        return None
+    column, start, end = df.attrs.get("period") or (None, None, None)
+    stamp = manifest.get("criado")
+    if start is None and end is None:
+        if len(df) != manifest["linhas"]:
+            return None
+        return _cached_artifact(version, name, stamp)
+    if name not in DAY_ARTIFACTS or column != store.PARTITION_COLUMN:
+        return None
+    if None in (start, end) or "cubo" not in manifest["artefatos"]:
+        return None
+    period = [(column, "between", (start, end))]
+    cube = filter_cube(_cached_artifact(version, "cubo", stamp), period)
+    # Confere que o período cobre exatamente as linhas de ``df``
+    if cube["entregas"].sum() != len(df):
+        return None
+    if name == "cubo":
+        return cube
+    return filter_cube(_cached_artifact(version, name, stamp), period)
+
+
+def data_version(path=DATA_PATH, root=store.STORE_PATH) -> str:
+    """Version of the data ``get_data`` reads with the current backend"""
+    if BACKEND == "duckdb":
+        return duck.parquet_version(_parquet_root(path))
+    if store.store_exists(root):
+        return store.store_version(root)
+    return dataset_version(path)
+
+
+def default_period(root=store.STORE_PATH, days=31):
+    """
+    Bounds and default window of the period selector
+
+    Returns:
+        tuple: ``(first, last, window)``, or ``None`` without a partitioned
+        store or Parquet export
+    """
+    if BACKEND == "duckdb":
+        parquet = _parquet_root()
+        first, last = duck.parquet_bounds(parquet)
+        if last is None:
+            return None
+        return first, last, duck.default_window(parquet, days)
+    if store.store_exists(root):
+        first, last = store.store_bounds(root)
+        return first, last, store.default_window(root, days)
+    return None
+
+
+def period_input(root=store.STORE_PATH, days=31):
+    """
+    Adds a sidebar date range for the partitioned store or the Parquet export
+
+    Returns:
+        tuple: Selected ``(start, end)`` dates, or ``None`` without either
+    """
+    bounds = default_period(root, days)
+    if bounds is None:
+        return None
+    first, last, window = bounds
+    period = st.sidebar.date_input(
+        "Período das entregas",
+        value=window,
+        min_value=first.date(),
+        max_value=last.date(),
+    )
+    if len(period) != 2:
+        return window
+    return tuple(period)
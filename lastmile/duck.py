@@ -0,0 +1,608 @@
+"""Backend DuckDB: filtros e agregações em SQL sobre a base em Parquet.
+
+Com ``LASTMILE_BACKEND=duckdb`` as páginas não recebem as linhas da base:
+``get_data`` devolve um dataframe vazio com o esquema (``lazy_frame``) e as
+funções de ``lastmile.widgets`` traduzem o filtro e cada agregação (totais
+por CEP, entregas por dia, células do heatmap, sequência das rotas) para
+SQL. O DuckDB lê só as colunas usadas, pula os diretórios de dias fora do
+período e os grupos de linhas que as estatísticas do Parquet descartam; só
+os resultados, já agregados, chegam ao Python. A base pode ser maior que a
+memória.
+
+Layout em disco (um diretório por dia de entrega, um arquivo por lote do
+CSV)::
+
+    data/parquet/
+        _manifest.json
+        dia=2022-11-01/part-00000.parquet
+
+Uso::
+
+    python -m lastmile.duck data/dados_entregas_last_mile.csv
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import shutil
+import threading
+import uuid
+from functools import lru_cache
+from itertools import combinations_with_replacement
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from lastmile.charts import HEATMAP_BINS, nice_edges
+from lastmile.correlation import CORRELATION_COLUMNS
+from lastmile.cube import MEASURE_COLUMNS, add_statistics
+from lastmile.filters import column_kind
+from lastmile.loader import (
+    COLUMNS,
+    CSV_DTYPES,
+    CSV_SEP,
+    DATA_PATH,
+    parse_deliveries,
+    write_atomic,
+)
+from lastmile.quantiles import (
+    GAMMA,
+    MAX_VALUE,
+    MIN_VALUE,
+    SKETCH_COLUMNS,
+    ZERO_BUCKET,
+    merge_sketches,
+)
+from lastmile.routes import QUALITY_COLUMNS, ROUTE_ATTRIBUTES, ROUTE_COLUMNS
+from lastmile.store import PARTITION_COLUMN
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+PARQUET_PATH = Path("data/parquet")
+MANIFEST_NAME = "_manifest.json"
+CHUNK_ROWS = 1_000_000
+# Diretório das entregas sem data (não entra em nenhum período)
+NO_DAY = "sem-data"
+# Colunas cujas categorias são as da base inteira em todo resultado, para
+# que os códigos de frames diferentes sejam comparáveis (``routes_of``)
+SHARED_CATEGORIES = ["codigo_rota", "cep"]
+# Expressão SQL de cada dimensão do cubo
+DIMENSION_SQL = {
+    "dia": "date_trunc('day', data_entrega)",
+    "hora": "hour(data_entrega)",
+    "cep": "cep",
+    "transportadora": "transportadora",
+    "veiculo": "veiculo",
+}
+
+_connection = None
+_lock = threading.Lock()
+
+
+def _cursor():
+    global _connection
+    if duckdb is None:
+        raise ImportError("O backend duckdb requer o pacote duckdb")
+    with _lock:
+        if _connection is None:
+            _connection = duckdb.connect()
+        # Cada cursor é uma conexão própria sobre o mesmo banco: seguro por thread
+        return _connection.cursor()
+
+
+def _query(sql: str, params=()) -> pd.DataFrame:
+    return _cursor().execute(sql, list(params)).df()
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _source(root) -> str:
+    pattern = str(Path(root) / "*" / "*.parquet").replace("'", "''")
+    return (
+        f"read_parquet('{pattern}', hive_partitioning = true, "
+        "hive_types = {'dia': VARCHAR}, filename = true, file_row_number = true)"
+    )
+
+
+def read_manifest(root=PARQUET_PATH) -> dict:
+    """
+    Reads the manifest of a Parquet export
+
+    Returns:
+        dict: ``{"version", "rows", "data_entrega_min", "data_entrega_max"}``;
+        ``version`` is ``None`` when there is no export
+    """
+    try:
+        return json.loads((Path(root) / MANIFEST_NAME).read_text())
+    except FileNotFoundError:
+        return {"version": None, "rows": 0}
+
+
+def parquet_exists(root=PARQUET_PATH) -> bool:
+    return (Path(root) / MANIFEST_NAME).exists()
+
+
+def parquet_version(root=PARQUET_PATH):
+    """Identifier that changes on every export"""
+    return read_manifest(root)["version"]
+
+
+def parquet_bounds(root=PARQUET_PATH):
+    """Returns the ``(min, max)`` of ``data_entrega`` over the whole export"""
+    manifest = read_manifest(root)
+    if not manifest.get("data_entrega_min"):
+        return None, None
+    return (
+        pd.Timestamp(manifest["data_entrega_min"]),
+        pd.Timestamp(manifest["data_entrega_max"]),
+    )
+
+
+def default_window(root=PARQUET_PATH, days=31):
+    """
+    Returns the last ``days`` days of the export as a ``(start, end)`` date pair
+    """
+    first, last = parquet_bounds(root)
+    if last is None:
+        return None
+    end = last.date()
+    return max(first.date(), end - dt.timedelta(days=days - 1)), end
+
+
+def _day_dir(day) -> str:
+    return f"dia={NO_DAY}" if pd.isna(day) else f"dia={day:%Y-%m-%d}"
+
+
+def write_chunk(df: pd.DataFrame, root, chunk: int) -> dict:
+    """
+    Writes typed rows as ``part-<chunk>.parquet`` in each of their day directories
+
+    Returns:
+        dict: ``rows`` and the ``data_entrega`` bounds of the chunk, for
+        ``write_manifest``
+    """
+    days = df[PARTITION_COLUMN].dt.normalize()
+    for day, part in df.groupby(days, dropna=False, sort=True):
+        table = pa.Table.from_pandas(part, preserve_index=False)
+        write_atomic(
+            Path(root) / _day_dir(day) / f"part-{chunk:05d}.parquet",
+            lambda tmp: pq.write_table(table, tmp),
+        )
+    return {
+        "rows": len(df),
+        "min": df[PARTITION_COLUMN].min(),
+        "max": df[PARTITION_COLUMN].max(),
+    }
+
+
+def write_manifest(root, chunks: list) -> dict:
+    """Writes the manifest of an export from the ``write_chunk`` results"""
+    bounds = pd.Series(
+        [c["min"] for c in chunks] + [c["max"] for c in chunks], dtype="datetime64[ns]"
+    ).dropna()
+    manifest = {
+        "version": uuid.uuid4().hex[:16],
+        "rows": sum(c["rows"] for c in chunks),
+        "data_entrega_min": str(bounds.min()) if len(bounds) else None,
+        "data_entrega_max": str(bounds.max()) if len(bounds) else None,
+    }
+    write_atomic(
+        Path(root) / MANIFEST_NAME,
+        lambda tmp: tmp.write_text(json.dumps(manifest, indent=1)),
+    )
+    return manifest
+
+
+def replace_export(staging, root=PARQUET_PATH) -> None:
+    """Moves a finished export from ``staging`` to ``root``, dropping the old one"""
+    shutil.rmtree(root, ignore_errors=True)
+    os.replace(staging, root)
+
+
+def staging_dir(root=PARQUET_PATH) -> Path:
+    """Empty directory next to ``root`` where a new export is written"""
+    root = Path(root)
+    staging = root.with_name(f"{root.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    return staging
+
+
+def export_parquet(csv_path=DATA_PATH, root=PARQUET_PATH, chunk_rows=CHUNK_ROWS):
+    """
+    Converts a delivery CSV to day-partitioned Parquet, one chunk at a time
+
+    Only ``chunk_rows`` rows are in memory at once, so extracts larger than
+    the memory can be exported. The new export replaces the previous one.
+
+    Returns:
+        dict: Manifest of the export
+    """
+    staging = staging_dir(root)
+    chunks = pd.read_csv(
+        csv_path,
+        sep=CSV_SEP,
+        dtype=CSV_DTYPES,
+        usecols=list(CSV_DTYPES),
+        chunksize=chunk_rows,
+    )
+    written = [
+        write_chunk(parse_deliveries(raw), staging, i) for i, raw in enumerate(chunks)
+    ]
+    manifest = write_manifest(staging, written)
+    replace_export(staging, root)
+    return manifest
+
+
+def _param(value):
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def where_clause(spec) -> tuple:
+    """
+    Translates a filter spec into a SQL condition
+
+    Same semantics as ``filters.compile_mask``: whole-date ranges cover the
+    whole last day and missing values never match. Date ranges on
+    ``data_entrega`` also restrict the ``dia`` directories read.
+
+    Returns:
+        tuple: Condition and its ``?`` parameters
+    """
+    clauses, params = [], []
+    for column, op, value in spec:
+        col = _quote(column)
+        if op == "isin":
+            if not value:
+                clauses.append("FALSE")
+                continue
+            clauses.append(f"{col} IN ({', '.join('?' * len(value))})")
+            params += [_param(v) for v in value]
+        elif op == "between":
+            lo, hi = value
+            if not isinstance(lo, dt.date):
+                clauses.append(f"{col} BETWEEN ? AND ?")
+                params += [float(lo), float(hi)]
+                continue
+            lo, hi = pd.Timestamp(lo), pd.Timestamp(hi)
+            if hi == hi.normalize():
+                # Datas sem horário cobrem o dia inteiro
+                clauses.append(f"{col} >= ? AND {col} < ?")
+                hi_next = hi + pd.Timedelta(days=1)
+                params += [lo.to_pydatetime(), hi_next.to_pydatetime()]
+            else:
+                clauses.append(f"{col} BETWEEN ? AND ?")
+                params += [lo.to_pydatetime(), hi.to_pydatetime()]
+            if column == PARTITION_COLUMN:
+                clauses.append("dia BETWEEN ? AND ?")
+                params += [f"{lo:%Y-%m-%d}", f"{hi:%Y-%m-%d}"]
+        else:
+            clauses.append(f"regexp_matches(CAST({col} AS VARCHAR), ?)")
+            params.append(value)
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def _not_null(*columns) -> str:
+    return " AND ".join(f"{_quote(c)} IS NOT NULL" for c in columns)
+
+
+@lru_cache(maxsize=4)
+def _schema(root: str, version: str) -> dict:
+    columns = ", ".join(_quote(c) for c in COLUMNS)
+    dtypes = dict(_query(f"SELECT {columns} FROM {_source(root)} LIMIT 0").dtypes)
+    for col in SHARED_CATEGORIES:
+        values = _query(
+            f"SELECT DISTINCT CAST({_quote(col)} AS VARCHAR) AS v "
+            f"FROM {_source(root)} WHERE {_not_null(col)} ORDER BY v"
+        )["v"]
+        dtypes[col] = pd.CategoricalDtype(values.tolist())
+    for col, dtype in dtypes.items():
+        if dtype.kind == "M":
+            dtypes[col] = np.dtype("datetime64[ns]")
+    dtypes["remessa"] = "category"
+    return dtypes
+
+
+def schema(root=PARQUET_PATH) -> dict:
+    """Column → dtype of the rows returned for the export at ``root``"""
+    return _schema(str(root), parquet_version(root))
+
+
+def _typed(frame: pd.DataFrame, root) -> pd.DataFrame:
+    dtypes = schema(root)
+    return frame.astype({c: dtypes[c] for c in frame.columns if c in dtypes})
+
+
+def lazy_frame(root=PARQUET_PATH) -> pd.DataFrame:
+    """
+    Empty dataframe with the schema of the export, standing for its rows
+
+    The ``duckdb`` attribute holds the export directory; ``widgets`` runs
+    the filters and aggregations of such frames in SQL.
+    """
+    df = pd.DataFrame({c: pd.Series(dtype=t) for c, t in schema(root).items()})
+    df.attrs["duckdb"] = str(root)
+    return df
+
+
+def source_of(df: pd.DataFrame):
+    """
+    Export directory and base filter spec of a ``lazy_frame``
+
+    Returns:
+        tuple: ``(root, spec)``, or ``None`` for dataframes holding rows
+    """
+    if "duckdb" not in df.attrs:
+        return None
+    return df.attrs["duckdb"], tuple(df.attrs.get("duckdb_spec", ()))
+
+
+def column_stats(root, spec, columns) -> dict:
+    """Same as ``filters.column_stats`` over the rows matching ``spec``"""
+    where, params = where_clause(spec)
+    dtypes = schema(root)
+    exprs = []
+    for i, col in enumerate(columns):
+        q = _quote(col)
+        exprs += [
+            f"count(DISTINCT {q}) AS n{i}",
+            f"min({q}) AS min{i}",
+            f"max({q}) AS max{i}",
+        ]
+    row = _query(
+        f"SELECT {', '.join(exprs)} FROM {_source(root)} WHERE {where}", params
+    ).iloc[0]
+
+    stats = {}
+    for i, col in enumerate(columns):
+        nunique = int(row[f"n{i}"])
+        kind = column_kind(pd.Series(dtype=dtypes[col]), nunique)
+        entry = {"kind": kind, "nunique": nunique, "min": None, "max": None}
+        if kind == "categorical":
+            q = _quote(col)
+            entry["values"] = _query(
+                f"SELECT DISTINCT {q} FROM {_source(root)} "
+                f"WHERE {where} AND {q} IS NOT NULL ORDER BY {q}",
+                params,
+            )[col].tolist()
+        elif kind in ("numeric", "datetime"):
+            entry["min"], entry["max"] = row[f"min{i}"], row[f"max{i}"]
+        stats[col] = entry
+    return stats
+
+
+def select(root, spec, columns) -> pd.DataFrame:
+    """Rows matching ``spec`` with only ``columns``, in the typed layout"""
+    where, params = where_clause(spec)
+    cols = ", ".join(_quote(c) for c in columns)
+    frame = _query(f"SELECT {cols} FROM {_source(root)} WHERE {where}", params)
+    return _typed(frame, root)
+
+
+def rollup(root, spec, by) -> pd.DataFrame:
+    """
+    Same as ``cube.rollup`` of the cube of the rows matching ``spec``
+
+    Rows missing a cube dimension are left out, as in ``cube.build_cube``.
+    """
+    where, params = where_clause(spec)
+    dims = ", ".join(f"{DIMENSION_SQL[d]} AS {d}" for d in by)
+    measures = ["count(*) AS entregas", "CAST(sum(delivered) AS BIGINT) AS delivered"]
+    for col in MEASURE_COLUMNS:
+        measures += [
+            f"count({col}) AS {col}_n",
+            f"coalesce(sum({col}), 0) AS {col}_sum",
+            f"coalesce(sum({col} * {col}), 0) AS {col}_sq",
+        ]
+    present = _not_null("data_entrega", "cep", "transportadora", "veiculo")
+    out = _query(
+        f"SELECT {dims}, {', '.join(measures)} FROM {_source(root)} "
+        f"WHERE {where} AND {present} GROUP BY ALL",
+        params,
+    )
+    if "dia" in out:
+        out["dia"] = out["dia"].astype("datetime64[ns]")
+    if "hora" in out:
+        out["hora"] = out["hora"].astype("int8")
+    out = _typed(out, root).set_index(list(by)).sort_index()
+    return add_statistics(out)
+
+
+def correlation(root, spec, method="pearson", columns=CORRELATION_COLUMNS):
+    """
+    Same as ``DataFrame.corr`` of the rows matching ``spec``
+
+    Spearman ranks each pair over its complete rows with average ranks for
+    ties (window functions), so it is exact.
+    """
+    where, params = where_clause(spec)
+    out = pd.DataFrame(np.nan, index=columns, columns=columns)
+    for a, b in combinations_with_replacement(columns, 2):
+        x, y = _quote(a), _quote(b)
+        if method == "spearman":
+            rows = (
+                f"SELECT {x} AS x, {y} AS y FROM {_source(root)} "
+                f"WHERE {where} AND {x} IS NOT NULL AND {y} IS NOT NULL"
+            )
+            ranks = (
+                "SELECT rank() OVER (ORDER BY x) "
+                "+ (count(*) OVER (PARTITION BY x) - 1) / 2.0 AS x, "
+                "rank() OVER (ORDER BY y) "
+                "+ (count(*) OVER (PARTITION BY y) - 1) / 2.0 AS y "
+                f"FROM ({rows})"
+            )
+            sql = f"SELECT corr(x, y) AS r FROM ({ranks})"
+        else:
+            sql = f"SELECT corr({x}, {y}) AS r FROM {_source(root)} WHERE {where}"
+        out.loc[a, b] = out.loc[b, a] = _query(sql, params)["r"].iloc[0]
+    return out.astype(float)
+
+
+def heatmap_cells(root, spec, x, y, z, nbins=HEATMAP_BINS) -> pd.DataFrame:
+    """Same as ``charts.heatmap_cells`` over the rows matching ``spec``"""
+    where, params = where_clause(spec)
+    qx, qy, qz = _quote(x), _quote(y), _quote(z)
+    rows = f"FROM {_source(root)} WHERE {where} AND {_not_null(x, y, z)}"
+    lo, hi = _query(f"SELECT min({qy}) AS lo, max({qy}) AS hi {rows}", params).iloc[0]
+    if pd.isna(lo):
+        return pd.DataFrame()
+
+    edges = nice_edges(float(lo), float(hi), nbins)
+    start, step, ny = float(edges[0]), float(edges[1] - edges[0]), len(edges) - 1
+    # Bordas de np.arange são start + i * step; o CASE corrige o arredondamento
+    # do floor para que os bins sejam os do searchsorted
+    k = f"CAST(floor(({qy} - $start) / $step) AS BIGINT)"
+    ybin = (
+        f"CASE WHEN {qy} < $start + {k} * $step THEN {k} - 1 "
+        f"WHEN {qy} >= $start + ({k} + 1) * $step THEN {k} + 1 ELSE {k} END"
+    )
+    sql = (
+        f"SELECT {qx} AS x, least(greatest({ybin}, 0), {ny - 1}) AS ybin, "
+        f"avg({qz}) AS z {rows} GROUP BY ALL"
+    )
+    sql = sql.replace("$start", repr(start)).replace("$step", repr(step))
+    cells = _query(sql, params)
+
+    xvalues = sorted(cells["x"].unique())
+    avg = cells.pivot(index="ybin", columns="x", values="z")
+    avg = avg.reindex(index=range(ny), columns=xvalues)
+    centers = (edges[:-1] + edges[1:]) / 2
+    out = pd.DataFrame(
+        avg.to_numpy(dtype=float), index=centers, columns=[str(v) for v in xvalues]
+    )
+    out.index.name = y
+    out.columns.name = x
+    return out
+
+
+def routes(root, spec) -> pd.DataFrame:
+    """Same as ``routes.split_routes(...)[0]`` of the rows matching ``spec``"""
+    where, params = where_clause(spec)
+    first = ", ".join(
+        f"first({_quote(c)} ORDER BY filename, file_row_number) AS {_quote(c)}"
+        for c in ROUTE_ATTRIBUTES
+    )
+    out = _query(
+        f"SELECT codigo_rota, {first}, count(*) AS paradas, "
+        "coalesce(sum(coalesce(distancia, 0)), 0) AS distancia_paradas, "
+        "min(data_entrega) AS primeira_entrega, max(data_entrega) AS ultima_entrega "
+        f"FROM {_source(root)} WHERE {where} AND codigo_rota IS NOT NULL "
+        "GROUP BY codigo_rota ORDER BY codigo_rota",
+        params,
+    )
+    out = _typed(out, root)[ROUTE_COLUMNS]
+    for col in ["primeira_entrega", "ultima_entrega"]:
+        out[col] = out[col].astype("datetime64[ns]")
+    return out
+
+
+def route_quality(root, spec) -> pd.DataFrame:
+    """
+    Same as ``routes.route_quality`` of the rows matching ``spec``
+
+    The pairs of stops of each route are compared with a self-join inside
+    the route; only one row per route comes back.
+    """
+    where, params = where_clause(spec)
+    sql = f"""
+        WITH entregas AS (
+            SELECT codigo_rota, sq_plan, row_number() OVER (
+                PARTITION BY codigo_rota
+                ORDER BY data_entrega NULLS FIRST, filename, file_row_number
+            ) - 1 AS pos
+            FROM {_source(root)} WHERE {where} AND codigo_rota IS NOT NULL
+        ),
+        ordens AS (
+            SELECT *,
+                row_number() OVER (
+                    PARTITION BY codigo_rota ORDER BY sq_plan, pos
+                ) - 1 AS planejada,
+                lead(sq_plan) OVER (PARTITION BY codigo_rota ORDER BY pos) AS proxima
+            FROM entregas
+        ),
+        pares AS (
+            SELECT a.codigo_rota,
+                count(*) FILTER (WHERE a.sq_plan > b.sq_plan) AS discordantes,
+                count(*) FILTER (WHERE a.sq_plan < b.sq_plan) AS concordantes
+            FROM entregas a JOIN entregas b
+                ON a.codigo_rota = b.codigo_rota AND a.pos < b.pos
+            GROUP BY a.codigo_rota
+        )
+        SELECT o.codigo_rota, count(*) AS paradas,
+            count(*) FILTER (WHERE proxima - sq_plan != 1) AS saltos,
+            max(abs(pos - planejada)) AS maior_deslocamento,
+            coalesce(any_value(discordantes), 0) AS discordantes,
+            coalesce(any_value(concordantes), 0) AS concordantes
+        FROM ordens o LEFT JOIN pares p ON o.codigo_rota = p.codigo_rota
+        GROUP BY o.codigo_rota ORDER BY o.codigo_rota
+    """
+    out = _query(sql, params)
+    sizes = out["paradas"].to_numpy(dtype=float)
+    discordant = out["discordantes"].to_numpy(dtype=float)
+    concordant = out["concordantes"].to_numpy(dtype=float)
+    pairs = sizes * (sizes - 1) / 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tau = (concordant - discordant) / np.sqrt((concordant + discordant) * pairs)
+
+    out["sequencia_planejada"] = out["saltos"].to_numpy() == 0
+    out["inversoes"] = out["discordantes"].astype(np.int64)
+    out["kendall_tau"] = tau
+    out["codigo_rota"] = out["codigo_rota"].astype(str).astype(object)
+    out["paradas"] = out["paradas"].astype(np.int64)
+    out["maior_deslocamento"] = out["maior_deslocamento"].astype(np.int64)
+    return out[QUALITY_COLUMNS]
+
+
+def sketches(root, spec=()) -> pd.DataFrame:
+    """Same as ``quantiles.build_sketches`` of the rows matching ``spec``"""
+    where, params = where_clause(spec)
+    parts = []
+    for col in SKETCH_COLUMNS:
+        q = _quote(col)
+        bucket = (
+            f"CASE WHEN {q} < {MIN_VALUE!r} THEN {int(ZERO_BUCKET)} "
+            f"ELSE CAST(ceil(ln(least({q}, {MAX_VALUE!r})) / ln({GAMMA!r})) "
+            "AS SMALLINT) END"
+        )
+        part = _query(
+            "SELECT date_trunc('day', data_entrega) AS dia, "
+            "CAST(cep AS VARCHAR) AS cep, "
+            "CAST(transportadora AS VARCHAR) AS transportadora, "
+            f"'{col}' AS medida, {bucket} AS bucket, count(*) AS n "
+            f"FROM {_source(root)} "
+            f"WHERE {where} AND {_not_null(col, 'data_entrega')} GROUP BY ALL",
+            params,
+        )
+        part["dia"] = part["dia"].astype("datetime64[ns]")
+        part["bucket"] = part["bucket"].astype(np.int16)
+        parts.append(part)
+    return merge_sketches(*parts)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Converte um CSV de entregas em Parquet particionado por dia"
+    )
+    parser.add_argument("csv", nargs="?", default=str(DATA_PATH))
+    parser.add_argument("--destino", default=str(PARQUET_PATH))
+    parser.add_argument("--linhas-por-lote", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    manifest = export_parquet(args.csv, args.destino, args.linhas_por_lote)
+    print(f"{manifest['rows']} linhas gravadas em {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
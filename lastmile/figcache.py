@@ -0,0 +1,108 @@
+"""Cache LRU de figuras Plotly serializadas.
+
+As figuras são guardadas como JSON, indexadas por (versão da base, id do
+gráfico, estado normalizado dos filtros). Uma única instância por processo é
+compartilhada entre as sessões, então dashboards abertos com os mesmos filtros
+renderizam direto do cache. O total guardado respeita um limite de memória;
+ao passar do limite as figuras usadas há mais tempo são descartadas.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.io as pio
+
+from lastmile.filters import normalize_spec
+
+DEFAULT_MAX_BYTES = int(os.environ.get("LASTMILE_FIGURE_CACHE_MB", "64")) * 2**20
+
+
+def figure_key(version: str, chart_id: str, state=()) -> tuple:
+    """
+    Builds the cache key of a figure
+
+    Args:
+        version (str): Dataset version (``df.attrs["version"]``)
+        chart_id (str): Identifier of the chart within the app
+        state: Filter spec (or spec-like ``(column, op, value)`` tuples) the
+            figure depends on; normalized so equivalent selections match
+    """
+    return (version, chart_id, normalize_spec(state))
+
+
+class FigureCache:
+    """
+    Thread-safe LRU of serialized figures with a memory cap
+
+    Args:
+        max_bytes (int): Maximum total size of the stored JSON payloads
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the JSON stored for ``key`` (or ``None``), marking it as used"""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, payload: str) -> None:
+        """Stores ``payload``, evicting least recently used figures if needed"""
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= len(old)
+            self._entries[key] = payload
+            self._nbytes += size
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= len(evicted)
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached figure for ``key``, calling ``build()`` on a miss
+
+        Args:
+            key (tuple): Output of ``figure_key``
+            build: Function returning a ``plotly`` figure
+
+        Returns:
+            go.Figure: Cached or freshly built figure
+        """
+        payload = self.get(key)
+        if payload is not None:
+            return pio.from_json(payload)
+        fig = build()
+        self.put(key, fig.to_json())
+        return fig
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def info(self) -> dict:
+        """Number of figures, stored bytes, cap and hit/miss counters"""
+        with self._lock:
+            return {
+                "figures": len(self._entries),
+                "bytes": self._nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
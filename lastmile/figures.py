@@ -0,0 +1,216 @@
+"""Figuras das páginas de gráficos e de propostas.
+
+Cada função recebe os dados e o estado dos widgets de que a figura depende e
+devolve a figura Plotly; as agregações passam pelos caches de
+``lastmile.widgets``. Ficam fora das páginas para que o aquecimento
+(``lastmile.warmup``) monte as visões padrão antes da primeira visita.
+"""
+
+import pandas as pd
+import plotly.express as px
+
+from lastmile.charts import add_quantile_lines, box_figure, heatmap_figure
+from lastmile.instrument import stage
+from lastmile.quantiles import sketch_box_stats
+from lastmile.widgets import correlation_matrix, get_heatmap_cells, rollup_or_group
+
+
+def _cep_totals(df: pd.DataFrame, spec) -> pd.DataFrame:
+    with stage("agregação: cep", df) as s:
+        return s.out(
+            rollup_or_group(df, spec, "cep").reindex(df["cep"].cat.categories)
+        )
+
+
+# Total de entregas por CEP
+def entregas_cep(df: pd.DataFrame, spec):
+    dfg = _cep_totals(df, spec)[["delivered"]].fillna(0).astype({"delivered": "int64"})
+
+    fig = px.bar(
+        x=dfg.index,
+        y="delivered",
+        data_frame=dfg,
+        labels={"cep": "CEP", "delivered": "Total de Entregas"},
+        barmode="group",
+    )
+    fig.update_layout(barmode="group", xaxis={"categoryorder": "sum descending"})
+    fig.update_xaxes(type="category")
+    fig.update_traces(
+        textfont_size=12, textangle=0, textposition="outside", cliponaxis=False
+    )
+    return fig
+
+
+# Média do tempo de entrega por CEP
+def media_horas_cep(df: pd.DataFrame, spec):
+    dfmedEnt = _cep_totals(df, spec)[["horas_entrega_mean"]].rename(
+        columns={"horas_entrega_mean": "horas_entrega"}
+    )
+
+    fig = px.bar(
+        x=dfmedEnt.index,
+        y="horas_entrega",
+        data_frame=dfmedEnt,
+        labels={"cep": "CEP", "horas_entrega": "Média de Horas"},
+        barmode="group",
+    )
+    fig.update_layout(barmode="group", xaxis={"categoryorder": "sum descending"})
+    fig.update_xaxes(type="category")
+    fig.update_traces(
+        textfont_size=12, textangle=0, textposition="outside", cliponaxis=False
+    )
+    return fig
+
+
+# Correlação entre dados (somando estatísticas suficientes quando possível)
+def correlacao(df: pd.DataFrame, spec, metodo: str):
+    with stage("agregação: correlação", df) as s:
+        dfcorr = s.out(correlation_matrix(df, spec, metodo))
+
+    return px.imshow(
+        dfcorr,
+        text_auto=True,
+        aspect="auto",
+    )
+
+
+# Quantidade de entregas por dia (bins diários calculados no servidor)
+def entregas_dia(df: pd.DataFrame, spec):
+    with stage("agregação: dia", df) as s:
+        dfdia = s.out(rollup_or_group(df, spec, "dia")[["delivered"]].reset_index())
+    fig = px.bar(
+        dfdia,
+        x="dia",
+        y="delivered",
+        labels={"delivered": "Entregas", "dia": "Data de Entrega"},
+    )
+    fig.update_layout(bargap=0.1, xaxis=dict(tickformat="%a(%d)"))
+    fig.update_xaxes(
+        showgrid=True, rangeslider_visible=True, tickmode="linear", dtick=86400000
+    )
+    return fig
+
+
+def q1_sequencia(dfq1: pd.DataFrame):
+    total_rotas = len(dfq1)
+    total_sequencias_planejadas = int(dfq1["sequencia_planejada"].sum())
+    total_variacoes_sequencias = total_rotas - total_sequencias_planejadas
+
+    labels = [
+        "Total de rotas com sequência de entrega planejada",
+        "Total de rotas com variação na sequência de entrega",
+    ]
+    values = [total_sequencias_planejadas, total_variacoes_sequencias]
+
+    fig = px.pie(
+        values=values,
+        names=labels,  # color_discrete_sequence=px.colors.sequential.Electric
+    )
+    fig.update_traces(textfont_size=30)
+    fig.update_layout(legend=dict(font=dict(size=20)))
+    return fig
+
+
+def q2_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Deliveries per day and CEP, as plotted by Question 2"""
+    with stage("q2: entregas por cep e dia", df) as s:
+        dfq2_plot = s.out(
+            rollup_or_group(df, (), ["dia", "cep"])[["delivered"]]
+            .reset_index()
+            .rename(columns={"dia": "dia_mes"})
+        )
+    dfq2_plot["dia_mes"] = dfq2_plot["dia_mes"].dt.date
+    dfq2_plot["cep"] = dfq2_plot["cep"].astype(str)
+    return dfq2_plot
+
+
+def q2_cep_dia(dfq2_plot: pd.DataFrame):
+    fig = px.bar(
+        data_frame=dfq2_plot,
+        x="dia_mes",
+        y="delivered",
+        color="cep",
+        barmode="group",
+        labels={
+            "cep": "CEP",
+            "delivered": "Total de Entregas por CEP",
+            "dia_mes": "Data de Entrega",
+        },
+        color_continuous_scale="Electric",
+    )
+    # fig.update_layout(xaxis={"categoryorder": "sum descending"})
+    fig.update_xaxes(type="category", showgrid=True)
+    fig.for_each_trace(
+        lambda t: t.update(hovertemplate=t.hovertemplate.replace("sum of", ""))
+    )
+    fig.for_each_yaxis(
+        lambda a: a.update(title_text=a.title.text.replace("sum of", ""))
+    )
+    fig.update_layout(bargap=0.1, xaxis=dict(tickformat="%a(%d)"))
+    return fig
+
+
+def q2_total_dia(dfq2_plot: pd.DataFrame):
+    fig2 = px.bar(
+        data_frame=pd.DataFrame(
+            dfq2_plot[["dia_mes", "delivered"]]
+            .groupby(["dia_mes"])
+            .agg("sum")
+            .to_records()
+        ),
+        x="dia_mes",
+        y="delivered",
+        labels={
+            "cep": "CEP",
+            "delivered": "Total de Entregas",
+            "dia_mes": "Data de Entrega",
+        },
+        color_continuous_scale="Electric",
+        text_auto=True,
+    )
+    fig2.update_xaxes(type="category", showgrid=True)
+    fig2.for_each_trace(
+        lambda t: t.update(hovertemplate=t.hovertemplate.replace("sum of", ""))
+    )
+    fig2.for_each_yaxis(
+        lambda a: a.update(title_text=a.title.text.replace("sum of", ""))
+    )
+    fig2.update_layout(bargap=0.1, xaxis=dict(tickformat="%a(%d)"))
+    return fig2
+
+
+def q3_state(dias, agrupar: str) -> list:
+    """Question 3 selections in spec form, to key the cached figure"""
+    return [("dia", "isin", dias), ("agrupar", "isin", (agrupar,))]
+
+
+def q3_horas(dfq3: pd.DataFrame, agrupar: str):
+    with stage("q3: caixas", dfq3) as s:
+        stats = s.out(sketch_box_stats(dfq3, agrupar, "horas_entrega"))
+    if agrupar == "dia":
+        stats.index = stats.index.date
+    fig = box_figure(
+        stats,
+        pd.DataFrame(),
+        agrupar,
+        "horas_entrega",
+        labels={"horas_entrega": "Horas", "dia": "Data de Entrega", "cep": "CEP"},
+    )
+    # Linhas de SLA
+    add_quantile_lines(fig, stats, ("p90", "p99"))
+    fig.update_xaxes(type="category", showgrid=True)
+    return fig
+
+
+def q4_horas_distancia(df: pd.DataFrame):
+    with stage("q4: células do heatmap", df) as s:
+        dfq5 = s.out(get_heatmap_cells(df, "cep", "distancia_rota", "horas_entrega"))
+
+    fig = heatmap_figure(
+        dfq5,
+        labels={"cep": "CEP", "distancia_rota": "Distância por Rota"},
+        color_scale="Electric",
+        z_title="avg of horas_entrega",
+    )
+    fig.update_xaxes(type="category", showgrid=True)
+    return fig
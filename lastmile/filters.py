@@ -0,0 +1,179 @@
+"""Motor de filtros: especificação declarativa compilada em uma única máscara.
+
+Uma especificação de filtro é uma tupla de condições ``(coluna, operação,
+valor)``:
+
+- ``("cep", "isin", ("859", "877"))``
+- ``("distancia", "between", (0.5, 12.0))``
+- ``("data_entrega", "between", (date(2022, 11, 1), date(2022, 11, 3)))``
+- ``("remessa", "contains", "11894")``
+
+``compile_mask`` avalia todas as condições sobre os arrays NumPy das colunas e
+as combina em uma máscara booleana; o dataframe é recortado uma única vez.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    is_bool_dtype,
+    is_datetime64_any_dtype,
+    is_numeric_dtype,
+)
+
+from lastmile import bitmap
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+CATEGORICAL_THRESHOLD = 10
+OPERATIONS = ("isin", "between", "contains")
+
+
+def column_kind(series: pd.Series, nunique: int) -> str:
+    """Widget kind used for a column: categorical, numeric, datetime or text"""
+    # Colunas com menos de 10 valores distintos são tratadas como categóricas
+    if isinstance(series.dtype, pd.CategoricalDtype) or nunique < CATEGORICAL_THRESHOLD:
+        return "categorical"
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        return "numeric"
+    if is_datetime64_any_dtype(series):
+        return "datetime"
+    return "text"
+
+
+def _unique_in_order(series: pd.Series) -> list:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = pd.unique(series.cat.codes.to_numpy())
+        codes = codes[codes >= 0]
+        return list(series.cat.categories.take(codes))
+    return list(pd.unique(series.to_numpy()))
+
+
+def column_stats(df: pd.DataFrame) -> dict:
+    """
+    Computes the per-column metadata used to build the filter widgets
+
+    Args:
+        df (pd.DataFrame): Dataframe to be filtered
+
+    Returns:
+        dict: ``{column: {"kind", "nunique", "min", "max", "values"}}``
+    """
+    stats = {}
+    for col in df.columns:
+        series = df[col]
+        nunique = int(series.nunique())
+        kind = column_kind(series, nunique)
+        entry = {"kind": kind, "nunique": nunique, "min": None, "max": None}
+        if kind == "categorical":
+            entry["values"] = _unique_in_order(series)
+        elif kind in ("numeric", "datetime"):
+            entry["min"], entry["max"] = series.min(), series.max()
+        stats[col] = entry
+    return stats
+
+
+def normalize_spec(spec) -> tuple:
+    """
+    Returns a canonical, hashable version of a filter spec
+
+    Conditions are sorted by column and ``isin`` values are sorted, so equal
+    selections made in different orders produce the same spec.
+    """
+    normalized = []
+    for column, op, value in spec:
+        if op not in OPERATIONS:
+            raise ValueError(f"Operação de filtro desconhecida: {op}")
+        if op == "isin":
+            value = tuple(sorted(value, key=str))
+        elif op == "between":
+            value = tuple(value)
+        normalized.append((column, op, value))
+    return tuple(sorted(normalized, key=lambda c: (c[0], c[1])))
+
+
+def day_bounds(lo, hi):
+    """Timestamps of a ``between`` range; a date-only ``hi`` covers its whole day"""
+    lo = pd.Timestamp(lo)
+    hi = pd.Timestamp(hi)
+    # Datas sem horário cobrem o dia inteiro
+    if hi == hi.normalize():
+        hi = hi + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+    return lo, hi
+
+
+def _between(values: np.ndarray, lo, hi) -> np.ndarray:
+    if numexpr is not None and values.dtype.kind == "f":
+        return numexpr.evaluate("(values >= lo) & (values <= hi)")
+    return (values >= lo) & (values <= hi)
+
+
+def _condition_mask(series: pd.Series, op: str, value) -> np.ndarray:
+    if op == "isin":
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Tabela por categoria indexada pelos códigos: O(linhas) sem hash
+            lut = np.append(series.cat.categories.isin(list(value)), False)
+            return lut[series.cat.codes.to_numpy()]
+        return series.isin(list(value)).to_numpy()
+
+    if op == "between":
+        lo, hi = value
+        if is_datetime64_any_dtype(series):
+            lo, hi = day_bounds(lo, hi)
+            values = series.to_numpy(dtype="datetime64[ns]").view("i8")
+            mask = _between(values, lo.value, hi.value)
+            return mask & ~series.isna().to_numpy()
+        return _between(series.to_numpy(dtype=float), float(lo), float(hi))
+
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories.astype(str)
+        lut = np.append(np.asarray(categories.str.contains(value), dtype=bool), False)
+        return lut[series.cat.codes.to_numpy()]
+    return series.astype(str).str.contains(value).to_numpy(dtype=bool)
+
+
+def compile_mask(df: pd.DataFrame, spec, index=None) -> np.ndarray:
+    """
+    Evaluates a filter spec as a single boolean mask
+
+    Args:
+        df (pd.DataFrame): Dataframe to be filtered
+        spec: Iterable of ``(column, op, value)`` conditions
+        index (dict): Optional ``bitmap.build_bitmap_index(df)``; ``isin``
+            conditions on indexed columns are answered from its bitsets
+
+    Returns:
+        np.ndarray: Boolean mask with one entry per row of ``df``
+    """
+    indexed, others = [], []
+    for column, op, value in spec:
+        if op == "isin" and index is not None and column in index:
+            indexed.append((column, value))
+        else:
+            others.append((column, op, value))
+
+    if indexed and index[indexed[0][0]]["n_rows"] == len(df):
+        mask = bitmap.bits_to_mask(bitmap.isin_bits(index, indexed), len(df))
+    else:
+        mask = np.ones(len(df), dtype=bool)
+        others = [(c, "isin", v) for c, v in indexed] + others
+    for column, op, value in others:
+        mask &= _condition_mask(df[column], op, value)
+    return mask
+
+
+def apply_filters(df: pd.DataFrame, spec, index=None) -> pd.DataFrame:
+    """
+    Returns the rows of ``df`` matching every condition of ``spec``
+
+    The dataframe is sliced once; with no effective condition it is returned
+    as is, without a copy.
+    """
+    if not spec:
+        return df
+    mask = compile_mask(df, spec, index)
+    if mask.all():
+        return df
+    return df[mask]
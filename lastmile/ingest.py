@@ -0,0 +1,204 @@
+"""Ingestão incremental de extratos diários na base particionada.
+
+Cada extrato novo (mesmo layout ``;`` do CSV original) é validado e tipado
+isoladamente, deduplicado por ``remessa`` contra o próprio lote e contra o
+histórico, e anexado apenas às partições dos dias que ele cobre. O custo de
+uma atualização depende do tamanho do lote, não do histórico.
+
+Uso::
+
+    python -m lastmile.ingest extrato_2022-12-01.csv [extrato_2022-12-02.csv ...]
+"""
+
+import argparse
+import importlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lastmile import store
+from lastmile.loader import CSV_DTYPES, CSV_SEP, read_csv, write_atomic
+
+REMESSA_INDEX_NAME = "_remessas.npy"
+REQUIRED_COLUMNS = ["codigo_rota", "rota_inicio", "data_entrega", "remessa"]
+
+# Resumos derivados atualizados a cada lote: f(novas_linhas, root, versao_anterior)
+SUMMARY_UPDATERS = []
+# Módulos que registram resumos, importados antes do primeiro lote
+SUMMARY_MODULES = ["lastmile.quantiles", "lastmile.precompute"]
+
+
+def register_summary(updater):
+    """
+    Registers a function called after each append
+
+    Can be used as a decorator. Updaters receive ``(new_rows, root,
+    previous_version)`` and must fold the new rows into their summary without
+    rescanning the stored history; a summary saved for a version other than
+    ``previous_version`` is stale and has to be rebuilt.
+    """
+    SUMMARY_UPDATERS.append(updater)
+    return updater
+
+
+def _load_summary_modules() -> None:
+    for name in SUMMARY_MODULES:
+        importlib.import_module(name)
+
+
+def validate_extract(path) -> pd.DataFrame:
+    """
+    Reads and types a daily extract, rejecting malformed files
+
+    Args:
+        path: CSV file in the ``dados_entregas_last_mile.csv`` layout
+
+    Raises:
+        ValueError: Missing columns or rows without route, dates or remessa
+
+    Returns:
+        pd.DataFrame: Typed rows of the extract
+    """
+    header = pd.read_csv(path, sep=CSV_SEP, nrows=0).columns
+    missing = [c for c in CSV_DTYPES if c not in header]
+    if missing:
+        raise ValueError(f"{path}: colunas ausentes: {', '.join(missing)}")
+
+    df = read_csv(path)
+    invalid = df[REQUIRED_COLUMNS].isna().any(axis=1)
+    if invalid.any():
+        raise ValueError(
+            f"{path}: {int(invalid.sum())} linhas sem "
+            f"{'/'.join(REQUIRED_COLUMNS)}"
+        )
+    return df
+
+
+def _remessa_hashes(remessas) -> np.ndarray:
+    return pd.util.hash_array(np.asarray(remessas, dtype=object))
+
+
+def _index_paths(root: Path):
+    return root / REMESSA_INDEX_NAME, root / f"{REMESSA_INDEX_NAME}.json"
+
+
+def _rebuild_remessa_index(root: Path) -> np.ndarray:
+    remessas = store.load_partitions(root, columns=["remessa"])["remessa"]
+    return np.unique(_remessa_hashes(remessas.astype(str)))
+
+
+def load_remessa_index(root=store.STORE_PATH) -> np.ndarray:
+    """
+    Returns the sorted hashes of every stored ``remessa``
+
+    The index is kept next to the manifest and rebuilt from the partitions
+    only when the store was written without going through this module.
+    """
+    root = Path(root)
+    index_path, meta_path = _index_paths(root)
+    try:
+        meta = json.loads(meta_path.read_text())
+        if meta["version"] == store.store_version(root):
+            return np.load(index_path, mmap_mode="r")
+    except (OSError, ValueError, KeyError):
+        pass
+    if not store.store_exists(root):
+        return np.empty(0, dtype=np.uint64)
+    return _rebuild_remessa_index(root)
+
+
+def _save_remessa_index(root: Path, index: np.ndarray) -> None:
+    index_path, meta_path = _index_paths(root)
+
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            np.save(f, index)
+
+    write_atomic(index_path, write)
+    write_atomic(
+        meta_path,
+        lambda tmp: tmp.write_text(json.dumps({"version": store.store_version(root)})),
+    )
+
+
+def append_rows(new: pd.DataFrame, root=store.STORE_PATH) -> pd.DataFrame:
+    """
+    Appends typed rows to the store, skipping already known ``remessa`` ids
+
+    Only the partitions of the days present in ``new`` are rewritten.
+
+    Args:
+        new (pd.DataFrame): Typed rows (``COLUMNS`` layout)
+        root: Store directory
+
+    Returns:
+        pd.DataFrame: Rows actually appended
+    """
+    root = Path(root)
+    _load_summary_modules()
+    index = load_remessa_index(root)
+
+    new = new.drop_duplicates("remessa").reset_index(drop=True)
+    hashes = _remessa_hashes(new["remessa"].astype(str))
+    known = np.zeros(len(new), dtype=bool)
+    if len(index):
+        pos = np.minimum(np.searchsorted(index, hashes), len(index) - 1)
+        known = index[pos] == hashes
+    new = new[~known].reset_index(drop=True)
+    if new.empty:
+        return new
+
+    days = new[store.PARTITION_COLUMN].dt.normalize()
+    existing = [
+        store.load_partitions(root, day, day)
+        for day in sorted(days.unique())
+        if store.select_partitions(root, day, day)
+    ]
+    merged = pd.concat(existing + [new], ignore_index=True)
+    for col in ["codigo_rota", "cep", "remessa"]:
+        merged[col] = merged[col].astype(str).astype("category")
+
+    previous_version = store.store_version(root)
+    store.write_partitions(merged, root)
+    _save_remessa_index(root, np.union1d(index, hashes[~known]))
+
+    for updater in SUMMARY_UPDATERS:
+        updater(new, root, previous_version)
+    return new
+
+
+def ingest_extract(path, root=store.STORE_PATH) -> pd.DataFrame:
+    """
+    Validates a daily extract and appends its new rows to the store
+
+    Args:
+        path: CSV file in the ``dados_entregas_last_mile.csv`` layout
+        root: Store directory
+
+    Returns:
+        pd.DataFrame: Rows actually appended
+    """
+    return append_rows(validate_extract(path), root)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Anexa extratos diários à base particionada"
+    )
+    parser.add_argument("extratos", nargs="+")
+    parser.add_argument("--destino", default=str(store.STORE_PATH))
+    args = parser.parse_args(argv)
+
+    for path in args.extratos:
+        added = ingest_extract(path, args.destino)
+        print(f"{path}: {len(added)} remessas novas")
+
+
+if __name__ == "__main__":
+    # Os resumos se registram em ``lastmile.ingest``; rodando como script este
+    # módulo é ``__main__``, com outra lista de atualizadores
+    from lastmile.ingest import main
+
+    main()
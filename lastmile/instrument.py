@@ -0,0 +1,336 @@
+"""Medição por etapa de cada execução das páginas.
+
+As páginas abrem uma execução com ``start_run`` e envolvem cada etapa
+(``get_data``, filtros, agregações, montagem das figuras, ``st.plotly_chart``)
+em ``stage``, um gerenciador de contexto que registra tempo de parede, tempo
+de CPU da thread, linhas de entrada e saída e, com
+``LASTMILE_TRACEMALLOC=1``, o pico de memória alocada. Etapas podem ser
+aninhadas. ``staged`` faz o mesmo como decorador; ``attach`` leva a medição
+para threads que trabalham para a execução.
+
+Com ``LASTMILE_STAGE_LOG`` apontando para um arquivo (por exemplo
+``logs/etapas.jsonl``), ``finish_run`` acrescenta nele uma linha JSON por
+etapa. O arquivo é rotacionado ao passar de ``LASTMILE_STAGE_LOG_MB`` (50 MB)
+e ficam ``LOG_BACKUPS`` arquivos anteriores; sem a variável não há log. Uma
+execução também pode ser perfilada com cProfile ou, se instalado,
+pyinstrument.
+
+O ``tracemalloc`` rastreia o processo inteiro: com várias sessões rodando ao
+mesmo tempo, o pico de uma etapa inclui o que as outras alocaram nela.
+"""
+
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+LOG_PATH = os.environ.get("LASTMILE_STAGE_LOG", "")
+LOG_MAX_BYTES = int(os.environ.get("LASTMILE_STAGE_LOG_MB", "50")) * 2**20
+LOG_BACKUPS = 3
+TRACE_MEMORY = os.environ.get("LASTMILE_TRACEMALLOC", "") == "1"
+PROFILE_LINES = 40
+
+_local = threading.local()
+_log_lock = threading.Lock()
+_log_handlers = {}
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+def profilers() -> list:
+    """Profilers available in this environment"""
+    return ["cProfile"] + (["pyinstrument"] if pyinstrument is not None else [])
+
+
+def _rows(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    return None
+
+
+def _row_count(rows_in):
+    # Dataframe/série de entrada ou o número de linhas já contado
+    return rows_in if isinstance(rows_in, int) or rows_in is None else _rows(rows_in)
+
+
+class Stage:
+    """Measurements of one stage of a run"""
+
+    def __init__(self, name: str, depth: int, rows_in=None, parent=None):
+        self.name = name
+        self.depth = depth
+        self.parent = parent
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.wall = None
+        self.cpu = None
+        self.peak = None
+        self.error = None
+        # Maior pico absoluto (bytes) visto pelas etapas internas
+        self._child_peak = 0
+
+    def out(self, obj):
+        """Records the rows of ``obj`` as the stage output and returns it"""
+        self.rows_out = _rows(obj)
+        return obj
+
+    def record(self) -> dict:
+        return {
+            "etapa": self.name,
+            "nivel": self.depth,
+            "parede_s": self.wall,
+            "cpu_s": self.cpu,
+            "pico_mb": None if self.peak is None else self.peak / 2**20,
+            "linhas_entrada": self.rows_in,
+            "linhas_saida": self.rows_out,
+            "erro": self.error,
+        }
+
+
+class Run:
+    """
+    Stages measured during one execution of a page script
+
+    Args:
+        page (str): Page name, written to the log
+        profiler (str): ``"cProfile"``, ``"pyinstrument"`` or ``None``
+    """
+
+    def __init__(self, page: str, profiler=None):
+        self.page = page
+        self.id = uuid.uuid4().hex[:12]
+        self.started = time.time()
+        self.stages = []
+        self.profile = None
+        self.finished = False
+        # Pilha de etapas abertas de cada thread que mede para esta execução
+        self._stacks = {}
+        self._profiler = None
+        if profiler == "cProfile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif profiler == "pyinstrument" and pyinstrument is not None:
+            self._profiler = pyinstrument.Profiler()
+            self._profiler.start()
+
+    @property
+    def _stack(self) -> list:
+        return self._stacks.setdefault(threading.get_ident(), [])
+
+    def stop_profiler(self):
+        """Stops the profiler and keeps its report as text"""
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            out = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=out)
+            stats.sort_stats("cumulative").print_stats(PROFILE_LINES)
+            self.profile = out.getvalue()
+        elif self._profiler is not None:
+            self._profiler.stop()
+            self.profile = self._profiler.output_text(unicode=True)
+        self._profiler = None
+        return self.profile
+
+    def open_stage(self, name: str, rows_in=None) -> Stage:
+        """
+        Adds a stage measured by the caller instead of a ``with`` block
+
+        The stage nests under the one open in the current thread but is not
+        pushed onto its stack, so this thread's next stages do not nest under
+        it; work in other threads ``attach``-ed to it does.
+        """
+        parent = self._stack[-1] if self._stack else None
+        depth = 0 if parent is None else parent.depth + 1
+        current = Stage(name, depth, _row_count(rows_in), parent)
+        self.stages.append(current)
+        return current
+
+    def ordered(self) -> list:
+        """Stages depth-first, each one after the stage containing it"""
+        children = {}
+        for s in list(self.stages):
+            children.setdefault(id(s.parent), []).append(s)
+
+        def walk(parent):
+            for s in children.get(id(parent), []):
+                yield s
+                yield from walk(s)
+
+        return list(walk(None))
+
+    def frame(self) -> pd.DataFrame:
+        """Stages as a table, in the order they started, nested depth-first"""
+        return pd.DataFrame([s.record() for s in self.ordered()])
+
+
+def start_run(page: str, profiler=None) -> Run:
+    """Starts measuring an execution of ``page`` in the current thread"""
+    run = Run(page, profiler)
+    _local.run = run
+    return run
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+@contextmanager
+def attach(run: Run, parent: Stage = None):
+    """
+    Records the stages of the current thread into ``run``
+
+    For work submitted to other threads: their stages nest under ``parent``,
+    a stage of ``run`` from ``Run.open_stage``. The thread's previous run and
+    stages are restored on exit.
+    """
+    previous = current_run()
+    ident = threading.get_ident()
+    stack = None if run is None else run._stacks.get(ident)
+    _local.run = run
+    if run is not None:
+        run._stacks[ident] = [] if parent is None else [parent]
+    try:
+        yield
+    finally:
+        if run is not None:
+            if stack is None:
+                run._stacks.pop(ident, None)
+            else:
+                run._stacks[ident] = stack
+        _local.run = previous
+
+
+@contextmanager
+def stage(name: str, rows_in=None):
+    """
+    Measures the block as a stage of the current run
+
+    Args:
+        name (str): Stage name
+        rows_in: Input dataframe (its length is recorded) or row count
+
+    Yields:
+        Stage: Call ``.out(result)`` to record the output rows
+    """
+    run = current_run()
+    rows = _row_count(rows_in)
+    if run is None:
+        yield Stage(name, 0, rows)
+        return
+
+    parent = run._stack[-1] if run._stack else None
+    depth = 0 if parent is None else parent.depth + 1
+    current = Stage(name, depth, rows, parent)
+    run.stages.append(current)
+    run._stack.append(current)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        base, peak = tracemalloc.get_traced_memory()
+        # O pico da etapa externa até aqui se perderia com o reset
+        if parent is not None:
+            parent._child_peak = max(parent._child_peak, peak)
+        tracemalloc.reset_peak()
+    wall = time.perf_counter()
+    cpu = time.thread_time()
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = type(exc).__name__
+        raise
+    finally:
+        current.wall = time.perf_counter() - wall
+        current.cpu = time.thread_time() - cpu
+        run._stack.pop()
+        if tracing:
+            peak = max(tracemalloc.get_traced_memory()[1], current._child_peak)
+            current.peak = max(peak - base, 0)
+            if parent is not None:
+                parent._child_peak = max(parent._child_peak, peak)
+
+
+def staged(name=None):
+    """
+    Decorator measuring each call as a stage; the first dataframe argument
+    counts as input and a dataframe result as output
+    """
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            frames = [a for a in args if isinstance(a, pd.DataFrame)]
+            with stage(label, frames[0] if frames else None) as current:
+                return current.out(func(*args, **kwargs))
+
+        return wrapper
+
+    return decorate
+
+
+def _log_handler(path: Path, max_bytes: int) -> RotatingFileHandler:
+    # Um handler por arquivo no processo; o lock dele serializa as threads
+    with _log_lock:
+        handler = _log_handlers.get((path, max_bytes))
+        if handler is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path, maxBytes=max_bytes, backupCount=LOG_BACKUPS, encoding="utf-8"
+            )
+            _log_handlers[(path, max_bytes)] = handler
+        return handler
+
+
+def write_log(run: Run, path=LOG_PATH, max_bytes=LOG_MAX_BYTES) -> None:
+    """
+    Appends one JSON line per stage of ``run`` to ``path``
+
+    The file is rotated past ``max_bytes``, keeping ``LOG_BACKUPS`` old
+    files. Nothing is written when ``path`` is empty.
+    """
+    if not path:
+        return
+    handler = _log_handler(Path(path), max_bytes)
+    header = {
+        "execucao": run.id,
+        "pagina": run.page,
+        "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(run.started)),
+        "pid": os.getpid(),
+    }
+    for s in run.ordered():
+        line = json.dumps({**header, **s.record()}, ensure_ascii=False)
+        handler.handle(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+
+
+def finish_run(run: Run, path=LOG_PATH) -> Run:
+    """
+    Stops the profiler, writes the log and detaches the run from the thread
+
+    Only the first call for a run has an effect.
+    """
+    if run.finished:
+        return run
+    run.finished = True
+    run.stop_profiler()
+    write_log(run, path)
+    if current_run() is run:
+        _local.run = None
+    return run
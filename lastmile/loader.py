@@ -0,0 +1,246 @@
+"""Carga tipada da base de entregas last-mile.
+
+O CSV é lido uma única vez com um schema declarado e o resultado é salvo em um
+snapshot Feather (Arrow IPC, sem compressão) ao lado dos dados. Cargas
+seguintes, inclusive de outros processos do servidor, mapeiam o snapshot em
+memória e não tocam no CSV.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+DATA_PATH = Path(os.environ.get("LASTMILE_DATA", "data/dados_entregas_last_mile.csv"))
+CACHE_DIR_NAME = ".cache"
+SNAPSHOT_VERSION = 1
+
+CSV_SEP = ";"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Tipos declarados das colunas do CSV, na ordem do arquivo
+CSV_DTYPES = {
+    "codigo_rota": "string",
+    "status_tracking": "string",
+    "rota_inicio": "string",
+    "rota_final": "string",
+    "hora_entrega": "string",
+    "sq_plan": "int64",
+    "cep": "string",
+    "distancia": "float64",
+    "distancia_rota": "float64",
+    "remessa": "string",
+    "transportadora": "string",
+    "veiculo": "string",
+}
+DATETIME_COLUMNS = ["rota_inicio", "rota_final", "hora_entrega"]
+CATEGORICAL_COLUMNS = ["codigo_rota", "cep", "remessa"]
+RENAMED_COLUMNS = {"status_tracking": "delivered", "hora_entrega": "data_entrega"}
+
+COLUMNS = [
+    "codigo_rota",
+    "sq_plan",
+    "delivered",
+    "rota_inicio",
+    "rota_final",
+    "horas_rota",
+    "data_entrega",
+    "horas_entrega",
+    "cep",
+    "distancia",
+    "distancia_rota",
+    "remessa",
+    "transportadora",
+    "veiculo",
+]
+
+
+def _hours_between(start: pd.Series, end: pd.Series) -> pd.Series:
+    return np.round((end - start).dt.seconds / (60 * 60), 2)
+
+
+def parse_deliveries(raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    Applies the declared schema to raw rows read from the CSV
+
+    Args:
+        raw (pd.DataFrame): Rows read with ``CSV_DTYPES``
+
+    Returns:
+        pd.DataFrame: Typed dataframe with the derived columns, in ``COLUMNS`` order
+    """
+    df = raw.copy()
+
+    for col in DATETIME_COLUMNS:
+        df[col] = pd.to_datetime(df[col], format=DATETIME_FORMAT)
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype(str).astype("category")
+    df["transportadora"] = df["transportadora"].astype(object)
+    df["veiculo"] = df["veiculo"].astype(object)
+    df["status_tracking"] = np.where(df["status_tracking"] == "Delivered", 1, 0)
+    df = df.rename(columns=RENAMED_COLUMNS)
+
+    df["horas_entrega"] = _hours_between(df["rota_inicio"], df["data_entrega"])
+    df["horas_rota"] = _hours_between(df["rota_inicio"], df["rota_final"])
+
+    return df[COLUMNS].reset_index(drop=True)
+
+
+def empty_deliveries() -> pd.DataFrame:
+    """Typed dataframe with no rows, in ``COLUMNS`` order"""
+    return parse_deliveries(
+        pd.DataFrame({col: pd.Series(dtype=t) for col, t in CSV_DTYPES.items()})
+    )
+
+
+def read_csv(path=DATA_PATH) -> pd.DataFrame:
+    """
+    Reads and types a ``;``-separated delivery extract
+
+    Args:
+        path: CSV file in the ``dados_entregas_last_mile.csv`` layout
+
+    Returns:
+        pd.DataFrame: Typed dataframe
+    """
+    raw = pd.read_csv(
+        path, sep=CSV_SEP, dtype=CSV_DTYPES, usecols=list(CSV_DTYPES)
+    )
+    return parse_deliveries(raw)
+
+
+def file_digest(path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_paths(path: Path):
+    cache_dir = path.parent / CACHE_DIR_NAME
+    return cache_dir, cache_dir / f"{path.stem}.json"
+
+
+def write_atomic(target: Path, write) -> None:
+    """
+    Writes ``target`` through a temporary file in the same directory
+
+    ``write`` receives the temporary path; the file then replaces ``target``
+    in one ``os.replace``, so readers never see it half written.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    try:
+        write(tmp)
+        os.replace(tmp, target)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def snapshot_key(path=DATA_PATH) -> dict:
+    """
+    Returns the cache key (size, mtime and SHA-1) of a CSV file
+
+    The hash is only recomputed when size or mtime differ from the ones
+    recorded next to the current snapshot.
+    """
+    path = Path(path)
+    stat = path.stat()
+    key = {
+        "version": SNAPSHOT_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    _, meta_path = _cache_paths(path)
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        meta = {}
+    if all(meta.get(k) == v for k, v in key.items()) and "sha1" in meta:
+        key["sha1"] = meta["sha1"]
+    else:
+        key["sha1"] = file_digest(path)
+    return key
+
+
+def _snapshot_path(path: Path, key: dict) -> Path:
+    cache_dir, _ = _cache_paths(path)
+    return cache_dir / f"{path.stem}-v{key['version']}-{key['sha1'][:16]}.feather"
+
+
+def read_snapshot(snapshot) -> pd.DataFrame:
+    table = feather.read_table(snapshot, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def write_snapshot(df: pd.DataFrame, path=DATA_PATH, key=None) -> Path:
+    """
+    Stores ``df`` as the snapshot of ``path`` and records its key
+
+    Args:
+        df (pd.DataFrame): Typed dataframe built from ``path``
+        path: Source CSV file
+        key (dict): Cache key; computed from ``path`` when omitted
+
+    Returns:
+        Path: Snapshot file
+    """
+    path = Path(path)
+    key = key or snapshot_key(path)
+    cache_dir, meta_path = _cache_paths(path)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    snapshot = _snapshot_path(path, key)
+
+    write_atomic(
+        snapshot,
+        lambda tmp: feather.write_feather(df, tmp, compression="uncompressed"),
+    )
+    write_atomic(meta_path, lambda tmp: tmp.write_text(json.dumps(key)))
+
+    # Remove snapshots de versões anteriores do mesmo CSV
+    for old in cache_dir.glob(f"{path.stem}-v*.feather"):
+        if old != snapshot:
+            old.unlink(missing_ok=True)
+    return snapshot
+
+
+def load_deliveries(path=DATA_PATH, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Loads the typed delivery dataframe, reusing the Feather snapshot if valid
+
+    Args:
+        path: Source CSV file
+        use_cache (bool): Read/write the snapshot next to the data
+
+    Returns:
+        pd.DataFrame: Typed dataframe in ``COLUMNS`` order
+    """
+    path = Path(path)
+    if not use_cache:
+        return read_csv(path)
+
+    key = snapshot_key(path)
+    snapshot = _snapshot_path(path, key)
+    if snapshot.exists():
+        try:
+            return read_snapshot(snapshot)
+        except Exception:
+            pass
+
+    df = read_csv(path)
+    try:
+        write_snapshot(df, path, key)
+    except OSError:
+        pass
+    return df
+
+
+def dataset_version(path=DATA_PATH) -> str:
+    """Short identifier of the current contents of ``path``"""
+    return snapshot_key(path)["sha1"][:16]
@@ -0,0 +1,328 @@
+"""Teste de carga das páginas sem navegador, com ``streamlit.testing.v1.AppTest``.
+
+Cada usuário simulado é um processo que abre as páginas e repete sessões
+roteirizadas: adiciona filtros, muda intervalos de datas, marca "Mostrar
+Dataframe" e "Filtrar Dados", troca agrupamentos e busca remessas. Cada
+``run()`` do AppTest é uma reexecução do script da página, como a que o
+servidor faz a cada interação; o tempo de cada uma e o RSS do processo ao
+fim das sessões são medidos. Como cada processo tem seus próprios caches,
+a primeira abertura de cada página paga a carga fria.
+
+As páginas leem a base sintética do tamanho pedido (``lastmile.synthetic``,
+a mesma dos benchmarks) via ``LASTMILE_DATA``; ``LASTMILE_STORE`` aponta para
+um diretório vazio, para que uma base particionada em ``data/entregas`` não
+seja servida no lugar dela. Uso::
+
+    python -m lastmile.loadtest [--linhas 10000 100000] [--usuarios 4] [--sessoes 3]
+"""
+
+import argparse
+import datetime as dt
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lastmile import bench
+from lastmile.memory import process_rss
+
+HOME = Path("Renner_lastmile.py")
+PAGES_DIR = Path("pages")
+SIZES = [10_000, 100_000]
+RUN_TIMEOUT = 300
+PERCENTILES = (50, 95, 99)
+
+
+def _widget(at, kind: str, label: str):
+    # Primeiro widget do tipo com o rótulo, ou None se a página não o mostra
+    for widget in getattr(at, kind):
+        if widget.label == label:
+            return widget
+    return None
+
+
+def _add_filter(label: str, column: str):
+    def step(at):
+        selector = _widget(at, "multiselect", label)
+        if selector is None or column in selector.value:
+            return False
+        selector.set_value([*selector.value, column])
+        return True
+
+    return step
+
+
+def _pick_values(column: str, keep: int):
+    def step(at):
+        values = _widget(at, "multiselect", f"Valores para {column}")
+        if values is None or len(values.options) <= keep:
+            return False
+        values.set_value(values.options[:keep])
+        return True
+
+    return step
+
+
+def _narrow_slider(column: str):
+    def step(at):
+        slider = _widget(at, "slider", f"Valores para {column}")
+        if slider is None:
+            return False
+        lo, hi = slider.value
+        slider.set_range(lo, lo + (hi - lo) / 4)
+        return True
+
+    return step
+
+
+def _first_week(label: str):
+    def step(at):
+        date = _widget(at, "date_input", label)
+        if date is None or not isinstance(date.value, tuple) or len(date.value) < 2:
+            return False
+        start = date.value[0]
+        date.set_value((start, start + dt.timedelta(days=6)))
+        return True
+
+    return step
+
+
+def _toggle(label: str):
+    def step(at):
+        checkbox = _widget(at, "checkbox", label)
+        if checkbox is None:
+            return False
+        checkbox.set_value(not checkbox.value)
+        return True
+
+    return step
+
+
+def _choose(kind: str, label: str, option):
+    def step(at):
+        widget = _widget(at, kind, label)
+        if widget is None:
+            return False
+        widget.set_value(option)
+        return True
+
+    return step
+
+
+def _search(text: str):
+    def step(at):
+        box = _widget(at, "text_input", "Remessa")
+        if box is None:
+            return False
+        box.input(text)
+        return True
+
+    return step
+
+
+def _sidebar_period(at):
+    # Só existe com a base particionada ou o backend duckdb
+    date = _widget(at.sidebar, "date_input", "Período das entregas")
+    if date is None or not isinstance(date.value, tuple) or len(date.value) < 2:
+        return False
+    start = date.value[0]
+    date.set_value((start, start + dt.timedelta(days=6)))
+    return True
+
+
+# Sessões roteirizadas: (ação, passo) por página; passos que não encontram o
+# widget são pulados
+SESSIONS = {
+    HOME: [],
+    PAGES_DIR
+    / "1_Sobre_os_dados.py": [
+        ("período", _sidebar_period),
+        ("filtro cep", _add_filter("Filtros:", "cep")),
+        ("valores cep", _pick_values("cep", 5)),
+        ("filtro data", _add_filter("Filtros:", "data_entrega")),
+        ("datas", _first_week("Valores para data_entrega")),
+        ("dataframe completo", _toggle("Visualizar Dataframe Completo")),
+    ],
+    PAGES_DIR
+    / "2_Gráficos.py": [
+        ("mostrar dataframe", _toggle("Mostrar Dataframe")),
+        ("filtro distância", _add_filter("Filtrar dados:", "distancia")),
+        ("faixa distância", _narrow_slider("distancia")),
+        ("filtro data", _add_filter("Filtrar dados:", "data_entrega")),
+        ("datas", _first_week("Valores para data_entrega")),
+        ("spearman", _choose("radio", "Correlação", "Spearman (postos)")),
+        ("esconder dataframe", _toggle("Mostrar Dataframe")),
+    ],
+    PAGES_DIR
+    / "3_Propostas.py": [
+        ("filtrar dados", _toggle("Filtrar Dados")),
+        ("datas", _first_week("Data")),
+        ("agrupar por cep", _choose("radio", "Agrupar por", "CEP")),
+        ("agrupar por dia", _choose("radio", "Agrupar por", "Dia")),
+        ("parar de filtrar", _toggle("Filtrar Dados")),
+    ],
+    PAGES_DIR / "4_Ferramentas.py": [],
+    PAGES_DIR
+    / "5_Rastreio.py": [
+        ("busca", _search("118")),
+        ("prefixo", _choose("selectbox", "Tipo de busca", "Prefixo")),
+    ],
+}
+
+
+def _timed_run(at) -> float:
+    start = time.perf_counter()
+    at.run(timeout=RUN_TIMEOUT)
+    return time.perf_counter() - start
+
+
+def replay(page: Path) -> list:
+    """
+    Opens ``page`` in a fresh session and replays its scripted steps
+
+    Returns:
+        list: ``(action, seconds, exceptions)`` per rerun
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(page.resolve()), default_timeout=RUN_TIMEOUT)
+    timings = [("abertura", _timed_run(at), len(at.exception))]
+    for action, step in SESSIONS[page]:
+        if step(at):
+            timings.append((action, _timed_run(at), len(at.exception)))
+    return timings
+
+
+def simulate_user(user: int, sessions: int, seed: int = 0) -> dict:
+    """
+    One simulated analyst: ``sessions`` rounds over every page, in a random
+    order per round
+
+    Returns:
+        dict: ``reruns`` (page, action, seconds, exceptions), final ``rss``
+        and peak ``max_rss`` of the process in bytes
+    """
+    from streamlit import logger
+
+    # Avisos do Streamlit repetidos a cada reexecução só poluem o relatório
+    logger.set_log_level("error")
+    rng = random.Random(seed * 1000 + user)
+    pages = list(SESSIONS)
+    reruns = []
+    for _ in range(sessions):
+        rng.shuffle(pages)
+        for page in pages:
+            reruns += [(page.stem, *timing) for timing in replay(page)]
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "reruns": reruns,
+        "rss": process_rss(),
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        "max_rss": peak if sys.platform == "darwin" else peak * 1024,
+    }
+
+
+def percentiles(seconds) -> dict:
+    values = np.percentile(seconds, PERCENTILES) if len(seconds) else [np.nan] * 3
+    return {f"p{p}": v for p, v in zip(PERCENTILES, values)}
+
+
+def load_test(rows: int, users: int, sessions: int, seed: int = 0) -> tuple:
+    """
+    Runs ``users`` simulated analysts in parallel on a dataset of ``rows``
+
+    Returns:
+        tuple: Rerun table (one row per rerun) and per-user memory table
+    """
+    csv = bench.dataset(rows, seed)
+    with tempfile.TemporaryDirectory() as no_store:
+        # Os processos novos (spawn) importam a camada de dados com esta base
+        environment = {"LASTMILE_DATA": str(csv), "LASTMILE_STORE": no_store}
+        previous = {name: os.environ.get(name) for name in environment}
+        os.environ.update(environment)
+        try:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(users, mp_context=context) as pool:
+                futures = [
+                    pool.submit(simulate_user, user, sessions, seed)
+                    for user in range(users)
+                ]
+                results = [f.result() for f in futures]
+        finally:
+            for name, value in previous.items():
+                if value is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = value
+
+    reruns = pd.DataFrame(
+        [(user, *r) for user, res in enumerate(results) for r in res["reruns"]],
+        columns=["usuario", "pagina", "acao", "segundos", "excecoes"],
+    )
+    memory = pd.DataFrame(
+        {
+            "usuario": range(users),
+            "rss_mb": [r["rss"] / 2**20 for r in results],
+            "pico_rss_mb": [r["max_rss"] / 2**20 for r in results],
+        }
+    )
+    return reruns, memory
+
+
+def summarize(reruns: pd.DataFrame, by=None) -> pd.DataFrame:
+    """Rerun count and latency percentiles, overall or per ``by``"""
+    groups = [("total", reruns)] if by is None else reruns.groupby(by)
+    return pd.DataFrame(
+        [
+            {"grupo": key, "reruns": len(g), **percentiles(g["segundos"])}
+            for key, g in groups
+        ]
+    ).set_index("grupo")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Mede a latência das reexecuções das páginas sob carga"
+    )
+    parser.add_argument("--linhas", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--usuarios", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sessoes", type=int, default=3)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--por-acao", action="store_true")
+    args = parser.parse_args(argv)
+
+    summary = []
+    for rows in args.linhas:
+        start = time.perf_counter()
+        reruns, memory = load_test(rows, args.usuarios, args.sessoes, args.semente)
+        elapsed = time.perf_counter() - start
+        print(f"\n== {rows} linhas, {args.usuarios} usuários, {elapsed:.1f}s ==")
+        by = ["pagina", "acao"] if args.por_acao else "pagina"
+        print(summarize(reruns, by).round(3).to_string())
+        failed = int((reruns["excecoes"] > 0).sum())
+        if failed:
+            print(f"{failed} reexecuções com exceção")
+        summary.append(
+            {
+                "linhas": rows,
+                "usuarios": args.usuarios,
+                **summarize(reruns).iloc[0].to_dict(),
+                "reruns/s": len(reruns) / elapsed,
+                "rss_mb (soma)": memory["rss_mb"].sum(),
+                "pico_rss_mb (máx)": memory["pico_rss_mb"].max(),
+            }
+        )
+    print("\n== resumo ==")
+    print(pd.DataFrame(summary).set_index("linhas").round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Busca de remessas por código exato, prefixo ou trecho.
+
+O índice é montado uma vez por versão da base e contém três estruturas:
+
+- hash: hashes de 64 bits das remessas, ordenados, para busca exata;
+- ordenado: as remessas como bytes (``S``) em ordem lexicográfica, para busca
+  por prefixo com duas buscas binárias;
+- n-gramas: listas invertidas (formato CSR) de trigramas de caracteres, para
+  busca por trecho. Os candidatos saem da interseção das listas e são
+  confirmados no array de bytes, sem materializar strings de toda a coluna.
+"""
+
+import numpy as np
+import pandas as pd
+
+NGRAM = 3
+MODES = ("auto", "exact", "prefix", "substring")
+TRAIL_COLUMNS = [
+    "remessa",
+    "codigo_rota",
+    "sq_plan",
+    "rota_inicio",
+    "data_entrega",
+    "rota_final",
+    "cep",
+    "distancia",
+    "transportadora",
+    "veiculo",
+]
+
+
+def _hashes(remessas: np.ndarray) -> np.ndarray:
+    return pd.util.hash_array(remessas.astype(object))
+
+
+def _as_bytes(values) -> np.ndarray:
+    return np.asarray(pd.Series(values).astype(str).str.encode("ascii"), dtype="S")
+
+
+def _gram_ids(codes: np.ndarray) -> np.ndarray:
+    """Trigram ids (one column per position) from a ``(rows, width)`` byte matrix"""
+    codes = codes.astype(np.int64)
+    ids = (codes[:, :-2] << 16) | (codes[:, 1:-1] << 8) | codes[:, 2:]
+    # Trigramas que passam do fim da string (bytes nulos) não são indexados
+    ids[(codes[:, :-2] == 0) | (codes[:, 1:-1] == 0) | (codes[:, 2:] == 0)] = -1
+    return ids
+
+
+def build_lookup_index(remessas) -> dict:
+    """
+    Builds the exact, prefix and n-gram indexes of a ``remessa`` column
+
+    Args:
+        remessas: ``remessa`` values, one per row of the dataframe
+
+    Returns:
+        dict: Index structures; row numbers refer to positions in ``remessas``
+    """
+    raw = _as_bytes(remessas)
+    n_rows = len(raw)
+
+    hashes = _hashes(raw)
+    hash_order = np.argsort(hashes, kind="stable")
+
+    sorted_order = np.argsort(raw, kind="stable")
+
+    width = raw.dtype.itemsize
+    if width >= NGRAM and n_rows:
+        ids = _gram_ids(raw.view(np.uint8).reshape(n_rows, width))
+        rows = np.repeat(np.arange(n_rows, dtype=np.uint32), ids.shape[1])
+        ids = ids.ravel()
+        keep = ids >= 0
+        # Par (trigrama, linha) em uma chave só: trigrama nos 32 bits altos
+        pairs = np.unique((ids[keep] << 32) | rows[keep].astype(np.int64))
+        pair_grams = pairs >> 32
+        postings = (pairs & 0xFFFFFFFF).astype(np.uint32)
+        starts = np.flatnonzero(np.r_[True, pair_grams[1:] != pair_grams[:-1]])
+        grams = pair_grams[starts]
+        offsets = np.append(starts, len(postings))
+    else:
+        grams = np.empty(0, dtype=np.int64)
+        offsets = np.zeros(1, dtype=np.int64)
+        postings = np.empty(0, dtype=np.uint32)
+
+    return {
+        "raw": raw,
+        "hashes": hashes[hash_order],
+        "hash_rows": hash_order,
+        "sorted": raw[sorted_order],
+        "sorted_rows": sorted_order,
+        "grams": grams,
+        "offsets": offsets,
+        "postings": postings,
+    }
+
+
+def find_exact(index: dict, remessa: str) -> np.ndarray:
+    """Rows whose ``remessa`` is exactly ``remessa``"""
+    key = _as_bytes([remessa])
+    h = _hashes(key)[0]
+    lo = np.searchsorted(index["hashes"], h, side="left")
+    hi = np.searchsorted(index["hashes"], h, side="right")
+    rows = index["hash_rows"][lo:hi]
+    # Confirma contra colisões de hash
+    return np.sort(rows[index["raw"][rows] == key[0]])
+
+
+def find_prefix(index: dict, prefix: str) -> np.ndarray:
+    """Rows whose ``remessa`` starts with ``prefix``"""
+    key = _as_bytes([prefix])[0]
+    lo = np.searchsorted(index["sorted"], key, side="left")
+    # Maior chave com esse prefixo: o prefixo seguido de 0xFF
+    hi = np.searchsorted(index["sorted"], key + b"\xff", side="right")
+    return np.sort(index["sorted_rows"][lo:hi])
+
+
+def _postings(index: dict, gram: int) -> np.ndarray:
+    pos = np.searchsorted(index["grams"], gram)
+    if pos == len(index["grams"]) or index["grams"][pos] != gram:
+        return np.empty(0, dtype=np.uint32)
+    return index["postings"][index["offsets"][pos] : index["offsets"][pos + 1]]
+
+
+def find_substring(index: dict, text: str) -> np.ndarray:
+    """Rows whose ``remessa`` contains ``text``"""
+    key = _as_bytes([text])[0]
+    if len(key) < NGRAM:
+        # Trechos curtos demais para os trigramas: varre o array de bytes
+        return np.flatnonzero(np.char.find(index["raw"], key) >= 0)
+
+    codes = np.frombuffer(key, dtype=np.uint8)[None, :]
+    lists = sorted(
+        (_postings(index, g) for g in np.unique(_gram_ids(codes))),
+        key=len,
+    )
+    candidates = lists[0]
+    for rows in lists[1:]:
+        if not len(candidates):
+            break
+        candidates = np.intersect1d(candidates, rows, assume_unique=True)
+    candidates = candidates.astype(np.int64)
+    return candidates[np.char.find(index["raw"][candidates], key) >= 0]
+
+
+def search_remessa(index: dict, query: str, mode: str = "auto") -> np.ndarray:
+    """
+    Finds the rows matching ``query``
+
+    Args:
+        index (dict): Output of ``build_lookup_index``
+        query (str): Full id, prefix or fragment of a ``remessa``
+        mode (str): ``exact``, ``prefix``, ``substring`` or ``auto`` (exact
+            match first, then prefix, then substring)
+
+    Returns:
+        np.ndarray: Sorted row positions
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo de busca desconhecido: {mode}")
+    query = query.strip()
+    # As remessas são ASCII: um texto com outros caracteres não casa com nenhuma
+    if not query or not query.isascii():
+        return np.empty(0, dtype=np.int64)
+    if mode == "exact":
+        return find_exact(index, query)
+    if mode == "prefix":
+        return find_prefix(index, query)
+    if mode == "substring":
+        return find_substring(index, query)
+
+    for find in (find_exact, find_prefix, find_substring):
+        rows = find(index, query)
+        if len(rows):
+            return rows
+    return rows
+
+
+def delivery_trail(df: pd.DataFrame, rows, limit: int = None) -> pd.DataFrame:
+    """
+    Returns route, sequence, timestamps and CEP of the given rows
+
+    Args:
+        df (pd.DataFrame): Dataframe the index was built from
+        rows: Row positions returned by the search functions
+        limit (int): Maximum number of rows
+
+    Returns:
+        pd.DataFrame: ``TRAIL_COLUMNS`` of the matching deliveries
+    """
+    rows = np.asarray(rows)[:limit]
+    columns = [c for c in TRAIL_COLUMNS if c in df]
+    return df.iloc[rows][columns].sort_values(["remessa", "data_entrega"])
+
+
+def route_trail(df: pd.DataFrame, codigo_rota) -> pd.DataFrame:
+    """Every stop of a route, in delivery order"""
+    columns = [c for c in TRAIL_COLUMNS if c in df]
+    route = df[df["codigo_rota"] == codigo_rota]
+    return route[columns].sort_values("data_entrega")
@@ -0,0 +1,81 @@
+"""Contabilidade de memória por sessão.
+
+Separa, para cada dataframe de uma página, os bytes que são visões da base
+compartilhada (mapeada ou em cache) dos bytes que a sessão alocou só para
+si, e lê o RSS do processo.
+"""
+
+import resource
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+def process_rss() -> int:
+    """Resident set size of this process in bytes (peak where unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _buffers(series: pd.Series) -> list:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return [series.array.codes]
+    if isinstance(series.dtype, pd.ArrowDtype):
+        return [
+            np.frombuffer(buf, dtype=np.uint8)
+            for chunk in series.array._pa_array.chunks
+            for buf in chunk.buffers()
+            if buf is not None and buf.size
+        ]
+    if series.dtype.kind in "biufmMO":
+        return [series.to_numpy()]
+    return []
+
+
+def frame_memory(df: pd.DataFrame, base: pd.DataFrame = None) -> dict:
+    """
+    Bytes held by ``df``, split into views of ``base`` and private copies
+
+    Args:
+        df (pd.DataFrame): Frame built by the page
+        base (pd.DataFrame): Dataset ``df`` was derived from
+
+    Returns:
+        dict: ``total`` and ``privado`` bytes (``memory_usage(deep=True)``);
+        columns whose buffers overlap those of ``base`` count as shared
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    private = 0
+    for i, col in enumerate(df.columns):
+        series = df.iloc[:, i]
+        other = base[col] if base is not None and col in base else None
+        private += _private_bytes(series, other, int(usage.iloc[i]))
+    return {"total": int(usage.sum()), "privado": private}
+
+
+def _shares(own: list, other: pd.Series) -> bool:
+    return other is not None and any(
+        np.may_share_memory(a, b) for a in own for b in _buffers(other)
+    )
+
+
+def _private_bytes(series: pd.Series, other, nbytes: int) -> int:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Códigos e categorias são contados separadamente: um filtro copia os
+        # códigos mas reaproveita as categorias
+        codes = series.array.codes
+        private = 0 if _shares([codes], other) else codes.nbytes
+        same = (
+            other is not None
+            and isinstance(other.dtype, pd.CategoricalDtype)
+            and series.cat.categories is other.cat.categories
+        )
+        return private if same else private + nbytes - codes.nbytes
+    return 0 if _shares(_buffers(series), other) else nbytes
@@ -0,0 +1,399 @@
+"""Motor alternativo em Polars para carga, filtros e agregações.
+
+Com ``LASTMILE_BACKEND=polars`` o CSV é lido e tipado pelo Polars e as
+operações que percorrem as linhas (máscaras de filtro, cubo, heatmap,
+qualidade das rotas, correlação fora do cubo) viram consultas lazy: o
+otimizador junta projeções e filtros e a execução usa todos os núcleos. Os
+resultados voltam no formato das funções pandas equivalentes, que continuam
+sendo a referência; a paridade é verificada em ``tests/test_polars_engine.py``.
+
+Tempos dos dois motores (``--repetir`` empilha a base N vezes para medir em
+escala)::
+
+    python -m lastmile.polars_engine [dados.csv] [--repetir 1000]
+"""
+
+import argparse
+import datetime as dt
+import time
+
+import numpy as np
+import pandas as pd
+
+from lastmile import charts, cube, filters, loader, routes
+from lastmile.charts import HEATMAP_BINS, nice_edges
+from lastmile.correlation import CORRELATION_COLUMNS
+from lastmile.cube import DIMENSIONS, MEASURE_COLUMNS
+from lastmile.filters import day_bounds
+from lastmile.loader import (
+    CATEGORICAL_COLUMNS,
+    COLUMNS,
+    CSV_DTYPES,
+    CSV_SEP,
+    DATA_PATH,
+    DATETIME_FORMAT,
+    RENAMED_COLUMNS,
+)
+from lastmile.routes import QUALITY_COLUMNS
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def _csv_schema() -> dict:
+    types = {"int64": pl.Int64, "float64": pl.Float64, "string": pl.String}
+    return {col: types[dtype] for col, dtype in CSV_DTYPES.items()}
+
+
+def _hours_between(start: str, end: str):
+    # Mesmo valor de ``Timedelta.seconds``: segundos dentro do dia, sem os dias
+    seconds = (pl.col(end) - pl.col(start)).dt.total_seconds() % SECONDS_PER_DAY
+    return (seconds / 3600).round(2)
+
+
+def scan_deliveries(path=DATA_PATH):
+    """
+    Lazy query reading and typing a delivery CSV (``loader.read_csv`` rules)
+
+    Categorical columns stay as text; ``to_pandas`` turns them into the
+    categories of the pandas layout.
+    """
+    if pl is None:
+        raise ImportError("O motor polars requer o pacote polars")
+    raw = pl.scan_csv(path, separator=CSV_SEP, schema_overrides=_csv_schema())
+    return (
+        raw.select(list(CSV_DTYPES))
+        .with_columns(
+            [
+                pl.col(c).str.strptime(pl.Datetime("ns"), DATETIME_FORMAT)
+                for c in ["rota_inicio", "rota_final", "hora_entrega"]
+            ]
+            + [pl.col(c).fill_null("<NA>") for c in CATEGORICAL_COLUMNS]
+            + [(pl.col("status_tracking") == "Delivered").fill_null(False)]
+        )
+        .with_columns(pl.col("status_tracking").cast(pl.Int64))
+        .rename(RENAMED_COLUMNS)
+        .with_columns(
+            horas_entrega=_hours_between("rota_inicio", "data_entrega"),
+            horas_rota=_hours_between("rota_inicio", "rota_final"),
+        )
+        .select(COLUMNS)
+    )
+
+
+def to_pandas(frame) -> pd.DataFrame:
+    """Typed pandas dataframe (``loader.COLUMNS`` layout) from a Polars query"""
+    if isinstance(frame, pl.LazyFrame):
+        frame = frame.collect()
+    df = frame.to_pandas()
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype(str).astype("category")
+    return df
+
+
+def load_deliveries(path=DATA_PATH) -> pd.DataFrame:
+    """Same as ``loader.read_csv``, parsed with Polars on every core"""
+    return to_pandas(scan_deliveries(path))
+
+
+def from_pandas(df: pd.DataFrame):
+    """Polars copy of a typed pandas dataframe, for repeated queries"""
+    if pl is None:
+        raise ImportError("O motor polars requer o pacote polars")
+    return pl.from_pandas(df.reset_index(drop=True))
+
+
+def condition(schema, column: str, op: str, value):
+    """
+    Polars expression of one filter condition (``filters`` semantics)
+
+    Missing values never match.
+    """
+    col = pl.col(column)
+    if op == "isin":
+        if schema[column] in (pl.String, pl.Categorical, pl.Enum):
+            return col.cast(pl.String).is_in([str(v) for v in value])
+        return col.is_in(list(value))
+    if op == "between":
+        lo, hi = value
+        if isinstance(lo, dt.date):
+            lo, hi = day_bounds(lo, hi)
+            return (col >= lo) & (col <= hi)
+        values = col.cast(pl.Float64)
+        return values.is_not_nan() & (values >= float(lo)) & (values <= float(hi))
+    return col.cast(pl.String).str.contains(value)
+
+
+def filter_expr(schema, spec):
+    """Single expression combining every condition of ``spec``"""
+    expr = pl.lit(True)
+    for column, op, value in spec:
+        expr = expr & condition(schema, column, op, value).fill_null(False)
+    return expr
+
+
+def compile_mask(frame, spec) -> np.ndarray:
+    """Same as ``filters.compile_mask``, evaluated by Polars"""
+    mask = frame.lazy().select(filter_expr(frame.schema, spec)).collect()
+    mask = mask.to_series().to_numpy()
+    if mask.shape != (len(frame),):
+        mask = np.broadcast_to(mask, (len(frame),)).copy()
+    return mask
+
+
+def _filtered(frame, spec):
+    lazy = frame.lazy()
+    return lazy.filter(filter_expr(lazy.collect_schema(), spec)) if spec else lazy
+
+
+def build_cube(frame, spec=()) -> pd.DataFrame:
+    """Same as ``cube.build_cube`` of the rows matching ``spec``"""
+    measures = [pl.len().alias("entregas"), pl.col("delivered").sum()]
+    for col in MEASURE_COLUMNS:
+        values = pl.col(col).fill_nan(None)
+        measures += [
+            values.count().alias(f"{col}_n"),
+            values.sum().alias(f"{col}_sum"),
+            (values * values).sum().alias(f"{col}_sq"),
+        ]
+    cube = (
+        _filtered(frame, spec)
+        .with_columns(
+            dia=pl.col("data_entrega").dt.truncate("1d"),
+            hora=pl.col("data_entrega").dt.hour().cast(pl.Int8),
+            cep=pl.col("cep").cast(pl.String),
+        )
+        .drop_nulls(DIMENSIONS)
+        .group_by(DIMENSIONS)
+        .agg(measures)
+        .sort(DIMENSIONS)
+        .collect()
+        .to_pandas()
+    )
+    cube["cep"] = cube["cep"].astype("category")
+    cube["delivered"] = cube["delivered"].astype(np.int64)
+    for col in MEASURE_COLUMNS:
+        cube[f"{col}_n"] = cube[f"{col}_n"].astype(np.int64)
+    return cube
+
+
+def correlation(frame, spec=(), method="pearson", columns=CORRELATION_COLUMNS):
+    """
+    Same as ``DataFrame.corr`` of the rows matching ``spec``
+
+    Each pair is computed over its complete rows; Spearman uses average
+    ranks. The pairs run as parallel queries.
+    """
+    rows = _filtered(frame, spec)
+    queries, pairs = [], []
+    for i, a in enumerate(columns):
+        for b in columns[i:]:
+            x, y = pl.col(a).fill_nan(None), pl.col(b).fill_nan(None)
+            pair = rows.select(x.alias("x"), y.alias("y")).drop_nulls()
+            if method == "spearman":
+                pair = pair.select(pl.col("x").rank(), pl.col("y").rank())
+            queries.append(pair.select(pl.corr("x", "y")))
+            pairs.append((a, b))
+
+    out = pd.DataFrame(np.nan, index=columns, columns=columns)
+    for (a, b), result in zip(pairs, pl.collect_all(queries)):
+        r = result.item()
+        out.loc[a, b] = out.loc[b, a] = np.nan if r is None else r
+    # Como no pandas, coeficientes ficam dentro de [-1, 1]
+    return out.clip(-1.0, 1.0)
+
+
+def heatmap_cells(frame, x, y, z, nbins=HEATMAP_BINS, spec=()) -> pd.DataFrame:
+    """Same as ``charts.heatmap_cells`` of the rows matching ``spec``"""
+    rows = (
+        _filtered(frame, spec)
+        .select(
+            pl.col(x).cast(pl.String),
+            pl.col(y).fill_nan(None),
+            pl.col(z).fill_nan(None),
+        )
+        .drop_nulls()
+        .collect()
+    )
+    if not len(rows):
+        return pd.DataFrame()
+
+    edges = nice_edges(rows[y].min(), rows[y].max(), nbins)
+    ny = len(edges) - 1
+    ybin = pl.Series(edges).search_sorted(rows[y], side="right") - 1
+    cells = (
+        rows.with_columns(ybin=ybin.clip(0, ny - 1))
+        .group_by(x, "ybin")
+        .agg(pl.col(z).mean())
+        .to_pandas()
+    )
+    xvalues = sorted(cells[x].unique())
+    avg = cells.pivot(index="ybin", columns=x, values=z)
+    avg = avg.reindex(index=range(ny), columns=xvalues)
+    centers = (edges[:-1] + edges[1:]) / 2
+    out = pd.DataFrame(avg.to_numpy(dtype=float), index=centers, columns=xvalues)
+    out.index.name = y
+    out.columns.name = x
+    return out
+
+
+def route_quality(frame, spec=()) -> pd.DataFrame:
+    """
+    Same as ``routes.route_quality`` of the rows matching ``spec``
+
+    Polars sorts the rows by route and delivery and computes the per-stop
+    columns; the inversions come from the same merge sort as in pandas
+    (``routes.route_inversions``), over the sorted arrays, instead of one window
+    expression per lag.
+    """
+    route = "codigo_rota"
+    sq = pl.col("sq_plan")
+    ordered = (
+        _filtered(frame, spec)
+        .with_row_index("linha")
+        .select(pl.col(route).cast(pl.String), "data_entrega", "sq_plan", "linha")
+        .drop_nulls(route)
+        .sort([route, "data_entrega", "linha"], nulls_last=False)
+        .with_columns(
+            pos=pl.int_range(pl.len()).over(route),
+            grupo=(pl.col(route) != pl.col(route).shift()).fill_null(True).cum_sum()
+            - 1,
+        )
+        .collect()
+    )
+    max_size = int(ordered["pos"].max() or 0) + 1
+
+    # Posição planejada: ordem por sq_plan, empates na ordem real
+    planned = (sq * max_size + pl.col("pos")).rank("ordinal").over(route) - 1
+    next_same = pl.col(route).shift(-1) == pl.col(route)
+    gap = (next_same & (sq.shift(-1) - sq != 1)).fill_null(False)
+    out = (
+        ordered.lazy()
+        .with_columns(
+            deslocamento=(pl.col("pos") - planned.cast(pl.Int64)).abs(),
+            salto=gap,
+        )
+        .group_by(route)
+        .agg(
+            paradas=pl.len(),
+            saltos=pl.col("salto").sum(),
+            maior_deslocamento=pl.col("deslocamento").max(),
+        )
+        .sort(route)
+        .collect()
+        .to_pandas()
+    )
+
+    group = ordered["grupo"].to_numpy().astype(np.int64)
+    ranks, tied = routes.sq_ranks(group, ordered["sq_plan"].to_numpy(), len(out))
+    d = routes.route_inversions(group, ordered["pos"].to_numpy(), ranks, len(out))
+    sizes = out["paradas"].to_numpy(dtype=float)
+    pairs = sizes * (sizes - 1) / 2
+    c = pairs - tied - d
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out["kendall_tau"] = (c - d) / np.sqrt((c + d) * pairs)
+    out["inversoes"] = d
+    out["sequencia_planejada"] = out["saltos"].to_numpy() == 0
+    out[route] = out[route].astype(object)
+    for col in ["paradas", "inversoes", "maior_deslocamento"]:
+        out[col] = out[col].astype(np.int64)
+    return out[QUALITY_COLUMNS]
+
+
+def _repeat(df: pd.DataFrame, times: int) -> pd.DataFrame:
+    # Cada cópia ganha rotas e remessas próprias, para manter o tamanho das rotas
+    copies = []
+    for k in range(times):
+        copy = df.copy()
+        for col in ["codigo_rota", "remessa"]:
+            copy[col] = copy[col].astype(str) + f"-{k}"
+        copies.append(copy)
+    out = pd.concat(copies, ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        out[col] = out[col].astype(str).astype("category")
+    return out
+
+
+def _timed(run):
+    start = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - start
+
+
+def sample_specs(df: pd.DataFrame) -> dict:
+    """Filter specs, by label, covering each kind of filter of the pages"""
+    cep = list(df["cep"].cat.categories[:3])
+    day = df["data_entrega"].min().date()
+    return {
+        "sem filtro": (),
+        "cep": (("cep", "isin", tuple(cep)),),
+        "período + distância": (
+            ("data_entrega", "between", (day, day + dt.timedelta(days=6))),
+            ("distancia", "between", (0.5, 12.0)),
+        ),
+        "remessa contém": (("remessa", "contains", "11"),),
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Compara os tempos dos motores pandas e polars"
+    )
+    parser.add_argument("csv", nargs="?", default=str(DATA_PATH))
+    parser.add_argument("--repetir", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    _, t_pandas = _timed(lambda: loader.read_csv(args.csv))
+    df, t_polars = _timed(lambda: load_deliveries(args.csv))
+    timings = [("carga", t_pandas, t_polars)]
+    if args.repetir > 1:
+        df = _repeat(df, args.repetir)
+    frame = from_pandas(df)
+
+    for label, spec in sample_specs(df).items():
+        mask = filters.compile_mask(df, spec)
+        rows = df[mask]
+        cases = {
+            "máscara": (
+                lambda: filters.compile_mask(df, spec),
+                lambda: compile_mask(frame, spec),
+            ),
+            "cubo": (lambda: cube.build_cube(rows), lambda: build_cube(frame, spec)),
+            "heatmap": (
+                lambda: charts.heatmap_cells(
+                    rows, "cep", "distancia_rota", "horas_entrega"
+                ),
+                lambda: heatmap_cells(
+                    frame, "cep", "distancia_rota", "horas_entrega", spec=spec
+                ),
+            ),
+            "qualidade das rotas": (
+                lambda: routes.route_quality(rows),
+                lambda: route_quality(frame, spec),
+            ),
+            "correlação": (
+                lambda: rows[CORRELATION_COLUMNS].corr(),
+                lambda: correlation(frame, spec),
+            ),
+            "correlação de postos": (
+                lambda: rows[CORRELATION_COLUMNS].corr(method="spearman"),
+                lambda: correlation(frame, spec, "spearman"),
+            ),
+        }
+        for name, (reference, engine) in cases.items():
+            _, t0 = _timed(reference)
+            _, t1 = _timed(engine)
+            timings.append((f"{name} ({label})", t0, t1))
+
+    print(f"{len(df)} linhas, {pl.thread_pool_size()} threads no polars")
+    report = pd.DataFrame(timings, columns=["caso", "pandas (s)", "polars (s)"])
+    report["ganho"] = report["pandas (s)"] / report["polars (s)"]
+    print(report.round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
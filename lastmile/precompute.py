@@ -0,0 +1,481 @@
+"""Pré-cálculo offline dos artefatos que só dependem da base.
+
+Qualidade da roteirização (Pergunta 1), cubo de contagens por dia × CEP,
+sketches de quantis (de onde saem as estatísticas dos box plots), momentos
+da correlação, somas do heatmap CEP × distância da rota e as tabelas de
+Top-N não dependem da sessão. Este job calcula tudo de uma vez, em paralelo: cada tarefa de um
+``ProcessPoolExecutor`` trata as rotas iniciadas em um dia (então cada rota
+fica inteira em uma tarefa) e devolve resultados parciais que se somam —
+células do cubo, buckets dos sketches, somas do heatmap, linhas de rotas e
+os Top-N do dia. A junção no processo principal é pequena.
+
+Os artefatos ficam em Parquet ao lado dos dados, em um diretório por versão
+da base e do formato::
+
+    data/precalculado/
+        v1-<versão da base>/
+            _manifest.json
+            cubo.parquet
+            ...
+
+As páginas leem os artefatos da versão em uso pelos caches de
+``lastmile.widgets`` e ``lastmile.data``; sem eles (ou com a base alterada
+depois do job) os mesmos resultados são calculados como antes. Cada lote
+anexado por ``lastmile.ingest`` à base particionada é somado aos artefatos
+da versão anterior (``update_artifacts``), sem reler o histórico. Uso::
+
+    python -m lastmile.precompute [data/dados_entregas_last_mile.csv] [--processos 8]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from lastmile import correlation, store
+from lastmile.charts import heatmap_from_sums, heatmap_sums
+from lastmile.cube import DIMENSIONS, build_cube, measure_names
+from lastmile.ingest import register_summary
+from lastmile.loader import (
+    CATEGORICAL_COLUMNS,
+    DATA_PATH,
+    dataset_version,
+    load_deliveries,
+)
+from lastmile.quantiles import SKETCH_DIMENSIONS, build_sketches, merge_sketches
+from lastmile.routes import route_quality, split_routes, top_n
+
+PRECOMPUTE_PATH = DATA_PATH.parent / "precalculado"
+FORMAT = 1
+MANIFEST_NAME = "_manifest.json"
+# Eixos do heatmap da Pergunta 4
+HEATMAP = ("cep", "distancia_rota", "horas_entrega")
+# Linhas guardadas de cada Top-N (as páginas mostram até 10)
+TOP_ROWS = 100
+# Top-N: coluna ordenada → (tabela de origem, colunas mostradas)
+RANKINGS = {
+    "distancia_rota": ("rotas", ["codigo_rota", "distancia_rota"]),
+    "horas_rota": ("rotas", ["codigo_rota", "horas_rota"]),
+    "distancia": ("entregas", ["codigo_rota", "cep", "distancia"]),
+    "horas_entrega": ("entregas", ["codigo_rota", "cep", "remessa", "horas_entrega"]),
+}
+# Artefatos gravados por ``precompute`` e atualizados a cada lote ingerido
+ARTIFACTS = [
+    "cubo",
+    "quantis",
+    "momentos",
+    "postos",
+    "calor",
+    "somas_calor",
+    "rotas",
+    "qualidade_rotas",
+] + [f"top_{column}" for column in RANKINGS]
+
+
+def artifact_dir(version: str, root=PRECOMPUTE_PATH) -> Path:
+    return Path(root) / f"v{FORMAT}-{version}"
+
+
+def read_manifest(version: str, root=PRECOMPUTE_PATH):
+    """Manifest of the artifacts of ``version``, or ``None`` when absent"""
+    try:
+        return json.loads((artifact_dir(version, root) / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def load_artifact(name: str, version: str, rows=None, root=PRECOMPUTE_PATH):
+    """
+    Reads one precomputed artifact of a dataset version
+
+    Args:
+        name (str): Artifact name (``cubo``, ``quantis``, ``top_horas_rota``...)
+        version (str): Dataset version (``data.data_version``)
+        rows (int): When given, the artifact is only returned if it was
+            computed from this many rows
+        root: Directory of the precomputed artifacts
+
+    Returns:
+        pd.DataFrame: The artifact, or ``None`` when it was not precomputed
+    """
+    if version is None:
+        return None
+    manifest = read_manifest(version, root)
+    if manifest is None or name not in manifest["artefatos"]:
+        return None
+    if rows is not None and rows != manifest["linhas"]:
+        return None
+    try:
+        return pd.read_parquet(artifact_dir(version, root) / f"{name}.parquet")
+    except OSError:
+        return None
+
+
+def _route_day(df: pd.DataFrame) -> pd.Series:
+    return df["rota_inicio"].dt.normalize()
+
+
+def _row_artifacts(df: pd.DataFrame) -> dict:
+    # Resultados que somam linha a linha
+    partial = {
+        "linhas": len(df),
+        "cubo": build_cube(df),
+        "quantis": build_sketches(df),
+        "momentos": correlation.build_moments(df),
+        "postos": correlation.build_rank_sketches(df),
+        "calor": heatmap_sums(df, *HEATMAP),
+    }
+    for column, (source, columns) in RANKINGS.items():
+        if source == "entregas":
+            partial[f"top_{column}"] = top_n(df, column, TOP_ROWS, columns)
+    return partial
+
+
+def _route_artifacts(df: pd.DataFrame) -> dict:
+    # Resultados por rota, que precisam de todas as entregas de cada rota
+    routes = split_routes(df)[0]
+    partial = {"rotas": routes, "qualidade_rotas": route_quality(df)}
+    for column, (source, columns) in RANKINGS.items():
+        if source == "rotas":
+            partial[f"top_{column}"] = top_n(routes, column, TOP_ROWS, columns)
+    return partial
+
+
+def day_artifacts(df: pd.DataFrame) -> dict:
+    """
+    Partial artifacts of the routes started on one day
+
+    Args:
+        df (pd.DataFrame): Every delivery of those routes
+
+    Returns:
+        dict: Artifact name → partial result, merged by ``merge_artifacts``
+    """
+    return {**_row_artifacts(df), **_route_artifacts(df)}
+
+
+def _text_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # As categorias de um dia trazem o dicionário da base inteira (uma por
+    # remessa), que iria junto em cada resultado parcial
+    return df.astype({col: str for col in CATEGORICAL_COLUMNS})
+
+
+def _store_day(task: tuple) -> dict:
+    root, day = task
+    df = store.load_partitions(root, day, day, column="rota_inicio")
+    return day_artifacts(_text_columns(df)) if len(df) else None
+
+
+def _as_category(frame: pd.DataFrame, columns) -> pd.DataFrame:
+    # Partes com categorias diferentes viram texto no concat
+    for col in columns:
+        if col in frame:
+            frame[col] = frame[col].astype(str).astype("category")
+    return frame
+
+
+def _concat(parts: list, key: str) -> pd.DataFrame:
+    return pd.concat([p[key] for p in parts], ignore_index=True)
+
+
+def _text_dimensions(frame: pd.DataFrame, columns) -> pd.DataFrame:
+    # Dimensões categóricas de partes diferentes agrupadas pelo texto
+    for col in columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(str)
+    return frame
+
+
+def merge_artifacts(parts: list) -> dict:
+    """
+    Merges the ``day_artifacts`` of disjoint sets of routes
+
+    Returns:
+        dict: Artifact name → dataframe, the same as computed over all rows
+    """
+    cube = _concat(parts, "cubo")
+    cube["cep"] = cube["cep"].astype(str)
+    cube = cube.groupby(DIMENSIONS, sort=True)[measure_names()].sum().reset_index()
+
+    sums = _concat(parts, "calor")
+    sums = sums.groupby(list(HEATMAP[:2]), sort=True)[["soma", "n"]].sum()
+    sums = sums.reset_index()
+
+    moments = _concat(parts, "momentos")
+    moments = _text_dimensions(moments, correlation.DIMENSIONS)
+    moments = moments.groupby(correlation.DIMENSIONS, sort=True).sum().reset_index()
+
+    ranks = _concat(parts, "postos")
+    keys = correlation.DIMENSIONS + ["x", "y", "bx", "by"]
+    ranks = _text_dimensions(ranks, keys)
+    ranks = ranks.groupby(keys, sort=True)["n"].sum().reset_index()
+
+    merged = {
+        "cubo": _as_category(cube, ["cep"]),
+        "quantis": merge_sketches(*(p["quantis"] for p in parts)),
+        "momentos": _as_category(moments, ["cep", "transportadora", "veiculo"]),
+        "postos": _as_category(ranks, ["cep", "transportadora", "veiculo", "x", "y"]),
+        "calor": heatmap_from_sums(sums, *HEATMAP[:2]),
+        # As somas ficam guardadas para juntar lotes novos ao heatmap
+        "somas_calor": sums,
+    }
+    for key in ["rotas", "qualidade_rotas"]:
+        frame = _concat(parts, key)
+        frame["codigo_rota"] = frame["codigo_rota"].astype(str)
+        # Mesma ordem das tabelas calculadas sobre a base inteira
+        merged[key] = frame.sort_values("codigo_rota", kind="stable", ignore_index=True)
+    merged["rotas"] = _as_category(merged["rotas"], ["codigo_rota"])
+    for column, (source, columns) in RANKINGS.items():
+        frame = _concat(parts, f"top_{column}")
+        if source == "rotas":
+            # Empates ficam na ordem da tabela de rotas, como nas páginas; nas
+            # entregas a ordem original das linhas não existe mais aqui
+            frame = frame.sort_values("codigo_rota", kind="stable", ignore_index=True)
+        frame = _as_category(frame, CATEGORICAL_COLUMNS)
+        merged[f"top_{column}"] = top_n(frame, column, TOP_ROWS, columns)
+    return merged
+
+
+def _tasks(csv_path, root):
+    # Com a base particionada cada processo lê só as partições do seu dia;
+    # sem ela o CSV é lido uma vez e cada dia segue para um processo
+    if store.store_exists(root):
+        first, last = store.store_bounds(root, "rota_inicio")
+        days = pd.date_range(first.normalize(), last.normalize(), freq="D")
+        total = sum(p["rows"] for p in store.read_manifest(root)["partitions"])
+        return _store_day, [(root, day) for day in days], total
+    df = _text_columns(load_deliveries(csv_path))
+    groups = df.groupby(_route_day(df), sort=True, dropna=False)
+    return day_artifacts, [g for _, g in groups], len(df)
+
+
+def _write(artifacts: dict, version: str, rows: int, root: Path, meta: dict) -> Path:
+    target = artifact_dir(version, root)
+    staging = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    for name, frame in artifacts.items():
+        frame.to_parquet(staging / f"{name}.parquet")
+    manifest = {
+        "formato": FORMAT,
+        "versao": version,
+        "linhas": rows,
+        "artefatos": sorted(artifacts),
+        "criado": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        **meta,
+    }
+    (staging / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1))
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    # Artefatos de versões anteriores da base não são mais lidos
+    for old in root.glob("v*-*"):
+        if old != target and old.is_dir() and not old.name.endswith(".tmp"):
+            shutil.rmtree(old, ignore_errors=True)
+    return target
+
+
+def precompute(
+    csv_path=DATA_PATH, root=store.STORE_PATH, target=None, workers=None
+) -> dict:
+    """
+    Computes every artifact of the current dataset and writes them as Parquet
+
+    Args:
+        csv_path: Source CSV, used when there is no partitioned store
+        root: Partitioned store directory
+        target: Output directory; next to ``csv_path`` by default
+        workers (int): Processes; all cores by default
+
+    Returns:
+        dict: Manifest of the written artifacts, with ``diretorio``; rows
+        without a route start day (left out of every artifact) are counted in
+        ``linhas_sem_dia``
+    """
+    csv_path = Path(csv_path)
+    target = Path(target) if target else csv_path.parent / PRECOMPUTE_PATH.name
+    from_store = store.store_exists(root)
+    version = store.store_version(root) if from_store else dataset_version(csv_path)
+
+    start = time.perf_counter()
+    work, tasks, total = _tasks(csv_path, root)
+    with ProcessPoolExecutor(workers) as pool:
+        parts = [p for p in pool.map(work, tasks) if p is not None]
+    rows = sum(p["linhas"] for p in parts)
+
+    artifacts = merge_artifacts(parts)
+    meta = {
+        "origem": str(root if from_store else csv_path),
+        "dias": len(parts),
+        "segundos": round(time.perf_counter() - start, 3),
+        # Linhas sem rota_inicio não pertencem a nenhum dia de rota
+        "linhas_sem_dia": total - rows,
+    }
+    directory = _write(artifacts, version, rows, target, meta)
+    return {**read_manifest(version, target), "diretorio": str(directory)}
+
+
+def _batch_routes(new: pd.DataFrame, root) -> pd.DataFrame:
+    # Todas as entregas já gravadas das rotas do lote (lidas só nos dias de
+    # início dessas rotas), que podem ter começado em lotes anteriores
+    start, end = new["rota_inicio"].min(), new["rota_inicio"].max()
+    rows = store.load_partitions(root, start, end, column="rota_inicio")
+    routes = new["codigo_rota"].astype(str).unique()
+    return rows[rows["codigo_rota"].astype(str).isin(routes).to_numpy()]
+
+
+def _append(stored: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    # Acrescenta linhas mantendo as colunas categóricas (e suas categorias
+    # em ordem) da tabela gravada, sem converter a tabela inteira em texto
+    stored, rows = stored.copy(), rows[stored.columns].copy()
+    for col in stored.select_dtypes("category"):
+        values = rows[col].astype(str)
+        categories = stored[col].cat.categories
+        missing = pd.Index(values.unique()).difference(categories)
+        if len(missing):
+            categories = categories.union(missing)
+            stored[col] = stored[col].cat.set_categories(categories)
+        rows[col] = pd.Categorical(values, categories=categories)
+    return pd.concat([stored, rows], ignore_index=True)
+
+
+def _fold(stored: pd.DataFrame, part: pd.DataFrame, keys: list) -> pd.DataFrame:
+    # Soma as células do lote às gravadas; só as células dos dias (ou das
+    # chaves) que o lote toca são reagrupadas
+    if "dia" in keys:
+        touched = stored["dia"].isin(part["dia"].unique()).to_numpy()
+    else:
+        index = pd.MultiIndex.from_frame(part[keys].astype({keys[0]: str}))
+        stored_index = pd.MultiIndex.from_frame(stored[keys].astype({keys[0]: str}))
+        touched = stored_index.isin(index)
+    measures = [col for col in stored.columns if col not in keys]
+    cells = [frame for frame in (stored[touched], part) if len(frame)] or [part]
+    cells = _text_dimensions(pd.concat(cells, ignore_index=True), keys)
+    cells = cells.groupby(keys, sort=True)[measures].sum().reset_index()
+    return _append(stored[~touched], cells)
+
+
+def _replace_routes(stored: pd.DataFrame, part: pd.DataFrame) -> pd.DataFrame:
+    # Rotas do lote substituem as versões gravadas; a tabela segue ordenada
+    # pelo código da rota, como a calculada sobre a base inteira
+    codes = part["codigo_rota"].astype(str)
+    kept = stored[~stored["codigo_rota"].astype(str).isin(codes).to_numpy()]
+    merged = _append(kept, part)
+    if isinstance(merged["codigo_rota"].dtype, pd.CategoricalDtype):
+        return merged.sort_values("codigo_rota", kind="stable", ignore_index=True)
+    order = merged["codigo_rota"].astype(str).argsort(kind="stable")
+    return merged.iloc[order].reset_index(drop=True)
+
+
+def fold_artifacts(stored: dict, batch: dict) -> dict:
+    """
+    Adds the partial artifacts of a batch to the stored artifacts
+
+    Same result as ``merge_artifacts`` over every part, but only the cells
+    and routes the batch touches are regrouped.
+
+    Args:
+        stored (dict): Artifact name → artifact (``ARTIFACTS``)
+        batch (dict): Row artifacts of the new rows and route artifacts of
+            every delivery of their routes
+
+    Returns:
+        dict: Artifact name → updated artifact
+    """
+    sketch_keys = SKETCH_DIMENSIONS + ["medida", "bucket"]
+    rank_keys = correlation.DIMENSIONS + ["x", "y", "bx", "by"]
+    sums = _fold(stored["somas_calor"], batch["calor"], list(HEATMAP[:2]))
+    folded = {
+        "cubo": _fold(stored["cubo"], batch["cubo"], DIMENSIONS),
+        "quantis": _fold(stored["quantis"], batch["quantis"], sketch_keys),
+        "momentos": _fold(
+            stored["momentos"], batch["momentos"], correlation.DIMENSIONS
+        ),
+        "postos": _fold(stored["postos"], batch["postos"], rank_keys),
+        "calor": heatmap_from_sums(sums, *HEATMAP[:2]),
+        "somas_calor": sums,
+        "rotas": _replace_routes(stored["rotas"], batch["rotas"]),
+        "qualidade_rotas": _replace_routes(
+            stored["qualidade_rotas"], batch["qualidade_rotas"]
+        ),
+    }
+    for column, (source, columns) in RANKINGS.items():
+        if source == "rotas":
+            # Saem da tabela de rotas inteira, já com as rotas do lote
+            frame = folded["rotas"]
+        else:
+            frame = pd.concat(
+                [stored[f"top_{column}"], batch[f"top_{column}"]], ignore_index=True
+            )
+            frame = _as_category(frame, CATEGORICAL_COLUMNS)
+        folded[f"top_{column}"] = top_n(frame, column, TOP_ROWS, columns)
+    return folded
+
+
+@register_summary
+def update_artifacts(new: pd.DataFrame, root, previous_version, target=None):
+    """
+    Folds an ingested batch into the artifacts of the previous store version
+
+    Row totals (cube, sketches, correlation moments, heatmap sums, delivery
+    rankings) get the partials of the new rows; the routes of the batch are
+    recomputed from their stored deliveries and replace their old entries.
+    Nothing is done when the previous version was not precomputed.
+
+    Args:
+        new (pd.DataFrame): Rows appended by ``lastmile.ingest``
+        root: Partitioned store directory (already holding ``new``)
+        previous_version (str): Store version before the append
+        target: Directory of the precomputed artifacts
+    """
+    target = Path(target or PRECOMPUTE_PATH)
+    manifest = read_manifest(previous_version, target)
+    if manifest is None or not set(ARTIFACTS) <= set(manifest["artefatos"]):
+        return None
+
+    start = time.perf_counter()
+    touched = _text_columns(_batch_routes(new, root))
+    batch = {**_row_artifacts(_text_columns(new)), **_route_artifacts(touched)}
+    stored = {
+        name: load_artifact(name, previous_version, root=target)
+        for name in ARTIFACTS
+        if name != "calor"
+    }
+    artifacts = fold_artifacts(stored, batch)
+
+    kept = ["origem", "dias", "segundos", "linhas_sem_dia"]
+    meta = {key: manifest[key] for key in kept if key in manifest}
+    meta["lotes"] = manifest.get("lotes", 0) + 1
+    meta["segundos_ultimo_lote"] = round(time.perf_counter() - start, 3)
+    version = store.store_version(root)
+    return _write(artifacts, version, manifest["linhas"] + len(new), target, meta)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Pré-calcula em paralelo os artefatos das páginas"
+    )
+    parser.add_argument("csv", nargs="?", default=str(DATA_PATH))
+    parser.add_argument("--base", default=str(store.STORE_PATH))
+    parser.add_argument("--destino", default=None)
+    parser.add_argument("--processos", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    manifest = precompute(args.csv, args.base, args.destino, args.processos)
+    print(
+        f"{len(manifest['artefatos'])} artefatos de {manifest['linhas']} linhas "
+        f"({manifest['dias']} dias) em {manifest['segundos']:.1f} s: "
+        f"{manifest['diretorio']}"
+    )
+    if manifest.get("linhas_sem_dia"):
+        print(
+            f"{manifest['linhas_sem_dia']} linhas sem dia de início de rota ignoradas"
+        )
+
+
+if __name__ == "__main__":
+    main()
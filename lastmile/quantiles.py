@@ -0,0 +1,256 @@
+"""Sketches de quantis mescláveis por dia × CEP × transportadora.
+
+Cada sketch é um histograma em escala logarítmica (DDSketch): o valor ``x``
+cai no bucket ``ceil(log(x) / log(GAMMA))`` e cada valor da ordenação
+estimado a partir dos buckets tem erro relativo de no máximo
+``RELATIVE_ACCURACY``. Os quantis interpolam os dois valores vizinhos do
+posto, como ``np.quantile`` e ``Series.quantile`` (método linear), e herdam a
+mesma garantia; valores abaixo de ``MIN_VALUE`` contam como zero.
+Como os buckets são fixos, juntar sketches é somar contagens — igual às
+células do cubo — e o tamanho de cada sketch é limitado pela faixa de
+valores, não pela quantidade de linhas.
+
+Os sketches de toda a base ficam em ``_quantis.feather`` ao lado do
+manifesto da base particionada e são atualizados a cada lote ingerido.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lastmile import store
+from lastmile.cube import filter_cube
+from lastmile.ingest import register_summary
+from lastmile.loader import write_atomic
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Valores abaixo de MIN_VALUE (inclusive zero) ficam no bucket ZERO_BUCKET
+MIN_VALUE = 1e-3
+MAX_VALUE = 1e6
+ZERO_BUCKET = np.int16(np.floor(np.log(MIN_VALUE) / np.log(GAMMA)))
+
+SKETCH_DIMENSIONS = ["dia", "cep", "transportadora"]
+SKETCH_COLUMNS = ["horas_entrega", "distancia"]
+SKETCH_FILTERS = {
+    "cep": ("isin",),
+    "transportadora": ("isin",),
+    "data_entrega": ("between",),
+}
+SKETCH_NAME = "_quantis.feather"
+BOX_QUANTILES = {"q1": 0.25, "median": 0.5, "q3": 0.75, "p90": 0.9, "p99": 0.99}
+
+
+def bucket_of(values: np.ndarray, gamma: float = GAMMA) -> np.ndarray:
+    """
+    Bucket of each value (NaN must be removed beforehand)
+
+    A coarser ``gamma`` gives fewer, wider buckets; the zero bucket stays
+    below every other one, so bucket order follows value order.
+    """
+    clipped = np.clip(values, MIN_VALUE, MAX_VALUE)
+    buckets = np.ceil(np.log(clipped) / np.log(gamma)).astype(np.int16)
+    buckets[values < MIN_VALUE] = np.floor(np.log(MIN_VALUE) / np.log(gamma))
+    return buckets
+
+
+def bucket_value(buckets: np.ndarray) -> np.ndarray:
+    """Representative value of each bucket (zero for ``ZERO_BUCKET``)"""
+    buckets = np.asarray(buckets, dtype=float)
+    values = 2 * GAMMA**buckets / (GAMMA + 1)
+    return np.where(buckets == ZERO_BUCKET, 0.0, values)
+
+
+def build_sketches(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sketches ``SKETCH_COLUMNS`` for each (day, ``cep``, ``transportadora``)
+
+    Args:
+        df (pd.DataFrame): Typed delivery rows
+
+    Returns:
+        pd.DataFrame: Long table with ``SKETCH_DIMENSIONS``, ``medida``
+        (column name), ``bucket`` and ``n`` (count), one row per non-empty
+        bucket
+    """
+    parts = []
+    for col in SKETCH_COLUMNS:
+        values = df[col].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        frame = pd.DataFrame(
+            {
+                "dia": df["data_entrega"].dt.normalize(),
+                "cep": df["cep"].astype(str),
+                "transportadora": df["transportadora"].astype(str),
+                "bucket": np.zeros(len(df), dtype=np.int16),
+            }
+        )[valid]
+        frame["bucket"] = bucket_of(values[valid])
+        counts = frame.groupby(SKETCH_DIMENSIONS + ["bucket"], sort=True).size()
+        counts = counts.rename("n").reset_index()
+        counts.insert(len(SKETCH_DIMENSIONS), "medida", col)
+        parts.append(counts)
+    return merge_sketches(*parts)
+
+
+def merge_sketches(*sketches: pd.DataFrame) -> pd.DataFrame:
+    """Adds up the bucket counts of several sketch tables"""
+    keys = SKETCH_DIMENSIONS + ["medida", "bucket"]
+    merged = pd.concat(sketches, ignore_index=True)
+    merged = merged.groupby(keys, sort=True, observed=True)["n"].sum().reset_index()
+    merged["n"] = merged["n"].astype(np.int64)
+    for col in ["cep", "transportadora", "medida"]:
+        merged[col] = merged[col].astype(str).astype("category")
+    return merged
+
+
+def can_answer(spec) -> bool:
+    """Tells whether every condition of a filter spec maps to sketch keys"""
+    for column, op, value in spec:
+        if op not in SKETCH_FILTERS.get(column, ()):
+            return False
+    return True
+
+
+def filter_sketches(sketches: pd.DataFrame, spec) -> pd.DataFrame:
+    """Applies a filter spec accepted by ``can_answer`` to the sketches"""
+    spec = [
+        (column, op, tuple(str(v) for v in value) if op == "isin" else value)
+        for column, op, value in spec
+    ]
+    return filter_cube(sketches, spec)
+
+
+def _order_value(counts: pd.DataFrame, cum: np.ndarray, position, by) -> pd.Series:
+    # Primeiro bucket cuja contagem acumulada passa da posição (base 0)
+    reached = counts[cum > position]
+    return reached.groupby(by, sort=False, observed=True)["value"].first()
+
+
+def quantiles(sketches: pd.DataFrame, column: str, by, qs: dict) -> pd.DataFrame:
+    """
+    Estimates quantiles of ``column`` for each group of ``by``
+
+    The sketches of every (day, ``cep``, ``transportadora``) in a group are
+    merged first; the cost depends on the number of buckets, not rows. As in
+    ``np.quantile``, the two order statistics around ``q * (n - 1)`` are
+    interpolated, so each estimate is within ``RELATIVE_ACCURACY`` of the
+    exact (linear) quantile.
+
+    Args:
+        sketches (pd.DataFrame): Output of ``build_sketches`` (possibly
+            filtered)
+        column (str): One of ``SKETCH_COLUMNS``
+        by (list): Sketch dimensions to keep
+        qs (dict): Output column name → quantile in ``[0, 1]``
+
+    Returns:
+        pd.DataFrame: One column per quantile plus ``mean`` and ``n``,
+        indexed by ``by``
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    data = sketches[sketches["medida"] == column]
+    counts = data.groupby(by + ["bucket"], sort=True, observed=True)["n"].sum()
+    counts = counts.reset_index()
+
+    group = counts.groupby(by, sort=False, observed=True)
+    cum = group["n"].cumsum().to_numpy()
+    total = group["n"].transform("sum").to_numpy()
+    value = bucket_value(counts["bucket"].to_numpy())
+    counts["value"] = value
+    counts["weighted"] = value * counts["n"]
+
+    out = group[["n", "weighted"]].sum()
+    out["mean"] = out.pop("weighted") / out["n"]
+    for name, q in qs.items():
+        # Valores da ordenação vizinhos do posto q * (n - 1), interpolados
+        rank = q * (out["n"] - 1)
+        lower = _order_value(counts, cum, np.floor(q * (total - 1)), by)
+        upper = _order_value(counts, cum, np.ceil(q * (total - 1)), by)
+        out[name] = lower + (rank - np.floor(rank)) * (upper - lower)
+    return out
+
+
+def sketch_box_stats(sketches: pd.DataFrame, by, column: str) -> pd.DataFrame:
+    """
+    Box plot statistics of ``column`` per group of ``by`` from the sketches
+
+    Same layout as ``charts.box_stats`` (``q1``, ``median``, ``q3``,
+    ``lowerfence``, ``upperfence``, ``mean``, ``n``) plus ``p90`` and
+    ``p99``; the fences are the extreme buckets within 1.5 IQR of the box.
+    """
+    stats = quantiles(sketches, column, by, BOX_QUANTILES)
+    data = sketches[sketches["medida"] == column]
+    buckets = data.groupby([by, "bucket"], sort=True, observed=True)["n"].sum()
+    buckets = buckets.reset_index()
+    buckets["value"] = bucket_value(buckets["bucket"].to_numpy())
+
+    iqr = stats["q3"] - stats["q1"]
+    low = buckets[by].map(stats["q1"] - 1.5 * iqr)
+    high = buckets[by].map(stats["q3"] + 1.5 * iqr)
+    inside = buckets[buckets["value"].between(low, high)]
+    within = inside.groupby(by, sort=False, observed=True)["value"]
+    stats["lowerfence"] = within.min()
+    stats["upperfence"] = within.max()
+    return stats.sort_index()
+
+
+def _paths(root: Path):
+    return root / SKETCH_NAME, root / f"{SKETCH_NAME}.json"
+
+
+def _rebuild_sketches(root: Path) -> pd.DataFrame:
+    columns = ["data_entrega", "cep", "transportadora"] + SKETCH_COLUMNS
+    return build_sketches(store.load_partitions(root, columns=columns))
+
+
+def _save_sketches(root: Path, sketches: pd.DataFrame) -> None:
+    path, meta_path = _paths(root)
+    write_atomic(path, lambda tmp: sketches.reset_index(drop=True).to_feather(tmp))
+    write_atomic(
+        meta_path,
+        lambda tmp: tmp.write_text(json.dumps({"version": store.store_version(root)})),
+    )
+
+
+def _read_sketches(root: Path, version):
+    path, meta_path = _paths(root)
+    try:
+        meta = json.loads(meta_path.read_text())
+        if meta["version"] == version:
+            return pd.read_feather(path)
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+
+def load_sketches(root=store.STORE_PATH) -> pd.DataFrame:
+    """
+    Returns the sketches of every stored delivery
+
+    They are rebuilt from the partitions only when the store was written
+    without going through ``lastmile.ingest``.
+    """
+    root = Path(root)
+    sketches = _read_sketches(root, store.store_version(root))
+    if sketches is not None:
+        return sketches
+    if not store.store_exists(root):
+        return pd.DataFrame(columns=SKETCH_DIMENSIONS + ["medida", "bucket", "n"])
+    sketches = _rebuild_sketches(root)
+    _save_sketches(root, sketches)
+    return sketches
+
+
+@register_summary
+def update_sketches(new: pd.DataFrame, root, previous_version) -> None:
+    """Folds the rows of an ingested batch into the stored sketches"""
+    root = Path(root)
+    sketches = _read_sketches(root, previous_version)
+    if sketches is None:
+        sketches = _rebuild_sketches(root)
+    else:
+        sketches = merge_sketches(sketches, build_sketches(new))
+    _save_sketches(root, sketches)
@@ -0,0 +1,264 @@
+"""Modelo de rotas e qualidade da roteirização.
+
+Os atributos de rota (início, fim, duração, distância planejada,
+transportadora e veículo) se repetem em todas as entregas da rota. A tabela
+de rotas guarda esses atributos uma vez por rota, com agregados das entregas
+(paradas, soma das distâncias entre paradas, primeira e última entrega); a
+tabela de entregas fica só com as colunas de cada entrega e ``codigo_rota``.
+
+As métricas de qualidade comparam a sequência planejada com a ordem real
+das entregas, de forma vetorizada sobre arrays ordenados por (rota,
+``data_entrega``), sem chamadas Python por rota. As inversões são contadas
+por um merge sort de baixo para cima dentro de cada rota: cada nível junta
+blocos vizinhos de todas as rotas de uma vez, e são log2 do tamanho da maior
+rota níveis, em vez de um passo por par de paradas.
+"""
+
+import numpy as np
+import pandas as pd
+
+ROUTE_ATTRIBUTES = [
+    "rota_inicio",
+    "rota_final",
+    "horas_rota",
+    "distancia_rota",
+    "transportadora",
+    "veiculo",
+]
+ROUTE_COLUMNS = [
+    "codigo_rota",
+    *ROUTE_ATTRIBUTES,
+    "paradas",
+    "distancia_paradas",
+    "primeira_entrega",
+    "ultima_entrega",
+]
+QUALITY_COLUMNS = [
+    "codigo_rota",
+    "paradas",
+    "sequencia_planejada",
+    "inversoes",
+    "kendall_tau",
+    "maior_deslocamento",
+]
+
+
+def _route_codes(series: pd.Series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes, pd.Index(uniques)
+
+
+def split_routes(df: pd.DataFrame) -> tuple:
+    """
+    Splits delivery rows into a route table and a slim delivery table
+
+    Args:
+        df (pd.DataFrame): Typed delivery rows
+
+    Returns:
+        tuple: Routes (``ROUTE_COLUMNS``, one row per route present in
+        ``df``) and deliveries (``df`` without ``ROUTE_ATTRIBUTES``)
+    """
+    codes, routes = _route_codes(df["codigo_rota"])
+    valid = codes >= 0
+    n_routes = len(routes)
+    present, first = np.unique(codes[valid], return_index=True)
+    rows = np.flatnonzero(valid)[first]
+
+    distance = df["distancia"].to_numpy(dtype=float)[valid]
+    when = df["data_entrega"].to_numpy(dtype="datetime64[ns]")[valid]
+    by_route = pd.Series(when).groupby(codes[valid], sort=True)
+
+    table = df.iloc[rows][["codigo_rota", *ROUTE_ATTRIBUTES]].reset_index(drop=True)
+    table["paradas"] = np.bincount(codes[valid], minlength=n_routes)[present]
+    table["distancia_paradas"] = np.bincount(
+        codes[valid], weights=np.nan_to_num(distance), minlength=n_routes
+    )[present]
+    table["primeira_entrega"] = by_route.min().to_numpy()
+    table["ultima_entrega"] = by_route.max().to_numpy()
+
+    deliveries = df.drop(columns=[c for c in ROUTE_ATTRIBUTES if c in df.columns])
+    return table, deliveries
+
+
+def join_routes(deliveries: pd.DataFrame, routes: pd.DataFrame) -> pd.DataFrame:
+    """Adds the ``ROUTE_ATTRIBUTES`` of each delivery back from the route table"""
+    pos = pd.Index(routes["codigo_rota"]).get_indexer(deliveries["codigo_rota"])
+    attributes = routes[ROUTE_ATTRIBUTES].take(pos).set_axis(deliveries.index)
+    attributes[pos < 0] = None
+    return pd.concat([deliveries, attributes], axis=1)
+
+
+def routes_of(routes: pd.DataFrame, codigo_rota: pd.Series) -> pd.DataFrame:
+    """Rows of the route table for the routes appearing in ``codigo_rota``"""
+    codes, categories = _route_codes(codigo_rota)
+    # Posição extra: rotas fora de ``categories`` (código -1) nunca são marcadas
+    seen = np.zeros(len(categories) + 1, dtype=bool)
+    seen[codes[codes >= 0]] = True
+    route_codes, route_categories = _route_codes(routes["codigo_rota"])
+    if not route_categories.equals(categories):
+        # Códigos de outra origem: traduz pelas categorias de ``codigo_rota``
+        route_codes = categories.get_indexer(routes["codigo_rota"])
+    return routes[seen[route_codes]]
+
+
+def top_n(df: pd.DataFrame, column: str, n: int, columns=None) -> pd.DataFrame:
+    """
+    Distinct rows of ``columns`` with the ``n`` largest values of ``column``
+
+    Same result as ``sort_values(column, ascending=False)[columns]
+    .drop_duplicates().head(n)``, but only the candidates selected with
+    ``np.argpartition`` are sorted, not the whole frame.
+    """
+    columns = list(df.columns if columns is None else columns)
+    values = df[column].to_numpy(dtype=float)
+    # NaN fica por último, como no sort_values
+    keys = np.where(np.isnan(values), np.inf, -values)
+    k = n
+    while True:
+        k = min(k, len(keys))
+        if k == 0:
+            return df[columns].iloc[:0].reset_index(drop=True)
+        candidates = np.argpartition(keys, k - 1)[:k]
+        candidates = candidates[np.lexsort((candidates, keys[candidates]))]
+        top = df[columns].iloc[candidates].drop_duplicates().head(n)
+        if len(top) == n or k == len(keys):
+            return top.reset_index(drop=True)
+        k *= 2
+
+
+def sq_ranks(group: np.ndarray, sq: np.ndarray, n_routes: int) -> tuple:
+    """Dense ranks of ``sq`` and, per route, the pairs of stops with equal ``sq``"""
+    values, ranks = np.unique(sq, return_inverse=True)
+    ranks = ranks.astype(np.int64).ravel()
+    cells, counts = np.unique(group * len(values) + ranks, return_counts=True)
+    tied = np.bincount(
+        cells // len(values), weights=counts * (counts - 1) / 2, minlength=n_routes
+    )
+    return ranks, tied
+
+
+def route_inversions(
+    group: np.ndarray, pos: np.ndarray, ranks: np.ndarray, n_routes: int
+) -> np.ndarray:
+    """
+    Pairs of stops of each route whose rank decreases in delivery order
+
+    Bottom-up merge sort over the rows ordered by (route, delivery): at the
+    level of width ``w`` every block of ``w`` stops of a route is already
+    sorted, and each stop of a right block counts the larger ranks of its
+    left neighbour with one ``searchsorted`` over all routes. Sorting the
+    merged blocks is a stable sort of runs already in order, so each level
+    costs about O(n) and there are log2(largest route) levels.
+
+    Args:
+        group (np.ndarray): Route of each row, non-decreasing
+        pos (np.ndarray): Position of each row inside its route
+        ranks (np.ndarray): Dense rank of ``sq_plan`` of each row
+        n_routes (int): Number of routes
+
+    Returns:
+        np.ndarray: Inversions per route
+    """
+    n = len(ranks)
+    inversions = np.zeros(n_routes)
+    if not n:
+        return inversions
+    base = np.int64(ranks.max() + 1)
+    values = ranks
+    largest = int(pos.max()) + 1
+    width = 1
+    while width < largest:
+        # Par de blocos vizinhos (esquerdo e direito) dentro da mesma rota
+        block = pos // (2 * width)
+        new = np.r_[True, (group[1:] != group[:-1]) | (block[1:] != block[:-1])]
+        pair = np.cumsum(new) - 1
+        right = (pos // width) % 2 == 1
+        keys = pair * base + values
+        left = keys[~right]
+        upper = np.searchsorted(left, (pair[right] + 1) * base, side="left")
+        larger = upper - np.searchsorted(left, keys[right], side="right")
+        inversions += np.bincount(group[right], weights=larger, minlength=n_routes)
+        keys.sort(kind="stable")
+        values = keys - pair * base
+        width *= 2
+    return inversions
+
+
+def route_quality(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compares the planned sequence (``sq_plan``) of each route with the order
+    in which its deliveries actually happened
+
+    Args:
+        df (pd.DataFrame): Rows with ``codigo_rota``, ``data_entrega`` and
+            ``sq_plan``
+
+    Returns:
+        pd.DataFrame: One row per route with
+
+        - ``paradas``: number of deliveries;
+        - ``sequencia_planejada``: deliveries followed ``sq_plan`` with no gap
+          or repetition (consecutive values in delivery order);
+        - ``inversoes``: pairs of deliveries made in the opposite order of
+          the plan;
+        - ``kendall_tau``: Kendall tau-b between planned and actual order
+          (1 = plan followed, -1 = fully reversed; NaN with one stop);
+        - ``maior_deslocamento``: largest distance, in positions, between the
+          planned and the actual place of a delivery.
+    """
+    codes, routes = _route_codes(df["codigo_rota"])
+    valid = codes >= 0
+    codes = codes[valid]
+    when = df["data_entrega"].to_numpy(dtype="datetime64[ns]").view("i8")[valid]
+    sq = df["sq_plan"].to_numpy(dtype=np.int64)[valid]
+    n = len(codes)
+
+    # Ordem real: por rota, horário da entrega e posição original
+    order = np.lexsort((np.arange(n), when, codes))
+    route = codes[order]
+    sq = sq[order]
+
+    starts = np.flatnonzero(np.r_[True, route[1:] != route[:-1]])
+    if not n:
+        starts = starts[:0]
+    sizes = np.diff(np.r_[starts, n])
+    n_routes = len(starts)
+    group = np.repeat(np.arange(n_routes), sizes)
+    pos = np.arange(n) - np.repeat(starts, sizes)
+
+    # Paradas consecutivas da mesma rota
+    same = group[1:] == group[:-1]
+    gaps = np.bincount(
+        group[1:][same], weights=sq[1:][same] - sq[:-1][same] != 1, minlength=n_routes
+    )
+    ranks, tied = sq_ranks(group, sq, n_routes)
+    discordant = route_inversions(group, pos, ranks, n_routes)
+
+    pairs = sizes * (sizes - 1) / 2
+    concordant = pairs - tied - discordant
+    with np.errstate(invalid="ignore", divide="ignore"):
+        tau = (concordant - discordant) / np.sqrt((pairs - tied) * pairs)
+
+    # Posição planejada: ordem por rota e sq_plan (empates mantêm a ordem real)
+    planned = np.lexsort((pos, sq, group))
+    planned_pos = np.empty(n, dtype=np.int64)
+    planned_pos[planned] = np.arange(n) - starts[group[planned]]
+    displacement = np.abs(pos - planned_pos)
+    largest = (
+        np.maximum.reduceat(displacement, starts) if n_routes else np.empty(0, int)
+    )
+
+    return pd.DataFrame(
+        {
+            "codigo_rota": routes.take(route[starts]) if n_routes else [],
+            "paradas": sizes,
+            "sequencia_planejada": gaps == 0,
+            "inversoes": discordant.astype(np.int64),
+            "kendall_tau": tau,
+            "maior_deslocamento": largest,
+        },
+        columns=QUALITY_COLUMNS,
+    )
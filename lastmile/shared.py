@@ -0,0 +1,118 @@
+"""Base de entregas compartilhada entre processos do servidor.
+
+Um processo publica as colunas tipadas em um arquivo Arrow IPC sem
+compressão, em um único bloco por coluna e sem bitmaps de validade (NaN e
+NaT ficam nos próprios valores). Qualquer processo que mapeia o arquivo
+recebe visões NumPy somente leitura sobre as páginas do arquivo, sem cópia:
+réplicas do Streamlit na mesma máquina dividem a mesma memória (page cache)
+em vez de manter uma cópia cada.
+
+Colunas de texto com poucos valores viram dicionários (categorias). A
+``remessa``, que tem um valor por linha, fica como texto Arrow
+(``pd.ArrowDtype``), também sem cópia.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from lastmile.loader import write_atomic
+
+SHARED_PREFIX = "_shared"
+# Colunas mantidas como texto Arrow em vez de categorias
+TEXT_COLUMNS = ["remessa"]
+
+
+def shared_path(directory, version: str):
+    return directory / f"{SHARED_PREFIX}-{version}.arrow"
+
+
+def _to_arrow(series: pd.Series) -> pa.Array:
+    values = series.to_numpy()
+    if series.dtype.kind in "iuf":
+        # NaN continua como valor: sem bitmap de validade, a leitura é sem cópia
+        return pa.array(values, from_pandas=False)
+    if series.dtype.kind == "M":
+        ns = series.to_numpy(dtype="datetime64[ns]").view("i8")
+        return pa.Array.from_buffers(
+            pa.timestamp("ns"), len(ns), [None, pa.py_buffer(np.ascontiguousarray(ns))]
+        )
+    if series.name in TEXT_COLUMNS:
+        return pa.array(series.astype(str).to_numpy(), type=pa.large_string())
+    return pa.array(series.astype("category"))
+
+
+def publish(df: pd.DataFrame, target) -> None:
+    """
+    Writes ``df`` as a shared dataset file, replacing older versions
+
+    Files of previous versions are unlinked; processes that still map them
+    keep their pages until they move on.
+    """
+    table = pa.table({col: _to_arrow(df[col]) for col in df.columns})
+    write_atomic(
+        target,
+        lambda tmp: feather.write_feather(
+            table, tmp, compression="uncompressed", chunksize=max(len(df), 1)
+        ),
+    )
+    for old in target.parent.glob(f"{SHARED_PREFIX}-*.arrow"):
+        if old != target:
+            old.unlink(missing_ok=True)
+
+
+def _types_mapper(arrow_type):
+    if pa.types.is_large_string(arrow_type) or pa.types.is_string(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def attach(target) -> pd.DataFrame:
+    """
+    Maps a file written by ``publish`` as a read-only dataframe
+
+    Numeric and datetime columns are NumPy views over the mapped file;
+    writing to them raises ``ValueError``.
+    """
+    table = feather.read_table(target, memory_map=True)
+    return table.to_pandas(split_blocks=True, types_mapper=_types_mapper)
+
+
+def _day(timestamp: pd.Timestamp) -> np.datetime64:
+    return np.datetime64(timestamp.normalize().date(), "D")
+
+
+def day_slice(df: pd.DataFrame, column: str, start=None, end=None) -> pd.DataFrame:
+    """
+    Rows with ``column`` in ``[start, end]``, as a view when rows are in day order
+
+    Whole-date ``end`` values cover the whole day. Rows grouped by day (the
+    order of the partitioned store) give a zero-copy slice; otherwise the
+    rows are filtered with a mask.
+    """
+    lo = None if start is None else pd.Timestamp(start)
+    hi = None if end is None else pd.Timestamp(end)
+    if hi is not None and hi == hi.normalize():
+        hi = hi + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+
+    values = df[column].to_numpy(dtype="datetime64[ns]")
+    days = values.astype("datetime64[D]")
+    if np.all(days[1:] >= days[:-1]):
+        first = 0 if lo is None else np.searchsorted(days, _day(lo), "left")
+        last = len(df) if hi is None else np.searchsorted(days, _day(hi), "right")
+        part = df.iloc[first:last]
+        inside = np.ones(len(part), dtype=bool)
+        window = values[first:last]
+        if lo is not None:
+            inside &= window >= lo.to_datetime64()
+        if hi is not None:
+            inside &= window <= hi.to_datetime64()
+        return part if inside.all() else part[inside]
+
+    inside = np.ones(len(df), dtype=bool)
+    if lo is not None:
+        inside &= values >= lo.to_datetime64()
+    if hi is not None:
+        inside &= values <= hi.to_datetime64()
+    return df[inside]
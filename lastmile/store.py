@@ -0,0 +1,311 @@
+"""Base de entregas particionada por dia de entrega.
+
+Layout em disco (um arquivo Feather por dia, opcionalmente por transportadora)::
+
+    data/entregas/
+        _manifest.json
+        dia=2022-11-01/part.feather
+        dia=2022-11-02/transportadora=Transportadora%20A.feather
+
+O manifesto guarda, para cada partição, o número de linhas e os limites de
+``data_entrega`` e ``rota_inicio``. As leituras usam esses limites para abrir
+apenas as partições que cruzam o período selecionado.
+
+Uso::
+
+    python -m lastmile.store data/dados_entregas_last_mile.csv [--por-transportadora]
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import uuid
+from pathlib import Path
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from lastmile.loader import (
+    COLUMNS,
+    DATA_PATH,
+    empty_deliveries,
+    read_csv,
+    write_atomic,
+)
+
+# ``LASTMILE_STORE`` aponta o app para outra base particionada
+STORE_PATH = Path(os.environ.get("LASTMILE_STORE", "data/entregas"))
+MANIFEST_NAME = "_manifest.json"
+PARTITION_COLUMN = "data_entrega"
+RANGE_COLUMNS = ["data_entrega", "rota_inicio"]
+
+
+def _day_of(df: pd.DataFrame) -> pd.Series:
+    return df[PARTITION_COLUMN].dt.normalize()
+
+
+def _partition_file(day, carrier=None) -> str:
+    name = "part" if carrier is None else f"transportadora={quote(carrier, safe='')}"
+    return f"dia={day:%Y-%m-%d}/{name}.feather"
+
+
+def read_manifest(root=STORE_PATH) -> dict:
+    """
+    Reads the partition manifest of a store
+
+    Returns:
+        dict: ``{"version": str, "by_carrier": bool, "partitions": [...]}``;
+        an empty manifest when the store does not exist
+    """
+    try:
+        return json.loads((Path(root) / MANIFEST_NAME).read_text())
+    except FileNotFoundError:
+        return {"version": None, "by_carrier": False, "partitions": []}
+
+
+def _write_manifest(root: Path, manifest: dict) -> None:
+    manifest["version"] = uuid.uuid4().hex[:16]
+    manifest["partitions"].sort(key=lambda p: p["path"])
+    write_atomic(
+        root / MANIFEST_NAME,
+        lambda tmp: tmp.write_text(json.dumps(manifest, indent=1)),
+    )
+
+
+def store_exists(root=STORE_PATH) -> bool:
+    return (Path(root) / MANIFEST_NAME).exists()
+
+
+def store_version(root=STORE_PATH):
+    """Identifier that changes on every write to the store"""
+    return read_manifest(root)["version"]
+
+
+def _partition_stats(part: pd.DataFrame) -> dict:
+    stats = {"rows": len(part)}
+    for col in RANGE_COLUMNS:
+        stats[f"{col}_min"] = str(part[col].min())
+        stats[f"{col}_max"] = str(part[col].max())
+    return stats
+
+
+def _own_categories(part: pd.DataFrame) -> pd.DataFrame:
+    # Sem isso cada arquivo levaria o dicionário da base inteira (uma
+    # categoria por remessa), lido de novo a cada partição aberta
+    for col in part.select_dtypes("category"):
+        part[col] = part[col].cat.remove_unused_categories()
+    return part
+
+
+def write_partitions(df: pd.DataFrame, root=STORE_PATH, by_carrier=None) -> list:
+    """
+    Writes ``df`` to the store, replacing the partitions of the days it covers
+
+    Args:
+        df (pd.DataFrame): Typed dataframe (``COLUMNS`` layout)
+        root: Store directory
+        by_carrier (bool): Also split each day by ``transportadora``; defaults
+            to the layout already used by the store
+
+    Returns:
+        list: Manifest entries of the written partitions
+    """
+    root = Path(root)
+    manifest = read_manifest(root)
+    if by_carrier is None:
+        by_carrier = manifest["by_carrier"]
+    elif manifest["partitions"] and by_carrier != manifest["by_carrier"]:
+        raise ValueError("O layout da base já existente é diferente do solicitado")
+    manifest["by_carrier"] = by_carrier
+
+    keys = [_day_of(df)]
+    if by_carrier:
+        keys.append(df["transportadora"])
+
+    written = []
+    for key, part in df[COLUMNS].groupby(keys, sort=True, observed=True):
+        day, carrier = (key[0], key[1]) if by_carrier else (key[0], None)
+        rel = _partition_file(day, carrier)
+        part = _own_categories(part.reset_index(drop=True))
+        write_atomic(
+            root / rel,
+            lambda tmp: feather.write_feather(part, tmp, compression="uncompressed"),
+        )
+        written.append(
+            {
+                "path": rel,
+                "dia": f"{day:%Y-%m-%d}",
+                "transportadora": carrier,
+                **_partition_stats(part),
+            }
+        )
+
+    replaced = {p["path"] for p in written}
+    manifest["partitions"] = [
+        p for p in manifest["partitions"] if p["path"] not in replaced
+    ] + written
+    _write_manifest(root, manifest)
+    return written
+
+
+def _overlaps(part: dict, column: str, start, end) -> bool:
+    if start is not None and pd.Timestamp(part[f"{column}_max"]) < start:
+        return False
+    if end is not None and pd.Timestamp(part[f"{column}_min"]) > end:
+        return False
+    return True
+
+
+def _bounds(start, end):
+    start = None if start is None else pd.Timestamp(start)
+    if end is not None:
+        end = pd.Timestamp(end)
+        # Datas sem horário cobrem o dia inteiro
+        if end == end.normalize():
+            end = end + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+    return start, end
+
+
+def select_partitions(
+    root=STORE_PATH, start=None, end=None, column=PARTITION_COLUMN, carriers=None
+) -> list:
+    """
+    Returns the manifest entries that can contain rows of the given window
+
+    Args:
+        root: Store directory
+        start: First date/time of the window (inclusive); ``None`` is open
+        end: Last date/time of the window (inclusive); ``None`` is open
+        column (str): ``data_entrega`` or ``rota_inicio``
+        carriers (list): Restrict to these ``transportadora`` values
+
+    Returns:
+        list: Manifest entries
+    """
+    if column not in RANGE_COLUMNS:
+        raise ValueError(f"Coluna sem estatísticas de partição: {column}")
+    start, end = _bounds(start, end)
+    parts = [
+        p for p in read_manifest(root)["partitions"] if _overlaps(p, column, start, end)
+    ]
+    if carriers is not None:
+        # Partições por dia podem misturar transportadoras; o filtro fica no load
+        parts = [p for p in parts if p["transportadora"] in (None, *carriers)]
+    return parts
+
+
+def load_partitions(
+    root=STORE_PATH,
+    start=None,
+    end=None,
+    column=PARTITION_COLUMN,
+    carriers=None,
+    columns=None,
+) -> pd.DataFrame:
+    """
+    Loads only the partitions overlapping ``[start, end]`` on ``column``
+
+    Rows of the selected partitions that fall outside the window are dropped,
+    so the result is the same as filtering the whole history.
+
+    Args:
+        root: Store directory
+        start: First date/time of the window (inclusive); ``None`` is open
+        end: Last date/time of the window (inclusive); ``None`` is open
+        column (str): ``data_entrega`` or ``rota_inicio``
+        carriers (list): Restrict to these ``transportadora`` values
+        columns (list): Columns to read; all of ``COLUMNS`` by default
+
+    Returns:
+        pd.DataFrame: Typed dataframe
+    """
+    root = Path(root)
+    columns = list(COLUMNS if columns is None else columns)
+    read_columns = columns + [
+        c for c in (column, "transportadora") if c not in columns
+    ]
+    parts = select_partitions(root, start, end, column, carriers)
+    if not parts:
+        # Mesmo esquema de uma janela com linhas, para os .dt/.cat das páginas
+        return empty_deliveries()[columns]
+
+    tables = [
+        feather.read_table(root / p["path"], columns=read_columns, memory_map=True)
+        for p in parts
+    ]
+    # Partições gravadas em lotes diferentes podem ter índices de categoria
+    # de larguras diferentes (int8/int16); a promoção unifica os esquemas
+    df = pa.concat_tables(tables, promote_options="permissive").to_pandas(
+        split_blocks=True
+    )
+    # Cada partição tem só as suas categorias; juntas, elas ficam na ordem em
+    # que aparecem, e não em ordem alfabética como no CSV tipado
+    for col in df.select_dtypes("category"):
+        categories = df[col].cat.categories
+        if not categories.is_monotonic_increasing:
+            df[col] = df[col].cat.set_categories(categories.sort_values())
+
+    lo, hi = _bounds(start, end)
+    mask = pd.Series(True, index=df.index)
+    if lo is not None:
+        mask &= df[column] >= lo
+    if hi is not None:
+        mask &= df[column] <= hi
+    if carriers is not None:
+        mask &= df["transportadora"].isin(carriers)
+    if not mask.all():
+        df = df[mask.to_numpy()].reset_index(drop=True)
+    return df[columns]
+
+
+def store_bounds(root=STORE_PATH, column=PARTITION_COLUMN):
+    """Returns the ``(min, max)`` timestamps of ``column`` over the whole store"""
+    parts = read_manifest(root)["partitions"]
+    if not parts:
+        return None, None
+    return (
+        min(pd.Timestamp(p[f"{column}_min"]) for p in parts),
+        max(pd.Timestamp(p[f"{column}_max"]) for p in parts),
+    )
+
+
+def default_window(root=STORE_PATH, days=31):
+    """
+    Returns the last ``days`` days of history as a ``(start, end)`` date pair
+    """
+    first, last = store_bounds(root)
+    if last is None:
+        return None
+    end = last.date()
+    return max(first.date(), end - dt.timedelta(days=days - 1)), end
+
+
+def build_store(csv_path=DATA_PATH, root=STORE_PATH, by_carrier=False) -> list:
+    """
+    Builds (or refreshes) the store from a full CSV extract
+
+    Returns:
+        list: Manifest entries of the written partitions
+    """
+    return write_partitions(read_csv(csv_path), root, by_carrier)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Gera a base particionada por dia a partir de um CSV"
+    )
+    parser.add_argument("csv", nargs="?", default=str(DATA_PATH))
+    parser.add_argument("--destino", default=str(STORE_PATH))
+    parser.add_argument("--por-transportadora", action="store_true")
+    args = parser.parse_args(argv)
+
+    written = build_store(args.csv, args.destino, args.por_transportadora)
+    rows = sum(p["rows"] for p in written)
+    print(f"{len(written)} partições gravadas ({rows} linhas) em {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Bases sintéticas no layout de ``dados_entregas_last_mile.csv``.
+
+As rotas são sorteadas (com reposição) da base real: cada rota sintética
+copia de uma rota modelo o número de paradas, a sequência planejada e a
+ordem em que as entregas de fato aconteceram (os desvios de ``sq_plan``),
+os CEPs, as distâncias, a transportadora e o veículo. Horários e distâncias
+recebem ruído multiplicativo, o dia de cada rota segue o peso de cada dia da
+semana na base real e os códigos de rota e de remessa são novos e únicos.
+
+Os lotes são gerados em paralelo (um processo por lote, com semente
+própria, então o resultado não depende do número de processos) e gravados
+em ``entregas.csv`` (mesmo separador e cabeçalho do original) e/ou em
+Parquet particionado por dia no layout de ``lastmile.duck``. Uso::
+
+    python -m lastmile.synthetic --linhas 10000000 --dias 120 --destino data/sintetico
+"""
+
+import argparse
+import datetime as dt
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lastmile import duck
+from lastmile.loader import (
+    CSV_DTYPES,
+    CSV_SEP,
+    DATA_PATH,
+    DATETIME_FORMAT,
+    parse_deliveries,
+    read_csv,
+    write_atomic,
+)
+
+SYNTHETIC_PATH = Path("data/sintetico")
+CSV_NAME = "entregas.csv"
+PARQUET_NAME = "parquet"
+CHUNK_ROWS = 1_000_000
+# Desvio do horário de início da rota (segundos) e do ruído multiplicativo
+# de durações e distâncias
+START_JITTER = 30 * 60
+TIME_NOISE = 0.1
+DISTANCE_NOISE = 0.1
+# Permutação de 0..10¹⁰-1 que espalha os códigos de remessa (A é primo com 10)
+REMESSA_SPACE = 10**10
+REMESSA_A = 7_919_333_117
+REMESSA_B = 1_894_842_301
+
+
+def _factorize(values: pd.Series):
+    # Códigos e valores; o código -1 (ausente) aponta para o NaN no fim
+    codes, uniques = pd.factorize(values)
+    return codes, np.append(np.asarray(uniques, dtype=object), np.nan)
+
+
+def route_templates(df: pd.DataFrame) -> dict:
+    """
+    Route shapes and distributions of a real delivery extract
+
+    Args:
+        df (pd.DataFrame): Typed delivery rows (``loader.read_csv``)
+
+    Returns:
+        dict: NumPy arrays per delivery (in actual delivery order within
+        each route) and per route, category values and weekday weights
+    """
+    df = df.dropna(subset=["codigo_rota", "rota_inicio"])
+    order = df.sort_values(["codigo_rota", "data_entrega"], kind="stable")
+    codes = order["codigo_rota"].cat.codes.to_numpy()
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    first = order.iloc[starts]
+
+    inicio = first["rota_inicio"]
+    cep_codes, ceps = _factorize(order["cep"].astype(object))
+    carrier_codes, carriers = _factorize(first["transportadora"])
+    vehicle_codes, vehicles = _factorize(first["veiculo"])
+    weekdays = np.bincount(inicio.dt.dayofweek.to_numpy(), minlength=7)
+    return {
+        "sizes": np.diff(np.r_[starts, len(order)]),
+        "starts": starts,
+        "sq_plan": order["sq_plan"].to_numpy(dtype=np.int64),
+        "offset": (order["data_entrega"] - order["rota_inicio"])
+        .dt.total_seconds()
+        .to_numpy(),
+        "distancia": order["distancia"].to_numpy(dtype=float),
+        "cep": cep_codes,
+        "ceps": ceps,
+        "inicio": (inicio - inicio.dt.normalize()).dt.total_seconds().to_numpy(),
+        "duracao": (first["rota_final"] - inicio).dt.total_seconds().to_numpy(),
+        "distancia_rota": first["distancia_rota"].to_numpy(dtype=float),
+        "transportadora": carrier_codes,
+        "transportadoras": carriers,
+        "veiculo": vehicle_codes,
+        "veiculos": vehicles,
+        "weekdays": weekdays / weekdays.sum(),
+    }
+
+
+def _timestamps(base: np.ndarray, seconds: np.ndarray) -> pd.Series:
+    # Segundos inteiros, como no CSV; NaN vira data vazia
+    whole = np.round(seconds)
+    values = base + pd.to_timedelta(np.where(np.isnan(whole), 0, whole), unit="s")
+    return pd.Series(values).where(~np.isnan(whole))
+
+
+def _remessas(ids: np.ndarray) -> pd.Series:
+    scrambled = (ids.astype(object) * REMESSA_A + REMESSA_B) % REMESSA_SPACE
+    scrambled = scrambled.astype(np.int64)
+    high = pd.Series(scrambled // 100_000).astype(str).str.zfill(5)
+    low = pd.Series(scrambled % 100_000).astype(str).str.zfill(5)
+    return high + "-" + low
+
+
+def generate_chunk(
+    templates: dict,
+    rows: int,
+    first_route: int,
+    first_row: int,
+    start,
+    days: int,
+    seed,
+) -> pd.DataFrame:
+    """
+    Generates about ``rows`` deliveries in the raw CSV layout
+
+    Whole routes are generated, so the chunk may end a few rows short.
+    Route codes start after ``first_route`` and remessa codes are derived
+    from ``first_row`` onwards, so chunks generated apart never collide.
+
+    Returns:
+        pd.DataFrame: Columns of ``loader.CSV_DTYPES``, dates as datetimes
+    """
+    rng = np.random.default_rng(seed)
+    sizes = templates["sizes"]
+    n_routes = int(rows / sizes.mean() * 1.2) + 1
+    picked = rng.integers(len(sizes), size=n_routes)
+    keep = max(int(np.searchsorted(np.cumsum(sizes[picked]), rows, "right")), 1)
+    picked = picked[:keep]
+    stops = sizes[picked]
+    total = int(stops.sum())
+
+    dates = pd.Timestamp(start).normalize() + pd.to_timedelta(np.arange(days), "D")
+    weights = templates["weekdays"][dates.dayofweek]
+    day = rng.choice(days, size=keep, p=weights / weights.sum())
+    route_start = dates.to_numpy()[day] + pd.to_timedelta(
+        np.round(
+            np.clip(
+                templates["inicio"][picked] + rng.normal(0, START_JITTER, keep),
+                0,
+                86_399,
+            )
+        ),
+        unit="s",
+    )
+    pace = rng.lognormal(0, TIME_NOISE, keep)
+    stretch = rng.lognormal(0, DISTANCE_NOISE, keep)
+
+    route = np.repeat(np.arange(keep), stops)
+    pos = np.arange(total) - np.repeat(np.cumsum(stops) - stops, stops)
+    source = templates["starts"][picked][route] + pos
+    route_start = route_start.to_numpy()
+
+    return pd.DataFrame(
+        {
+            "codigo_rota": (first_route + route + 1).astype(str),
+            "status_tracking": "Delivered",
+            "rota_inicio": route_start[route],
+            "rota_final": _timestamps(
+                route_start, templates["duracao"][picked] * pace
+            ).to_numpy()[route],
+            "hora_entrega": _timestamps(
+                route_start[route], templates["offset"][source] * pace[route]
+            ),
+            "sq_plan": templates["sq_plan"][source],
+            "cep": templates["ceps"][templates["cep"][source]],
+            "distancia": np.round(
+                templates["distancia"][source]
+                * rng.lognormal(0, DISTANCE_NOISE, total),
+                2,
+            ),
+            "distancia_rota": np.round(
+                templates["distancia_rota"][picked] * stretch, 3
+            )[route],
+            "remessa": _remessas(first_row + np.arange(total)),
+            "transportadora": templates["transportadoras"][
+                templates["transportadora"][picked]
+            ][route],
+            "veiculo": templates["veiculos"][templates["veiculo"][picked]][route],
+        },
+        columns=list(CSV_DTYPES),
+    )
+
+
+def _write_chunk(task: dict) -> dict:
+    raw = generate_chunk(
+        task["templates"],
+        task["rows"],
+        task["first_route"],
+        task["first_row"],
+        task["start"],
+        task["days"],
+        task["seed"],
+    )
+    if task["csv"] is not None:
+        raw.to_csv(
+            task["csv"],
+            sep=CSV_SEP,
+            index=False,
+            header=False,
+            date_format=DATETIME_FORMAT,
+        )
+    if task["parquet"] is not None:
+        return duck.write_chunk(parse_deliveries(raw), task["parquet"], task["chunk"])
+    return {"rows": len(raw)}
+
+
+def _concat_csv(parts: list, target: Path) -> None:
+    def write(tmp):
+        with open(tmp, "wb") as out:
+            out.write((CSV_SEP.join(CSV_DTYPES) + "\n").encode())
+            for part in parts:
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+
+    write_atomic(target, write)
+    for part in parts:
+        part.unlink()
+
+
+def generate(
+    rows: int,
+    target=SYNTHETIC_PATH,
+    days: int = 90,
+    start="2022-11-01",
+    formats=("csv", "parquet"),
+    source=DATA_PATH,
+    chunk_rows: int = CHUNK_ROWS,
+    workers=None,
+    seed: int = 0,
+) -> dict:
+    """
+    Generates a synthetic dataset of about ``rows`` deliveries in ``target``
+
+    Args:
+        rows (int): Number of deliveries
+        target: Output directory (``entregas.csv`` and ``parquet/``)
+        days (int): Days of history, starting at ``start``
+        formats: ``csv`` and/or ``parquet``
+        source: Real extract the distributions are taken from
+        chunk_rows (int): Deliveries per chunk (one process task each)
+        workers (int): Processes; all cores by default
+        seed (int): Seed of the whole dataset
+
+    Returns:
+        dict: ``rows`` written and the Parquet manifest, when written
+    """
+    target = Path(target)
+    target.mkdir(parents=True, exist_ok=True)
+    templates = route_templates(read_csv(source))
+    n_chunks = max(-(-rows // chunk_rows), 1)
+    staging = duck.staging_dir(target / PARQUET_NAME) if "parquet" in formats else None
+
+    csv = "csv" in formats
+    tasks = []
+    for i in range(n_chunks):
+        chunk = min(chunk_rows, rows - i * chunk_rows)
+        tasks.append(
+            {
+                "templates": templates,
+                "rows": chunk,
+                "chunk": i,
+                # Cada lote tem no máximo ``chunk_rows`` rotas e remessas
+                "first_route": i * chunk_rows,
+                "first_row": i * chunk_rows,
+                "start": start,
+                "days": days,
+                "seed": [seed, i],
+                "csv": target / f"{CSV_NAME}.{i:05d}.part" if csv else None,
+                "parquet": staging,
+            }
+        )
+    with ProcessPoolExecutor(workers) as pool:
+        written = list(pool.map(_write_chunk, tasks))
+
+    result = {"rows": sum(w["rows"] for w in written)}
+    if csv:
+        _concat_csv([t["csv"] for t in tasks], target / CSV_NAME)
+    if staging is not None:
+        result["manifest"] = duck.write_manifest(staging, written)
+        duck.replace_export(staging, target / PARQUET_NAME)
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Gera uma base sintética no layout do CSV de entregas"
+    )
+    parser.add_argument("--linhas", type=int, default=1_000_000)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--inicio", default="2022-11-01")
+    parser.add_argument("--destino", default=str(SYNTHETIC_PATH))
+    parser.add_argument(
+        "--formatos", nargs="+", choices=["csv", "parquet"], default=["csv", "parquet"]
+    )
+    parser.add_argument("--base", default=str(DATA_PATH))
+    parser.add_argument("--linhas-por-lote", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--processos", type=int, default=None)
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = generate(
+        args.linhas,
+        args.destino,
+        args.dias,
+        dt.date.fromisoformat(args.inicio),
+        args.formatos,
+        args.base,
+        args.linhas_por_lote,
+        args.processos,
+        args.semente,
+    )
+    print(f"{result['rows']} linhas gravadas em {args.destino}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Aquecimento dos caches do servidor em segundo plano.
+
+``Renner_lastmile.py`` chama ``start`` a cada execução; a primeira dispara
+uma thread que carrega a base e calcula, pelos mesmos caches das páginas,
+tudo o que as visões padrão usam: estatísticas dos filtros, índice bitmap,
+cubo, rotas, qualidade das rotas, sketches de quantis, estatísticas de
+correlação e as figuras sem filtros de ``2_Gráficos.py`` e
+``3_Propostas.py``. As páginas mostram o andamento com
+``widgets.warmup_status(warmup.current())``; quem chega durante o
+aquecimento espera pelo mesmo cálculo em vez de repeti-lo.
+
+Um novo aquecimento só começa quando a versão da base muda ou o anterior
+falhou.
+"""
+
+import threading
+import time
+
+from lastmile import data, figures, widgets
+from lastmile.quantiles import filter_sketches
+
+IDLE = "inativo"
+
+_lock = threading.Lock()
+_current = None
+
+
+def _steps() -> list:
+    state = {}
+
+    def load():
+        bounds = data.default_period()
+        state["period"] = bounds[2] if bounds else None
+        state["df"] = data.get_data(period=state["period"])
+        # Páginas 1 e 2 trabalham sem a sequência planejada
+        state["slim"] = state["df"].drop(columns="sq_plan")
+
+    def sketches():
+        period = state["period"]
+        spec = [("data_entrega", "between", period)] if period else ()
+        state["dfq3"] = filter_sketches(data.get_sketches(), spec)
+
+    def quality():
+        state["dfq1"] = widgets.get_route_quality(state["df"])
+
+    def q2():
+        state["dfq2"] = figures.q2_frame(state["df"])
+
+    def page2(chart_id, build, *args):
+        return chart_id, "slim", (), lambda: build(state["slim"], (), *args)
+
+    charts = [
+        page2("entregas_cep", figures.entregas_cep),
+        page2("media_horas_cep", figures.media_horas_cep),
+        page2("correlacao_pearson", figures.correlacao, "pearson"),
+        page2("entregas_dia", figures.entregas_dia),
+        ("q1_sequencia", "df", (), lambda: figures.q1_sequencia(state["dfq1"])),
+        ("q2_cep_dia", "df", (), lambda: figures.q2_cep_dia(state["dfq2"])),
+        ("q2_total_dia", "df", (), lambda: figures.q2_total_dia(state["dfq2"])),
+        (
+            "q3_horas",
+            "df",
+            figures.q3_state([], "dia"),
+            lambda: figures.q3_horas(state["dfq3"], "dia"),
+        ),
+        (
+            "q4_horas_distancia",
+            "df",
+            (),
+            lambda: figures.q4_horas_distancia(state["df"]),
+        ),
+    ]
+
+    def figure(chart_id, frame, spec, build):
+        return lambda: widgets.cached_figure(state[frame], chart_id, spec, build)
+
+    return [
+        ("base", load),
+        ("filtros", lambda: widgets.get_column_stats(state["slim"])),
+        ("índice bitmap", lambda: widgets.get_bitmap_index(state["slim"])),
+        ("cubo", lambda: widgets.get_cube(state["df"])),
+        ("rotas", lambda: widgets.get_routes(state["slim"])),
+        ("qualidade das rotas", quality),
+        ("sketches de quantis", sketches),
+        ("correlação", lambda: widgets.correlation_matrix(state["slim"], ())),
+        ("q2", q2),
+    ] + [(f"figura {chart[0]}", figure(*chart)) for chart in charts]
+
+
+class WarmUp:
+    """
+    One background warm-up of the caches for a dataset version
+
+    Attributes:
+        state (str): ``WARMING``, ``READY`` or ``FAILED``
+        step (str): Step being run (or the one that failed)
+        done (int): Steps finished, out of ``total``
+    """
+
+    WARMING = "aquecendo"
+    READY = "pronto"
+    FAILED = "erro"
+
+    def __init__(self, version: str):
+        self.version = version
+        self.state = self.WARMING
+        self.step = None
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._steps = _steps()
+        self.total = len(self._steps)
+        self.done = 0
+        self._thread = threading.Thread(
+            target=self._run, name="lastmile-warmup", daemon=True
+        )
+
+    def _run(self) -> None:
+        try:
+            for name, step in self._steps:
+                self.step = name
+                step()
+                self.done += 1
+            self.state = self.READY
+        except Exception as exc:
+            self.error = f"{type(exc).__name__}: {exc}"
+            self.state = self.FAILED
+        finally:
+            self.finished = time.time()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+
+def start() -> WarmUp:
+    """
+    Starts the warm-up unless one is running or finished for the current
+    dataset version
+
+    Returns:
+        WarmUp: The running or last warm-up
+    """
+    global _current
+    version = data.data_version()
+    with _lock:
+        previous = _current
+        stale = previous is None or previous.version != version
+        if stale or previous.state == WarmUp.FAILED:
+            _current = WarmUp(version)
+            _current._thread.start()
+        return _current
+
+
+def current():
+    """The running or last warm-up of this process, or ``None``"""
+    return _current
+
+
+def status() -> str:
+    warmup = _current
+    return IDLE if warmup is None else warmup.state
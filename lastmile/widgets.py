@@ -0,0 +1,646 @@
+"""Componentes de interface compartilhados pelas páginas."""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+from lastmile.bitmap import build_bitmap_index
+from lastmile.charts import heatmap_cells
+from lastmile.correlation import (
+    CORRELATION_COLUMNS,
+    build_moments,
+    build_rank_sketches,
+    pearson,
+    spearman,
+)
+from lastmile import data, duck, polars_engine, precompute
+from lastmile.cube import build_cube, can_answer, filter_cube, rollup
+from lastmile.figcache import FigureCache, figure_key
+from lastmile.filters import apply_filters, column_stats, normalize_spec
+from lastmile.instrument import (
+    attach,
+    current_run,
+    finish_run,
+    profilers,
+    stage,
+    start_run,
+)
+from lastmile.memory import frame_memory, process_rss
+from lastmile.routes import route_quality, split_routes, top_n
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_sql(version: str, query: str, root: str, spec: tuple, *args):
+    return getattr(duck, query)(root, spec, *args)
+
+
+def _sql(df: pd.DataFrame, query: str, spec=(), *args):
+    """
+    Runs ``duck.<query>`` for a frame of the duckdb backend
+
+    The period selected in ``get_data`` is added to ``spec``; results are
+    cached per dataset version, query and arguments.
+    """
+    root, base = duck.source_of(df)
+    spec = normalize_spec(base + tuple(spec))
+    return _cached_sql(df.attrs.get("version"), query, root, spec, *args)
+
+
+def frame_key(df: pd.DataFrame):
+    """
+    Cache key of ``df``: dataset version, columns and number of rows
+
+    Pages drop or reorder columns of the same version (and filtered frames
+    keep it), so the version alone does not identify the frame. Returns
+    ``None`` for dataframes without ``attrs["version"]``.
+    """
+    version = df.attrs.get("version")
+    if version is None:
+        return None
+    return f"{version}:{','.join(df.columns)}:{len(df)}"
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _cached_polars_frame(version: str, _df: pd.DataFrame):
+    return polars_engine.from_pandas(_df)
+
+
+def _polars_frame(df: pd.DataFrame):
+    """
+    Polars copy of ``df`` shared by every session, built once per version
+
+    Returns ``None`` outside the polars backend and for dataframes without
+    a version.
+    """
+    key = frame_key(df)
+    if data.BACKEND != "polars" or key is None:
+        return None
+    return _cached_polars_frame(key, df)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _cached_column_stats(version: str, _df: pd.DataFrame) -> dict:
+    return column_stats(_df)
+
+
+def get_column_stats(df: pd.DataFrame) -> dict:
+    """
+    Returns ``column_stats(df)``, computed once per dataset version
+
+    The version is read from ``df.attrs["version"]`` (set by ``get_data``);
+    dataframes without it are not cached.
+    """
+    if duck.source_of(df):
+        return _sql(df, "column_stats", (), tuple(df.columns))
+    key = frame_key(df)
+    if key is None:
+        return column_stats(df)
+    return _cached_column_stats(key, df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _cached_bitmap_index(version: str, _df: pd.DataFrame) -> dict:
+    return build_bitmap_index(_df)
+
+
+def get_bitmap_index(df: pd.DataFrame):
+    """
+    Returns the bitmap index of ``df``, built once per dataset version
+
+    The index is shared (not copied) between sessions and must be treated as
+    read-only. Returns ``None`` for dataframes without a version.
+    """
+    key = frame_key(df)
+    if key is None:
+        return None
+    return _cached_bitmap_index(key, df)
+
+
+def filter_ui(stats: dict, label: str = "Filtrar dados:") -> tuple:
+    """
+    Renders the filter widgets and returns the selection as a filter spec
+
+    Args:
+        stats (dict): Output of ``column_stats``
+        label (str): Label of the column selector
+
+    Returns:
+        tuple: ``(column, op, value)`` conditions
+    """
+    spec = []
+    modification_container = st.container()
+
+    with modification_container:
+        to_filter_columns = st.multiselect(label, list(stats))
+        for column in to_filter_columns:
+            info = stats[column]
+            left, right = st.columns((1, 20))
+            if info["kind"] == "categorical":
+                user_cat_input = right.multiselect(
+                    f"Valores para {column}",
+                    info["values"],
+                    default=info["values"],
+                )
+                # Todos os valores selecionados não restringem nada
+                if len(user_cat_input) < len(info["values"]):
+                    spec.append((column, "isin", tuple(user_cat_input)))
+            elif info["kind"] == "numeric":
+                _min = float(info["min"])
+                _max = float(info["max"])
+                step = (_max - _min) / 100
+                user_num_input = right.slider(
+                    f"Valores para {column}",
+                    min_value=_min,
+                    max_value=_max,
+                    value=(_min, _max),
+                    step=step,
+                )
+                spec.append((column, "between", tuple(user_num_input)))
+            elif info["kind"] == "datetime":
+                user_date_input = right.date_input(
+                    f"Valores para {column}",
+                    value=(info["min"], info["max"]),
+                )
+                if len(user_date_input) == 2:
+                    spec.append((column, "between", tuple(user_date_input)))
+            else:
+                user_text_input = right.text_input(
+                    f"Texto ou regex em {column}",
+                )
+                if user_text_input:
+                    spec.append((column, "contains", user_text_input))
+
+    return tuple(spec)
+
+
+def filter_spec(df: pd.DataFrame, label: str = "Filtrar dados:") -> tuple:
+    """
+    Renders the filter widgets for ``df`` and returns the selected spec
+
+    The rows are not filtered; use ``apply_spec`` when they are needed.
+    """
+    return filter_ui(get_column_stats(df), label)
+
+
+@st.cache_data(show_spinner="Consultando entregas...", max_entries=4)
+def _cached_select(version: str, root: str, spec: tuple, columns: tuple):
+    return duck.select(root, spec, list(columns))
+
+
+def apply_spec(df: pd.DataFrame, spec) -> pd.DataFrame:
+    """
+    Filters ``df`` by ``spec`` using its cached bitmap index
+
+    Frames of the duckdb backend get the matching rows from a SQL query.
+    """
+    if duck.source_of(df):
+        root, base = duck.source_of(df)
+        spec = normalize_spec(base + tuple(spec))
+        rows = _cached_select(df.attrs.get("version"), root, spec, tuple(df.columns))
+        rows.attrs["version"] = df.attrs.get("version")
+        return rows
+    if not spec:
+        return df
+    frame = _polars_frame(df)
+    if frame is not None:
+        mask = polars_engine.compile_mask(frame, spec)
+        return df if mask.all() else df[mask]
+    return apply_filters(df, spec, get_bitmap_index(df))
+
+
+def filter_with_spec(df: pd.DataFrame, label: str = "Filtrar dados:"):
+    """
+    Same as ``filter_dataframe``, also returning the filter spec
+
+    Returns:
+        tuple: Filtered dataframe and the ``(column, op, value)`` conditions
+    """
+    spec = filter_spec(df, label)
+    return apply_spec(df, spec), spec
+
+
+def filter_dataframe(df: pd.DataFrame, label: str = "Filtrar dados:") -> pd.DataFrame:
+    """
+    Adds a UI on top of a dataframe to let viewers filter columns
+
+    Args:
+        df (pd.DataFrame): Original dataframe
+        label (str): Label of the column selector
+
+    Returns:
+        pd.DataFrame: Filtered dataframe
+    """
+    return filter_with_spec(df, label)[0]
+
+
+def _with_categories(frame: pd.DataFrame, df: pd.DataFrame, column: str):
+    # Artefatos pré-calculados voltam com as categorias de ``df``, como se
+    # tivessem sido montados a partir dele
+    if isinstance(df[column].dtype, pd.CategoricalDtype):
+        frame[column] = pd.Categorical(
+            frame[column].astype(str), categories=df[column].cat.categories
+        )
+    return frame
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_cube(version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    cube = data.get_precomputed(_df, "cubo")
+    if cube is not None:
+        return _with_categories(cube, _df, "cep")
+    frame = _polars_frame(_df)
+    return build_cube(_df) if frame is None else polars_engine.build_cube(frame)
+
+
+def get_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the delivery cube of ``df``, built once per dataset version
+
+    Dataframes without a version get a cube built on the spot.
+    """
+    key = frame_key(df)
+    if key is None:
+        return build_cube(df)
+    return _cached_cube(key, df)
+
+
+def rollup_or_group(df: pd.DataFrame, spec, by) -> pd.DataFrame:
+    """
+    Aggregates the filtered rows by ``by``, from the cube when possible
+
+    When every filter condition maps to cube dimensions the result is a
+    rollup of the (cached) cube of the unfiltered ``df``; otherwise the cube
+    of the filtered rows is built on the spot. With the duckdb backend the
+    aggregation runs in SQL.
+
+    Args:
+        df (pd.DataFrame): Unfiltered dataframe returned by ``get_data``
+        spec: Filter spec selected by the user
+        by (list): Cube dimensions to group by
+
+    Returns:
+        pd.DataFrame: Output of ``cube.rollup``
+    """
+    if duck.source_of(df):
+        return _sql(df, "rollup", spec, (by,) if isinstance(by, str) else tuple(by))
+    if can_answer(spec):
+        return rollup(filter_cube(get_cube(df), spec), by)
+    frame = _polars_frame(df)
+    if frame is not None:
+        return rollup(polars_engine.build_cube(frame, spec), by)
+    return rollup(build_cube(apply_spec(df, spec)), by)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_correlation_summaries(version: str, _df: pd.DataFrame) -> tuple:
+    moments = data.get_precomputed(_df, "momentos")
+    ranks = data.get_precomputed(_df, "postos")
+    if moments is not None and ranks is not None:
+        return moments, ranks
+    return build_moments(_df), build_rank_sketches(_df)
+
+
+def correlation_matrix(df: pd.DataFrame, spec, method: str = "pearson"):
+    """
+    Correlation of ``CORRELATION_COLUMNS`` over the filtered rows
+
+    When every filter condition maps to cube dimensions the matrix comes from
+    the (cached) sufficient statistics of the unfiltered ``df``; Spearman is
+    then approximate. Otherwise it is computed from the filtered rows.
+
+    Args:
+        df (pd.DataFrame): Unfiltered dataframe returned by ``get_data``
+        spec: Filter spec selected by the user
+        method (str): ``pearson`` or ``spearman``
+
+    Returns:
+        pd.DataFrame: Same layout as ``DataFrame.corr``
+    """
+    if duck.source_of(df):
+        return _sql(df, "correlation", spec, method)
+    key = frame_key(df)
+    frame = _polars_frame(df)
+    if frame is not None and not can_answer(spec):
+        return polars_engine.correlation(frame, spec, method)
+    if key is None or not can_answer(spec):
+        return apply_spec(df, spec)[CORRELATION_COLUMNS].corr(method=method)
+    moments, ranks = _cached_correlation_summaries(key, df)
+    if method == "spearman":
+        return spearman(filter_cube(ranks, spec))
+    return pearson(filter_cube(moments, spec))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_routes(version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    routes = data.get_precomputed(_df, "rotas")
+    if routes is not None:
+        return _with_categories(routes, _df, "codigo_rota")
+    return split_routes(_df)[0]
+
+
+def get_routes(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns the route table of ``df``, built once per dataset version"""
+    if duck.source_of(df):
+        return _sql(df, "routes")
+    key = frame_key(df)
+    if key is None:
+        return split_routes(df)[0]
+    return _cached_routes(key, df)
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_route_quality(version: str, _df: pd.DataFrame) -> pd.DataFrame:
+    quality = data.get_precomputed(_df, "qualidade_rotas")
+    if quality is not None:
+        return quality
+    frame = _polars_frame(_df)
+    return route_quality(_df) if frame is None else polars_engine.route_quality(frame)
+
+
+def get_route_quality(df: pd.DataFrame) -> pd.DataFrame:
+    """Returns ``route_quality(df)``, computed once per dataset version"""
+    if duck.source_of(df):
+        return _sql(df, "route_quality")
+    key = frame_key(df)
+    if key is None:
+        return route_quality(df)
+    return _cached_route_quality(key, df)
+
+
+def get_heatmap_cells(df: pd.DataFrame, x: str, y: str, z: str) -> pd.DataFrame:
+    """Returns ``charts.heatmap_cells`` of ``df``, in SQL or Polars by backend"""
+    if duck.source_of(df):
+        return _sql(df, "heatmap_cells", (), x, y, z)
+    if (x, y, z) == precompute.HEATMAP:
+        cells = data.get_precomputed(df, "calor")
+        if cells is not None:
+            return cells
+    frame = _polars_frame(df)
+    if frame is not None:
+        return polars_engine.heatmap_cells(frame, x, y, z)
+    return heatmap_cells(df, x, y, z)
+
+
+def get_top_n(df, frame, column: str, n: int, columns, whole: bool = False):
+    """
+    Returns ``routes.top_n(frame, column, n, columns)``
+
+    When ``frame`` holds every row (or route) of ``df``, the ranking comes
+    from ``lastmile.precompute`` if it was precomputed for this version.
+
+    Args:
+        df (pd.DataFrame): Dataframe returned by ``get_data``
+        frame (pd.DataFrame): Rows (or routes) to rank
+        column (str): Column ranked in descending order
+        n (int): Rows returned
+        columns (list): Columns returned
+        whole (bool): ``frame`` is not filtered
+    """
+    if whole and n <= precompute.TOP_ROWS:
+        table = data.get_precomputed(df, f"top_{column}")
+        if table is not None and set(columns) <= set(table.columns):
+            return table[list(columns)].head(n)
+    return top_n(frame, column, n, columns)
+
+
+@st.cache_resource(show_spinner=False)
+def get_figure_cache() -> FigureCache:
+    """Figure cache shared by every session of this server process"""
+    return FigureCache()
+
+
+def cached_figure(df: pd.DataFrame, chart_id: str, state, build):
+    """
+    Returns the figure ``chart_id`` for ``df`` and ``state`` from the shared cache
+
+    Args:
+        df (pd.DataFrame): Dataframe returned by ``get_data``
+        chart_id (str): Identifier of the chart within the app
+        state: Filter spec (or spec-like tuples) the figure depends on
+        build: Function building the figure on a cache miss
+
+    Returns:
+        go.Figure: Figure to pass to ``st.plotly_chart``
+    """
+    version = df.attrs.get("version")
+    with stage(f"figura: {chart_id}"):
+        if version is None:
+            return build()
+        key = figure_key(version, chart_id, state)
+        return get_figure_cache().get_or_build(key, build)
+
+
+# Threads que montam figuras, compartilhadas por todas as sessões do processo;
+# 0 monta as figuras em sequência, na thread da página
+CHART_THREADS = int(
+    os.environ.get("LASTMILE_CHART_THREADS", min(32, (os.cpu_count() or 1) + 4))
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_chart_pool() -> ThreadPoolExecutor:
+    """Thread pool shared by every session for building figures"""
+    return ThreadPoolExecutor(CHART_THREADS, thread_name_prefix="lastmile-graficos")
+
+
+class ChartBatch:
+    """
+    Charts of a page built concurrently in the shared thread pool
+
+    ``add`` leaves a placeholder where the chart goes and submits its figure
+    (through ``cached_figure``) to the pool; the page keeps running while the
+    figures are built. ``render``, called at the end of the page, draws each
+    chart as soon as its figure is ready. The batch is measured as one stage,
+    from the first submit to the last figure ready, with the stages of the
+    figures nested under it; the page's own stages in the meantime are not.
+
+    Args:
+        df (pd.DataFrame): Dataframe returned by ``get_data``
+        name (str): Name of the batch stage
+    """
+
+    def __init__(self, df: pd.DataFrame, name: str = "gráficos concorrentes"):
+        self.df = df
+        self.name = name
+        self._charts = {}
+        self._ctx = get_script_run_ctx()
+        self._run = current_run()
+        self._stage = None
+        self._started = None
+        self._ready = None
+        # Tempo somado das figuras, que é o do lote quando montadas em sequência
+        self._busy = 0.0
+        self._lock = threading.Lock()
+
+    def _measured(self, chart_id: str, state, build):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            with attach(self._run, self._stage):
+                return cached_figure(self.df, chart_id, state, build)
+        finally:
+            with self._lock:
+                if self._stage is not None:
+                    self._stage.cpu += time.thread_time() - cpu
+                self._ready = time.perf_counter()
+                self._busy += self._ready - wall
+
+    def _build(self, chart_id: str, state, build):
+        # Sem o contexto da sessão o Streamlit reclama a cada cache consultado
+        if self._ctx is not None:
+            add_script_run_ctx(threading.current_thread(), self._ctx)
+        return self._measured(chart_id, state, build)
+
+    def add(self, chart_id: str, state, build) -> None:
+        """
+        Reserves the place of a chart and starts building its figure
+
+        Args:
+            chart_id (str): Identifier of the chart within the app
+            state: Filter spec (or spec-like tuples) the figure depends on
+            build: Function building the figure on a cache miss
+        """
+        if self._started is None:
+            if self._run is not None:
+                self._stage = self._run.open_stage(self.name, self.df)
+                self._stage.cpu = 0.0
+            self._started = time.perf_counter()
+        placeholder = st.empty()
+        placeholder.caption("Calculando o gráfico...")
+        if CHART_THREADS:
+            future = get_chart_pool().submit(self._build, chart_id, state, build)
+        else:
+            future = Future()
+            future.set_result(self._measured(chart_id, state, build))
+        self._charts[future] = (chart_id, placeholder)
+
+    def render(self) -> None:
+        """Draws the charts in the order their figures become ready"""
+        try:
+            for future in as_completed(self._charts):
+                chart_id, placeholder = self._charts[future]
+                with stage(f"plotly_chart: {chart_id}"):
+                    placeholder.plotly_chart(
+                        future.result(), use_container_width=True
+                    )
+        except BaseException as exc:
+            if self._stage is not None:
+                self._stage.error = type(exc).__name__
+            raise
+        finally:
+            if self._stage is not None and self._ready is not None:
+                pooled = self._ready - self._started
+                self._stage.wall = pooled if CHART_THREADS else self._busy
+
+
+def memory_panel(frames: dict, base: pd.DataFrame) -> None:
+    """
+    Sidebar panel with the memory held by this session's dataframes
+
+    Args:
+        frames (dict): Name → dataframe built by the page
+        base (pd.DataFrame): Dataframe returned by ``get_data``
+    """
+    mb = 2**20
+    base_bytes = int(base.memory_usage(deep=True, index=False).sum())
+    rows = [
+        {
+            "objeto": "base",
+            "total (MB)": base_bytes / mb,
+            # Sem a base compartilhada, cada sessão recebe uma cópia do cache
+            "privado (MB)": 0.0 if data.SHARED else base_bytes / mb,
+        }
+    ]
+    for name, frame in frames.items():
+        usage = frame_memory(frame, base)
+        rows.append(
+            {
+                "objeto": name,
+                "total (MB)": usage["total"] / mb,
+                "privado (MB)": usage["privado"] / mb,
+            }
+        )
+    with st.sidebar.expander("Memória da sessão"):
+        st.dataframe(pd.DataFrame(rows).round(2), hide_index=True)
+        st.caption(f"Processo: {process_rss() / mb:.0f} MB residentes")
+
+
+@contextmanager
+def start_page_run(page: str):
+    """
+    Measures the stages of this page execution around the page body
+
+    The run is profiled when it was triggered by the profiling button of
+    ``stage_panel``, with the profiler selected there. It is finished (log
+    written, profiler stopped) even when the page raises or is interrupted
+    by a rerun; ``stage_panel`` finishes it earlier to show the results.
+
+    Yields:
+        Run: The run of this execution
+    """
+    profiler = None
+    if st.session_state.get("perfilar_execucao"):
+        profiler = st.session_state.get("perfilador", "cProfile")
+    run = start_run(page, profiler)
+    try:
+        yield run
+    finally:
+        finish_run(run)
+
+
+def stage_panel(run) -> None:
+    """
+    Sidebar panel with the stages measured in this execution
+
+    Finishes ``run`` (writing the JSON-lines log) and shows, when the run was
+    profiled, the profiler report.
+    """
+    finish_run(run)
+    table = run.frame()
+    with st.sidebar.expander("Etapas da execução"):
+        if len(table):
+            # Etapas internas recuadas sob a etapa que as contém
+            table["etapa"] = [
+                "\u2003" * n + e for n, e in zip(table["nivel"], table["etapa"])
+            ]
+            rows = ["linhas_entrada", "linhas_saida"]
+            table[rows] = table[rows].astype("Int64")
+            total = table.loc[table["nivel"] == 0, "parede_s"].sum()
+            st.dataframe(
+                table.drop(columns=["nivel", "erro"]).round(4),
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.caption(f"Total medido: {total:.3f} s")
+        st.selectbox("Perfilador", profilers(), key="perfilador")
+        st.button("Executar com perfilador", key="perfilar_execucao")
+        if run.profile:
+            st.code(run.profile, language=None)
+
+
+def warmup_status(warmup) -> None:
+    """
+    Sidebar note with the state of the background cache warm-up
+
+    Args:
+        warmup: ``lastmile.warmup.current()``; nothing is shown for ``None``
+    """
+    if warmup is None:
+        return
+    if warmup.state == warmup.WARMING:
+        st.sidebar.info(
+            f"Aquecendo caches ({warmup.done}/{warmup.total}): {warmup.step}. "
+            "As visões padrão ficam prontas em instantes."
+        )
+    elif warmup.state == warmup.READY:
+        st.sidebar.caption(f"Caches aquecidos em {warmup.elapsed:.1f} s")
+    else:
+        st.sidebar.warning(
+            f"Aquecimento dos caches falhou em {warmup.step}: {warmup.error}"
+        )
@@ -0,0 +1,92 @@
+import streamlit as st
+import pandas as pd
+
+from lastmile import warmup
+from lastmile.data import get_data, period_input
+from lastmile.lookup import (
+    build_lookup_index,
+    delivery_trail,
+    route_trail,
+    search_remessa,
+)
+from lastmile.instrument import stage
+from lastmile.widgets import (
+    apply_spec,
+    frame_key,
+    stage_panel,
+    start_page_run,
+    warmup_status,
+)
+
+st.set_page_config(
+    page_title="Last Mile - Renner",
+    page_icon="chart_with_upwards_trend",
+    layout="wide",
+)
+
+
+@st.cache_resource(show_spinner="Indexando remessas...", max_entries=4)
+def get_lookup_index(version: str, _df: pd.DataFrame) -> dict:
+    return build_lookup_index(_df["remessa"])
+
+
+with start_page_run("Rastreio") as run:
+    warmup_status(warmup.current())
+
+    st.title("Rastreio de Remessas")
+
+    st.markdown(
+        """Busque uma remessa pelo código completo (ex.: `11894-84230`), pelo início do código ou por qualquer trecho dele."""
+    )
+
+    # O índice precisa das linhas do período (consultadas no backend duckdb)
+    with stage("get_data") as s:
+        df = s.out(apply_spec(get_data(period=period_input()), ()))
+    with stage("índice de remessas", df):
+        index = get_lookup_index(frame_key(df), df)
+
+    modos = {
+        "Automático": "auto",
+        "Código exato": "exact",
+        "Prefixo": "prefix",
+        "Trecho": "substring",
+    }
+    left, right = st.columns((3, 1))
+    busca = left.text_input("Remessa")
+    modo = right.selectbox("Tipo de busca", list(modos))
+
+    if busca:
+        with stage("busca") as s:
+            rows = search_remessa(index, busca, modos[modo])
+            s.rows_out = len(rows)
+        st.write(f"**Remessas encontradas .......... {len(rows)}**")
+
+        limite = 500
+        if len(rows) > limite:
+            st.caption(f"Exibindo as {limite} primeiras.")
+        with stage("trilha das entregas", df) as s:
+            trail = s.out(delivery_trail(df, rows, limite))
+        st.dataframe(trail, use_container_width=True, hide_index=True)
+
+        # Trajeto completo da rota da remessa escolhida
+        if len(trail):
+            remessa = st.selectbox(
+                "Trajeto da rota da remessa", trail["remessa"].unique()
+            )
+            rota = trail.loc[trail["remessa"] == remessa, "codigo_rota"].iloc[0]
+            st.subheader(f"Rota {rota}")
+            with stage("trajeto da rota", df) as s:
+                trajeto = s.out(route_trail(df, rota))
+            st.dataframe(
+                trajeto.style.apply(
+                    lambda r: [
+                        "background-color: #ffcccc" if r["remessa"] == remessa else ""
+                    ]
+                    * len(r),
+                    axis=1,
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+    stage_panel(run)
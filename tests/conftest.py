@@ -0,0 +1,19 @@
+from pathlib import Path
+
+import pytest
+
+from lastmile.loader import read_csv
+
+CSV_PATH = Path(__file__).resolve().parents[1] / "data" / "dados_entregas_last_mile.csv"
+
+
+@pytest.fixture(scope="session")
+def csv_path():
+    """CSV shipped with the repository"""
+    return CSV_PATH
+
+
+@pytest.fixture(scope="session")
+def deliveries(csv_path):
+    """Typed dataframe of the CSV shipped with the repository"""
+    return read_csv(csv_path)
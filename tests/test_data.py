@@ -0,0 +1,17 @@
+import pandas as pd
+
+from lastmile import data
+from lastmile.compact import compact_deliveries, expand_deliveries
+
+
+def test_compact_mode_expands_once(monkeypatch, tmp_path, csv_path, deliveries):
+    monkeypatch.setattr(data, "COMPACT", True)
+    df = data.get_data(path=csv_path, root=tmp_path)
+    # Mesmo objeto nas chamadas seguintes: nada é expandido de novo
+    assert data.get_data(path=csv_path, root=tmp_path) is df
+
+    expected = expand_deliveries(compact_deliveries(deliveries))
+    pd.testing.assert_frame_equal(
+        df.reset_index(drop=True), expected.reset_index(drop=True)
+    )
+    assert df.attrs["version"]
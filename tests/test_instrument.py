@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+import pytest
+import streamlit as st
+
+from lastmile import instrument
+from lastmile.instrument import attach, current_run, finish_run, stage, start_run
+from lastmile.widgets import start_page_run
+
+
+@pytest.fixture
+def logged(monkeypatch):
+    runs = []
+    monkeypatch.setattr(instrument, "write_log", lambda run, path: runs.append(run))
+    return runs
+
+
+def test_finish_run_logs_once(logged):
+    run = start_run("teste")
+    with stage("etapa"):
+        pass
+    finish_run(run)
+    finish_run(run)
+    assert logged == [run]
+    assert current_run() is None
+
+
+def test_page_run_finishes_on_error(logged):
+    with pytest.raises(ZeroDivisionError):
+        with start_page_run("teste") as run:
+            with stage("divide"):
+                1 / 0
+    assert logged == [run]
+    assert current_run() is None
+    assert run.frame()["erro"].tolist() == ["ZeroDivisionError"]
+
+
+def test_page_run_stops_profiler(logged, monkeypatch):
+    # Execução disparada pelo botão "Executar com perfilador" e interrompida
+    monkeypatch.setitem(st.session_state, "perfilar_execucao", True)
+    with pytest.raises(RuntimeError):
+        with start_page_run("teste") as run:
+            raise RuntimeError("rerun")
+    assert logged == [run]
+    assert run.profile
+
+
+def test_open_stage_collects_other_threads(logged):
+    run = start_run("teste")
+    with stage("pagina"):
+        batch = run.open_stage("lote")
+        worker = threading.Thread(target=_worker, args=(run, batch))
+        worker.start()
+        worker.join()
+        with stage("depois do lote"):
+            pass
+    finish_run(run)
+    table = run.frame()
+    assert table["etapa"].tolist() == [
+        "pagina",
+        "lote",
+        "figura",
+        "agregação",
+        "depois do lote",
+    ]
+    assert table["nivel"].tolist() == [0, 1, 2, 3, 1]
+
+
+def _worker(run, parent):
+    with attach(run, parent):
+        with stage("figura"):
+            with stage("agregação"):
+                pass
+    assert current_run() is None
+
+
+def test_attach_restores_the_thread_stack(logged):
+    run = start_run("teste")
+    with stage("pagina"):
+        batch = run.open_stage("lote")
+        with attach(run, batch):
+            with stage("figura"):
+                pass
+        with stage("depois do lote"):
+            pass
+    finish_run(run)
+    assert run.frame()["nivel"].tolist() == [0, 1, 2, 1]
+
+
+@pytest.mark.skipif("LASTMILE_STAGE_LOG" in os.environ, reason="log ligado no ambiente")
+def test_log_is_opt_in():
+    assert instrument.LOG_PATH == ""
+
+
+def test_log_rotates_past_the_size_cap(tmp_path):
+    path = tmp_path / "etapas.jsonl"
+    for _ in range(40):
+        run = start_run("teste")
+        with stage("etapa"):
+            pass
+        finish_run(run, path="")
+        instrument.write_log(run, path, max_bytes=1000)
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == instrument.LOG_BACKUPS + 1
+    assert all(f.stat().st_size <= 1000 for f in files)
+    first = json.loads(path.read_text(encoding="utf-8").splitlines()[0])
+    assert first["pagina"] == "teste"
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lastmile.lookup import build_lookup_index, search_remessa
+
+REMESSAS = ["11894-84230", "11894-84231", "20001-00017", "31415-92653"]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return build_lookup_index(pd.Series(REMESSAS))
+
+
+@pytest.mark.parametrize(
+    "query, mode, expected",
+    [
+        ("11894-84230", "exact", [0]),
+        ("11894", "prefix", [0, 1]),
+        ("4230", "substring", [0]),
+        ("-0", "substring", [2]),
+        ("11894-8423", "auto", [0, 1]),
+        ("99999", "auto", []),
+        ("  ", "auto", []),
+    ],
+)
+def test_search_modes(index, query, mode, expected):
+    np.testing.assert_array_equal(search_remessa(index, query, mode), expected)
+
+
+@pytest.mark.parametrize("mode", ["auto", "exact", "prefix", "substring"])
+@pytest.mark.parametrize("query", ["ção", "11894-8423é", "ab"])
+def test_non_ascii_query_finds_nothing(index, query, mode):
+    rows = search_remessa(index, query, mode)
+    assert len(rows) == 0
+
+
+def test_unknown_mode(index):
+    with pytest.raises(ValueError):
+        search_remessa(index, "11894", "fuzzy")
+
+
+def test_substring_matches_plain_search():
+    rng = np.random.default_rng(0)
+    remessas = pd.Series(
+        [f"{a:05d}-{b:05d}" for a, b in rng.integers(0, 99999, (2000, 2))]
+    )
+    index = build_lookup_index(remessas)
+    for text in ["123", "-00", "4567", "99-1", "0"]:
+        expected = np.flatnonzero(remessas.str.contains(text, regex=False))
+        np.testing.assert_array_equal(
+            search_remessa(index, text, "substring"), expected
+        )
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lastmile import charts, cube, filters, routes
+from lastmile.correlation import CORRELATION_COLUMNS
+
+pl = pytest.importorskip("polars")
+
+from lastmile import polars_engine  # noqa: E402
+
+SPEC_LABELS = ["sem filtro", "cep", "período + distância", "remessa contém"]
+
+
+@pytest.fixture(scope="module")
+def frame(deliveries):
+    return polars_engine.from_pandas(deliveries)
+
+
+@pytest.fixture(scope="module", params=SPEC_LABELS)
+def spec(request, deliveries):
+    return polars_engine.sample_specs(deliveries)[request.param]
+
+
+@pytest.fixture(scope="module")
+def rows(deliveries, spec):
+    return deliveries[filters.compile_mask(deliveries, spec)]
+
+
+def test_load_matches_pandas(deliveries, csv_path):
+    assert deliveries.equals(polars_engine.load_deliveries(csv_path))
+
+
+def test_mask(deliveries, frame, spec):
+    np.testing.assert_array_equal(
+        filters.compile_mask(deliveries, spec),
+        polars_engine.compile_mask(frame, spec),
+    )
+
+
+def test_cube(frame, spec, rows):
+    pd.testing.assert_frame_equal(
+        cube.build_cube(rows),
+        polars_engine.build_cube(frame, spec),
+        check_categorical=False,
+        check_dtype=False,
+    )
+
+
+def test_heatmap(frame, spec, rows):
+    args = ("cep", "distancia_rota", "horas_entrega")
+    pd.testing.assert_frame_equal(
+        charts.heatmap_cells(rows, *args),
+        polars_engine.heatmap_cells(frame, *args, spec=spec),
+    )
+
+
+def test_route_quality(frame, spec, rows):
+    pd.testing.assert_frame_equal(
+        routes.route_quality(rows), polars_engine.route_quality(frame, spec)
+    )
+
+
+@pytest.mark.parametrize("method", ["pearson", "spearman"])
+def test_correlation(frame, spec, rows, method):
+    np.testing.assert_allclose(
+        rows[CORRELATION_COLUMNS].corr(method=method),
+        polars_engine.correlation(frame, spec, method),
+        atol=1e-12,
+    )
+
+
+def test_route_quality_of_long_routes():
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 300, 20)
+    n = sizes.sum()
+    df = pd.DataFrame(
+        {
+            "codigo_rota": pd.Categorical(np.repeat(np.arange(20), sizes).astype(str)),
+            "data_entrega": pd.Timestamp("2022-11-01")
+            + pd.to_timedelta(rng.integers(0, 600, n), unit="min"),
+            "sq_plan": rng.integers(1, 200, n),
+        }
+    )
+    frame = polars_engine.from_pandas(df)
+    pd.testing.assert_frame_equal(
+        routes.route_quality(df), polars_engine.route_quality(frame)
+    )
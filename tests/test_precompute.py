@@ -0,0 +1,18 @@
+import pandas as pd
+
+from lastmile import precompute, store
+
+
+def test_rows_without_route_day_go_to_the_manifest(deliveries, tmp_path, capsys):
+    df = deliveries.head(500).copy()
+    df.loc[df.index[:7], "rota_inicio"] = pd.NaT
+    root = tmp_path / "entregas"
+    store.write_partitions(df, root)
+
+    manifest = precompute.precompute(
+        root=root, target=tmp_path / "precalculado", workers=1
+    )
+    assert manifest["linhas_sem_dia"] == 7
+    assert manifest["linhas"] == len(df) - 7
+    # A biblioteca não escreve na saída do servidor
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from lastmile import quantiles
+
+
+@pytest.fixture(scope="module")
+def sketches(deliveries):
+    return quantiles.build_sketches(deliveries)
+
+
+@pytest.mark.parametrize("column", quantiles.SKETCH_COLUMNS)
+@pytest.mark.parametrize("by", quantiles.SKETCH_DIMENSIONS)
+def test_quantiles_within_relative_accuracy(deliveries, sketches, column, by):
+    df = deliveries.assign(dia=deliveries["data_entrega"].dt.normalize())
+    estimated = quantiles.quantiles(sketches, column, [by], quantiles.BOX_QUANTILES)
+    groups = df.dropna(subset=[column]).groupby(by, observed=True)[column]
+    assert len(estimated) == groups.ngroups
+    for key, values in groups:
+        for name, q in quantiles.BOX_QUANTILES.items():
+            exact = np.quantile(values.to_numpy(), q)
+            # Valores abaixo de MIN_VALUE contam como zero
+            slack = quantiles.RELATIVE_ACCURACY * abs(exact) + quantiles.MIN_VALUE
+            assert abs(estimated.loc[key, name] - exact) <= slack, (key, name)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lastmile import routes
+
+
+def _naive_quality(df):
+    """Pair by pair reference for ``route_quality``"""
+    out = []
+    ordered = df.assign(linha=np.arange(len(df))).dropna(subset=["codigo_rota"])
+    ordered = ordered.sort_values(["codigo_rota", "data_entrega", "linha"])
+    for code, route in ordered.groupby("codigo_rota", observed=True, sort=True):
+        sq = route["sq_plan"].to_numpy()
+        n = len(sq)
+        later = [(sq[i], sq[j]) for i in range(n) for j in range(i + 1, n)]
+        discordant = sum(a > b for a, b in later)
+        concordant = sum(a < b for a, b in later)
+        pairs = n * (n - 1) / 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            tau = np.float64(concordant - discordant) / np.sqrt(
+                (concordant + discordant) * pairs
+            )
+        planned = np.empty(n, dtype=np.int64)
+        planned[np.lexsort((np.arange(n), sq))] = np.arange(n)
+        out.append(
+            {
+                "codigo_rota": code,
+                "paradas": n,
+                "sequencia_planejada": bool(np.all(np.diff(sq) == 1)),
+                "inversoes": discordant,
+                "kendall_tau": tau,
+                "maior_deslocamento": np.abs(np.arange(n) - planned).max(),
+            }
+        )
+    return pd.DataFrame(out, columns=routes.QUALITY_COLUMNS)
+
+
+def _random_routes(seed, n_routes, max_stops):
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(1, max_stops + 1, n_routes)
+    n = sizes.sum()
+    when = pd.Timestamp("2022-11-01") + pd.to_timedelta(
+        rng.integers(0, 40, n), unit="min"
+    )
+    return pd.DataFrame(
+        {
+            "codigo_rota": np.repeat([f"R{k:03d}" for k in range(n_routes)], sizes),
+            "data_entrega": when,
+            # Poucos valores: empates de sq_plan e de horário
+            "sq_plan": rng.integers(1, 8, n),
+        }
+    ).sample(frac=1, random_state=seed)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("max_stops", [1, 3, 40])
+def test_route_quality_matches_pairwise_count(seed, max_stops):
+    df = _random_routes(seed, 30, max_stops)
+    result = routes.route_quality(df)
+    expected = _naive_quality(df)
+    result["codigo_rota"] = result["codigo_rota"].astype(str)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_route_quality_of_real_routes(deliveries):
+    sample = deliveries[
+        deliveries["codigo_rota"].isin(
+            deliveries["codigo_rota"].drop_duplicates().head(50)
+        )
+    ]
+    result = routes.route_quality(sample)
+    expected = _naive_quality(sample)
+    for df in (result, expected):
+        df["codigo_rota"] = df["codigo_rota"].astype(str)
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_route_quality_without_rows():
+    empty = _random_routes(0, 3, 2).iloc[:0]
+    assert routes.route_quality(empty).empty
+
+
+@pytest.mark.parametrize("kind", ["category", "object", "string"])
+def test_routes_of_any_dtype(deliveries, kind):
+    table, _ = routes.split_routes(deliveries)
+    sample = deliveries["codigo_rota"].drop_duplicates().iloc[[3, 1, 7, 7]]
+    # Categorias diferentes das da tabela de rotas
+    codigo_rota = pd.concat([sample, pd.Series([None])]).astype(kind)
+    found = routes.routes_of(table, codigo_rota)
+    assert sorted(found["codigo_rota"].astype(str)) == sorted(set(sample.astype(str)))
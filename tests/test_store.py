@@ -0,0 +1,33 @@
+import pytest
+
+from lastmile import store
+
+
+@pytest.fixture(scope="module")
+def root(deliveries, tmp_path_factory):
+    root = tmp_path_factory.mktemp("entregas")
+    store.write_partitions(deliveries, root)
+    return root
+
+
+def _dtype_names(df):
+    return {col: dtype.name for col, dtype in df.dtypes.items()}
+
+
+def test_window_matches_filtered_history(deliveries, root):
+    df = store.load_partitions(root, "2022-11-03", "2022-11-04")
+    day = deliveries["data_entrega"].dt.normalize()
+    expected = deliveries[day.between("2022-11-03", "2022-11-04")]
+    assert _dtype_names(df) == _dtype_names(deliveries)
+    assert sorted(df["remessa"].astype(str)) == sorted(expected["remessa"].astype(str))
+
+
+@pytest.mark.parametrize("columns", [None, ["data_entrega", "cep", "distancia"]])
+def test_empty_window_keeps_schema(deliveries, root, columns):
+    # 06/11/2022 é um domingo sem entregas
+    empty = store.load_partitions(root, "2022-11-06", "2022-11-06", columns=columns)
+    assert empty.empty
+    expected = deliveries if columns is None else deliveries[columns]
+    assert _dtype_names(empty) == _dtype_names(expected)
+    assert empty["data_entrega"].dt.date.empty
+    assert empty["cep"].cat.categories.empty
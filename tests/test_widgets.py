@@ -0,0 +1,23 @@
+from lastmile.widgets import frame_key, get_bitmap_index
+
+
+def _versioned(df, version="teste"):
+    df = df.copy()
+    df.attrs["version"] = version
+    return df
+
+
+def test_frame_key_tells_column_sets_apart(deliveries):
+    df = _versioned(deliveries)
+    assert frame_key(df) != frame_key(df.drop(columns="sq_plan"))
+    assert frame_key(df) != frame_key(df[df.columns[::-1]])
+    assert frame_key(df) == frame_key(_versioned(deliveries))
+    assert frame_key(deliveries.iloc[:0]) is None
+
+
+def test_caches_follow_the_columns(deliveries):
+    # Mesma versão e mesmo número de linhas, colunas diferentes
+    df = _versioned(deliveries, "colunas")
+    narrow = df[["codigo_rota", "data_entrega", "cep"]]
+    assert set(get_bitmap_index(narrow)) == {"cep", "codigo_rota"}
+    assert "transportadora" in get_bitmap_index(df)